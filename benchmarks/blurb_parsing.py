@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8
+"""
+How fast can we read a page of work blurbs?
+
+Builds synthetic reading history pages (20 blurbs each, tagged like a real
+one), parses them once, and then times turning them into reading history
+entries and (id, date) pairs, with ao3.blurbs and with the separate
+find()/find_all() calls per field that were used before it.  No requests are
+made.
+
+Run it from the root of the repo: ``python benchmarks/blurb_parsing.py``.
+"""
+
+import os
+import re
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+from ao3.users import parse_reading_history_page  # noqa: E402
+from ao3.utils import DATE_UPDATED, get_ids_and_dates_from_page  # noqa: E402
+
+PAGES = 50
+
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct"]
+
+
+def tags(cls, n):
+    return "".join(
+        f'<li class="{cls}">'
+        f'<a class="tag" href="/tags/{cls}{i}/works">{cls} {i}</a></li>'
+        for i in range(n)
+    )
+
+
+def required_tag(cls, title, text):
+    return (
+        f'<li><a><span class="{cls}" title="{title}">'
+        f'<span class="text">{text}</span></span></a></li>'
+    )
+
+
+def stat(cls, label, value):
+    return f'<dt class="{cls}">{label}:</dt><dd class="{cls}">{value}</dd>'
+
+
+def blurb(work_id):
+    month = MONTHS[work_id % len(MONTHS)]
+    return (
+        f'<li id="work_{work_id}" class="reading work blurb group" role="article">'
+        '<div class="header module">'
+        f'<h4 class="heading"><a href="/works/{work_id}">Title {work_id}</a> by '
+        '<a rel="author" href="/users/alice/pseuds/alice">alice</a></h4>'
+        '<h5 class="fandoms heading"><span class="landmark">Fandoms:</span> '
+        '<a class="tag" href="/tags/A/works">A</a>, '
+        '<a class="tag" href="/tags/B/works">B</a></h5>'
+        '<ul class="required-tags">'
+        + required_tag("rating-teen rating", "Teen And Up Audiences", "T")
+        + required_tag("warning-no warnings", "No Archive Warnings Apply", "W")
+        + required_tag("category-slash category", "M/M", "M")
+        + required_tag("complete-yes iswip", "Complete Work", "C")
+        + "</ul>"
+        f'<p class="datetime">{work_id % 28 + 1:02d} {month} 2020</p></div>'
+        '<ul class="tags commas">'
+        '<li class="warnings">'
+        '<strong><a class="tag">No Archive Warnings Apply</a></strong></li>'
+        + tags("relationships", 3)
+        + tags("characters", 6)
+        + tags("freeforms", 10)
+        + "</ul>"
+        '<blockquote class="userstuff summary">'
+        + "<p>A summary of the work, a sentence or two long.</p>" * 3
+        + "</blockquote>"
+        '<dl class="stats">'
+        + stat("language", "Language", "English")
+        + stat("words", "Words", "12,345")
+        + stat("chapters", "Chapters", f'<a href="/works/{work_id}/chapters/1">3</a>/5')
+        + stat("comments", "Comments", '<a href="#">12</a>')
+        + stat("kudos", "Kudos", '<a href="#">1,002</a>')
+        + stat("bookmarks", "Bookmarks", '<a href="#">99</a>')
+        + stat("hits", "Hits", "20,000")
+        + "</dl>"
+        '<div class="user module group"><h4 class="viewed heading">\n'
+        "<span>Last visited:</span> "
+        "07 Apr 2021 (Latest version.) Visited 3 times</h4></div></li>"
+    )
+
+
+def page(n):
+    lis = "".join(blurb(n * 20 + i) for i in range(20))
+    return f'<ol class="reading work index group">{lis}</ol>'
+
+
+# What User.reading_history() and get_ids_and_dates_from_page() did before
+# ao3.blurbs: a separate search of the <li> for each field.
+
+
+def legacy_entry(li_tag):
+    work_id = li_tag.attrs["id"].replace("work_", "")
+    h4_tag = li_tag.find("h4", attrs={"class": "viewed"})
+    date_str = re.search(r"[0-9]{1,2} [A-Z][a-z]+ [0-9]{4}", h4_tag.contents[2]).group(
+        0
+    )
+    date = datetime.strptime(date_str, "%d %b %Y").date()
+    if "Visited once" in h4_tag.contents[2]:
+        numvisits = "1"
+    else:
+        numvisits = re.search(r"Visited (\d*) times", h4_tag.contents[2]).group(1)
+    title = str(li_tag.find("h4", attrs={"class": "heading"}).find("a").contents[0])
+    author_tag = li_tag.find("h4", attrs={"class": "heading"})
+    author = [
+        str(x.contents[0]) for x in author_tag.find_all("a", attrs={"rel": "author"})
+    ]
+    fandom_tag = li_tag.find("h5", attrs={"class": "fandoms"})
+    fandom = [
+        str(x.contents[0]) for x in fandom_tag.find_all("a", attrs={"class": "tag"})
+    ]
+    lists = [
+        [
+            str(x.find("a").contents[0])
+            for x in li_tag.find_all("li", attrs={"class": cls})
+        ]
+        for cls in ("warnings", "relationships", "characters", "freeforms")
+    ]
+    chapters = li_tag.find("dd", attrs={"class", "chapters"})
+    if chapters.find("a") is not None:
+        chapters.find("a").replaceWithChildren()
+    chapters = "".join(chapters.contents)
+    hits = str(li_tag.find("dd", attrs={"class", "hits"}).contents[0])
+    words = str(li_tag.find("dd", attrs={"class", "words"}).contents[0])
+    stats = []
+    for cls in ("comments", "kudos", "bookmarks"):
+        tag = li_tag.find("dd", attrs={"class", cls})
+        stats.append(str(tag.contents[0].contents[0]) if tag is not None else "0")
+    pubdate_str = li_tag.find("p", attrs={"class", "datetime"}).contents[0]
+    pubdate = datetime.strptime(pubdate_str, "%d %b %Y").date()
+    return (
+        work_id,
+        date,
+        numvisits,
+        title,
+        author,
+        fandom,
+        *lists,
+        words,
+        chapters,
+        *stats,
+        hits,
+        pubdate,
+    )
+
+
+def legacy_ids_and_dates(soup):
+    list_tag = soup.find("ol", attrs={"class": "index"})
+    for li_tag in list_tag.findAll("li", attrs={"class": "blurb"}):
+        date = None
+        for div in li_tag.findAll("div", attrs={"class": "header"}):
+            for p in div.findAll("p", attrs={"class": "datetime"}):
+                date = datetime.strptime(p.text, "%d %b %Y")
+                break
+        for h4_tag in li_tag.findAll("h4", attrs={"class": "heading"}):
+            for link in h4_tag.findAll("a"):
+                if "works" in link.get("href"):
+                    yield "works", link.get("href").split("/works/")[-1], date
+
+
+def legacy_reading_history(soup):
+    ol_tag = soup.find("ol", attrs={"class": "reading"})
+    return [legacy_entry(li) for li in ol_tag.findAll("li", attrs={"class": "blurb"})]
+
+
+def timed(func, soups):
+    started = time.perf_counter()
+    rows = sum(len(list(func(soup))) for soup in soups)
+    return rows / (time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    html = [page(n) for n in range(PAGES)]
+
+    def soups():
+        return [BeautifulSoup(h, "html.parser") for h in html]
+
+    cases = [
+        (
+            "reading history",
+            legacy_reading_history,
+            lambda s: parse_reading_history_page(s)[0],
+        ),
+        (
+            "ids and dates",
+            legacy_ids_and_dates,
+            lambda s: get_ids_and_dates_from_page(s, DATE_UPDATED),
+        ),
+    ]
+    for name, before, after in cases:
+        # Fresh trees for each run: the old parser modifies them.
+        old_rate = timed(before, soups())
+        new_rate = timed(after, soups())
+        print(
+            f"{name:16} before: {old_rate:8.0f} rows/s   after: {new_rate:8.0f} rows/s"
+            f"   ({new_rate / old_rate:.1f}x)"
+        )
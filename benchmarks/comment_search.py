@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8
+"""
+How quickly can we search a big comment archive?
+
+Fills an ao3.commentstore.CommentStore with synthetic comments (a few
+thousand works, a few hundred users, threads of replies) and times storing
+them, then keyword, phrase and user queries against it, with grep-style
+scanning of the same comments for comparison.  No requests are made.
+
+Run it from the root of the repo: ``python benchmarks/comment_search.py``
+(or ``python benchmarks/comment_search.py 1000000`` for a million comments).
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from ao3.commentstore import CommentStore  # noqa: E402
+
+COMMENTS = 200000
+
+WORDS = (
+    "love this chapter so much the found family ending made me cry please "
+    "update soon amazing writing characters angst fluff slow burn perfect "
+    "cliffhanger can't wait for more thank you beautiful heartbreaking"
+).split()
+
+
+RARE_WORDS = [
+    "".join(random.Random(n).choice("abcdefghijklmnopqrstuvwxyz") for _ in range(7))
+    for n in range(20000)
+]
+
+
+class Comment(tuple):
+    comment_id = None
+    parent_id = None
+
+
+def comments(count, rng):
+    for n in range(count):
+        # Mostly a long tail of rarer words, as in real comments.
+        text = " ".join(
+            rng.choice(WORDS) if rng.random() < 0.2 else rng.choice(RARE_WORDS)
+            for _ in range(rng.randint(5, 40))
+        )
+        if n % 50000 == 7:
+            text += " zanzibar"
+        comment = Comment(
+            (
+                str(rng.randint(1, 5000)),
+                f"user{rng.randint(1, 500)}",
+                False,
+                n % 3 == 0,
+                f"{rng.randint(1, 28)} Jan {rng.randint(2010, 2024)} 10:15PM",
+                "UTC",
+                f"on Chapter {rng.randint(1, 30)}",
+                f"<p>{text}</p>",
+            )
+        )
+        comment.comment_id = n + 1
+        comment.parent_id = None if n % 3 == 0 else n - (n % 3) + 1
+        yield comment
+
+
+def timed(func, repeat=20):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - started) / repeat * 1000, result
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else COMMENTS
+    rng = random.Random(1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = CommentStore(os.path.join(tmp, "comments.sqlite"))
+        started = time.perf_counter()
+        store.put_many(comments(count, rng), batch_size=5000)
+        store.optimize()
+        elapsed = time.perf_counter() - started
+        print(f"stored {count} comments in {elapsed:.1f}s ({count / elapsed:.0f}/s)")
+
+        texts = [c[7] for c in comments(count, random.Random(1))]
+        cases = [
+            ("rare keyword", lambda: store.search("zanzibar"), "zanzibar"),
+            (
+                "phrase, top 100",
+                lambda: store.search('"found family"', limit=100),
+                "found family",
+            ),
+            ("user's comments", lambda: store.comments(user="user42"), None),
+            (
+                "keyword + user",
+                lambda: store.search("cliffhanger", user="user42"),
+                None,
+            ),
+        ]
+        for name, query, needle in cases:
+            ms, result = timed(query)
+            line = f"{name:16} {ms:8.2f} ms  ({len(result)} results)"
+            if needle is not None:
+                scan_ms, _ = timed(lambda: [t for t in texts if needle in t], 3)
+                line += f"   scanning: {scan_ms:8.1f} ms"
+            print(line)
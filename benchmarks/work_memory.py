@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8
+"""
+How much memory does a Work hold on to?
+
+Builds Works from a synthetic work page (a 20,000 word chapter and 2,000
+kudos, about the size of a real one), with and without ``retain``, and
+reports the memory each one keeps alive.  No requests are made.
+
+Run it from the root of the repo: ``python benchmarks/work_memory.py``.
+"""
+
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from ao3.works import Work  # noqa: E402
+
+WORKS = 10
+
+TAGS = "".join(
+    f'<dd class="{name} tags"><ul class="commas">'
+    + "".join(f'<li><a class="tag" href="#">{name} {i}</a></li>' for i in range(8))
+    + "</ul></dd>"
+    for name in [
+        "rating",
+        "warning",
+        "category",
+        "fandom",
+        "relationship",
+        "character",
+        "freeform",
+    ]
+)
+
+STATS = (
+    "".join(
+        f'<dd class="{name}">{value}</dd>'
+        for name, value in [
+            ("published", "2020-01-01"),
+            ("status", "2020-02-01"),
+            ("words", "20000"),
+            ("comments", "100"),
+            ("kudos", "2000"),
+            ("hits", "30000"),
+        ]
+    )
+    + '<dd class="bookmarks"><a href="#">300</a></dd>'
+)
+
+PAGE = (
+    "<html><body>"
+    f'<dl class="work meta group">{TAGS}<dd class="language">English</dd>{STATS}</dl>'
+    '<h2 class="title heading">A Title</h2>'
+    '<h3 class="byline heading"><a rel="author" href="/users/alice">alice</a></h3>'
+    '<div class="summary module"><blockquote class="userstuff"><p>A summary.</p>'
+    "</blockquote></div>"
+    '<div id="chapters"><div class="userstuff">'
+    + "".join(f"<p>{'word ' * 100}<em>and</em> more.</p>" for _ in range(200))
+    + "</div></div>"
+    '<div id="kudos"><p class="kudos">'
+    + "".join(f'<a href="/users/user{i}">user{i}</a> ' for i in range(2000))
+    + "</p></div></body></html>"
+)
+
+
+def measure(retain):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    works = [Work.from_html(str(i), PAGE, retain=retain) for i in range(WORKS)]
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(works) == WORKS
+    return (after - before) / WORKS
+
+
+if __name__ == "__main__":
+    print(f"Work page: {len(PAGE) / 1024:.0f} KiB of HTML")
+    retained = measure(retain=True)
+    compact = measure(retain=False)
+    print(f"retain=True:  {retained / 1024:10.1f} KiB per Work")
+    print(f"retain=False: {compact / 1024:10.1f} KiB per Work")
+    print(f"{retained / compact:.0f}x smaller")
@@ -45,4 +45,9 @@ setup(
         "cloudscraper @ git+https://github.com/VeNoMouS/cloudscraper.git@3.0.0",
         "requests>=2.12.4, <3",
     ],
+    extras_require={
+        "stats": ["numpy>=1.17"],
+        "arrow": ["numpy>=1.17", "pyarrow>=4"],
+        "http2": ["httpx[http2]>=0.23"],
+    },
 )
@@ -1,25 +1,100 @@
 # -*- encoding: utf-8
 from urllib.parse import urlparse
 
-import cloudscraper
-import requests
-
 from . import utils
-from .collections import Collection
-from .comments import Comments
-from .series import Series
-from .users import User
-from .works import Work
+from .clearance import ClearanceStore
+from .retry import DEFAULT_RETRY_POLICY
+from .session import DEFAULT_POOL_CONNECTIONS, DEFAULT_POOL_MAXSIZE, Session
 
+# The classes below pull in BeautifulSoup (and, through the session,
+# cloudscraper and requests), which together take longer to import than
+# everything else here.  They're loaded the first time they're used, so
+# scripts that only need ao3.utils start quickly.
+_LAZY_CLASSES = {
+    "Collection": "collections",
+    "Comments": "comments",
+    "Series": "series",
+    "Tag": "tags",
+    "User": "users",
+    "Work": "works",
+}
 
-class AO3(object):
-    """A scraper for the Archive of Our Own (AO3)."""
 
-    def __init__(self, ao3_url=utils.BASE_URL):
+def __getattr__(name):
+    if name in _LAZY_CLASSES:
+        import importlib
+
+        module = importlib.import_module(f".{_LAZY_CLASSES[name]}", __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class AO3(object):
+    """A scraper for the Archive of Our Own (AO3).
+
+    Every object you get from an AO3 instance shares its Session, and so its
+    connection pool.  ``pool_connections`` and ``pool_maxsize`` are passed
+    through to the Session; raise ``pool_maxsize`` if you fetch from
+    several threads at once.
+
+    If ``clearance_path`` is given, Cloudflare clearance is saved there and
+    reused by later AO3 instances (including ones in other processes), so
+    short-lived scripts don't have to solve a new challenge every time.
+    ao3.clearance.DEFAULT_CLEARANCE_PATH is a reasonable place to keep it.
+
+    ``retry_policy`` (see ao3.retry) controls how requests that AO3 turns
+    away are retried.
+
+    If a ``scheduler`` (see ao3.scheduler) is given, all requests go through
+    it, so that lookups like work() aren't held up by long crawls.
+    Otherwise, requests start at most once every ``request_interval``
+    seconds.
+
+    Pass an AdaptiveLimiter (see ao3.adaptive) as ``limiter`` to have the
+    request rate and concurrency follow how AO3 is coping, instead.
+
+    Requests are sent with a cloudscraper session, unless you pass another
+    ``transport`` (see ao3.transport), e.g. an HttpxTransport to send
+    concurrent requests over one HTTP/2 connection.
+    """
+
+    def __init__(
+        self,
+        ao3_url=utils.BASE_URL,
+        pool_connections=DEFAULT_POOL_CONNECTIONS,
+        pool_maxsize=DEFAULT_POOL_MAXSIZE,
+        clearance_path=None,
+        retry_policy=DEFAULT_RETRY_POLICY,
+        scheduler=None,
+        request_interval=utils.DEFAULT_REQUEST_INTERVAL,
+        transport=None,
+        limiter=None,
+    ):
         self.user = None
-        self.session = cloudscraper.create_scraper()
         self.ao3_url = ao3_url
 
+        if clearance_path is not None:
+            self.clearance_store = ClearanceStore(clearance_path)
+        else:
+            self.clearance_store = None
+
+        self.session = Session(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            retry_policy=retry_policy,
+            scheduler=scheduler,
+            request_interval=request_interval,
+            clearance_store=self.clearance_store,
+            transport=transport,
+            limiter=limiter,
+        )
+        self._load_clearance()
+
+    def _load_clearance(self):
+        if self.clearance_store is not None:
+            ao3_domain = urlparse(self.ao3_url).hostname
+            self.clearance_store.load(self.session, ao3_domain)
+
     def login(self, username, cookie):
         """Log in to the archive.
         This allows you to access pages that are only available while
@@ -36,30 +111,68 @@ class AO3(object):
         This option is given as a workaround for Cloudflare issues that
         are currently occurring on https://archiveofourown.org.
         """
-        session = cloudscraper.create_scraper()
-
-        jar = requests.cookies.RequestsCookieJar()
         ao3_domain = urlparse(self.ao3_url).netloc
-        # must be done separately bc the set func returns a cookie, not a jar
-        jar.set("_otwarchive_session", cookie, domain=ao3_domain)
+        # Reuse the existing session (and its open connections) rather than
+        # starting a new one; we only need to add the login cookies.
+        self.session.cookies.set("_otwarchive_session", cookie, domain=ao3_domain)
         # AO3 requires this cookie to be set
-        jar.set("user_credentials", "1", domain=ao3_domain)
-        session.cookies = jar
+        self.session.cookies.set("user_credentials", "1", domain=ao3_domain)
+        # Don't hand out pages fetched before we were logged in.
+        self.session.single_flight.clear()
+        # Another process may have refreshed the clearance since we started.
+        self._load_clearance()
 
-        self.session = session
-        self.user = User(username, session, self.ao3_url)
+        from .users import User
+
+        self.user = User(username, self.session, self.ao3_url)
 
     def __repr__(self):
         return f"{type(self).__name__}()"
 
-    def work(self, id):
+    def work(self, id, retain=False):
         """Look up a work that's been posted to AO3.
         :param id: the work ID.  In the URL to a work, this is the number.
             e.g. the work ID of https://archiveofourown.org/works/1234 is 1234.
+        :param retain: keep the work's HTML and parse tree; see Work.
         """
-        return Work(id=id, sess=self.session, ao3_url=self.ao3_url)
+        from .works import Work
+
+        return Work(id=id, sess=self.session, ao3_url=self.ao3_url, retain=retain)
+
+    def pipeline(self, processes=None, max_in_flight=None):
+        """Returns a ParsePipeline, for crawls that parse pages in several
+        processes at once.  See ao3.pipeline.
+        """
+        from .pipeline import ParsePipeline
+
+        return ParsePipeline(
+            self.session,
+            self.ao3_url,
+            processes=processes,
+            max_in_flight=max_in_flight,
+        )
+
+    def download_many(self, ids, fmt, dest, workers=2, verify=False):
+        """Download many works in one of AO3's download formats into the
+        directory ``dest``.  Generates (work ID, ao3.downloads.Download, or
+        the exception if that work couldn't be downloaded).  See
+        ao3.downloads.download_many.
+        """
+        from .downloads import download_many
+
+        return download_many(
+            self.session,
+            ids,
+            fmt,
+            dest,
+            self.ao3_url,
+            workers=workers,
+            verify=verify,
+        )
 
     def comments(self, id):
+        from .comments import Comments
+
         return Comments(id=id, sess=self.session, ao3_url=self.ao3_url)
 
     def series(self, id):
@@ -68,6 +181,8 @@ class AO3(object):
         :param id: the series ID. In the url to a series, this is the number.
            e.g. the series ID of https://archiveofourown.org/series/1234 is 1234.
         """
+        from .series import Series
+
         return Series(id=id, session=self.session, ao3_url=self.ao3_url)
 
     def collection(self, id):
@@ -76,8 +191,41 @@ class AO3(object):
         :param id: the collection ID, e.g. example_collection in the url
            https://archiveofourown.org/collection/example_collection.
         """
+        from .collections import Collection
+
         return Collection(id=id, session=self.session, ao3_url=self.ao3_url)
 
+    def search(self, max_count=None, **filters):
+        """Search for works, and generate a SearchResult (work_id, updated) for
+        each match.  AO3 does the filtering, so each request returns 20 matches.
+
+        The filters are the arguments of ao3.search.search_url(), e.g.
+
+            >>> api.search(fandoms=["Star Wars"], words=(50000, None), complete=True)
+
+        """
+        from .search import search
+
+        return search(self.session, self.ao3_url, max_count=max_count, **filters)
+
+    def tag(self, name):
+        """Look up an AO3 tag, e.g. a fandom or character.
+
+        :param name: the tag's name, exactly as it appears on AO3.
+        """
+        from .tags import Tag
+
+        return Tag(name=name, session=self.session, ao3_url=self.ao3_url)
+
+    def poll_tags(self, names, state):
+        """Generate (tag name, FeedEntry) for each work that's new in the feeds
+        of the given tags since they were last polled with ``state``
+        (an ao3.tags.FeedState).
+        """
+        from .tags import poll_tags
+
+        return poll_tags(names, self.session, state, self.ao3_url)
+
     def author(self, username):
         """Look up an AO3 author by username. This method is called 'author' to avoid
         confusion with the logged-in user (self.user).
@@ -85,4 +233,6 @@ class AO3(object):
         :param username: the author's username, e.g. example_user in the url
             https://archiveofourown.org/users/example_user.
         """
+        from .users import User
+
         return User(username=username, session=self.session, ao3_url=self.ao3_url)
@@ -0,0 +1,227 @@
+# -*- encoding: utf-8
+"""Finding out how fast AO3 is willing to go, rather than guessing.
+
+A fixed ``request_interval`` is either slower than it needs to be when AO3
+is quiet, or too fast when it's busy, and then every request comes back as a
+503 or a "Retry later" page.  An AdaptiveLimiter adjusts the request rate,
+and how many requests may be in flight at once, the way TCP adjusts its
+window (AIMD):
+
+* while responses come back promptly and successfully, it goes a little
+  faster: after each window of successful requests (as many as may be in
+  flight), the rate goes up by ``rate_step`` and the concurrency by one;
+* on a 429, 503, 525 or other overload error, a "Retry later" page, a
+  connection error, or when responses start taking much longer than usual,
+  both are cut by ``decrease`` (halved, by default), at most once every
+  ``cooldown`` seconds, so a burst of errors from requests that were
+  already in flight only counts once.
+
+Use one by passing it to AO3 (and to your Scheduler, if you use one):
+
+    >>> limiter = AdaptiveLimiter()
+    >>> api = AO3(limiter=limiter)
+    >>> ...
+    >>> limiter.metrics()
+    {'rate': 0.45, 'interval': 2.22, 'concurrency': 3, 'in_flight': 2, ...}
+"""
+
+import threading
+import time
+
+from .retry import is_retry_later
+from .utils import DEFAULT_REQUEST_INTERVAL, RateLimiter
+
+# Statuses that mean AO3 (or Cloudflare in front of it) is overloaded, as
+# opposed to, say, a 404 for a deleted work.
+OVERLOAD_STATUSES = frozenset([429, 502, 503, 504, 520, 521, 522, 523, 524, 525])
+
+
+class AdaptiveLimiter(RateLimiter):
+    """A RateLimiter whose rate, and limit on requests in flight, follow how
+    AO3 is coping.
+
+    :param rate: requests per second to start at.
+    :param min_rate, max_rate: the range the rate is kept in.
+    :param rate_step: how much the rate goes up after each window of
+        successful requests.
+    :param concurrency: how many requests may be in flight to start with.
+    :param min_concurrency, max_concurrency: the range that's kept in.
+    :param decrease: what the rate and concurrency are multiplied by when
+        AO3 is struggling.
+    :param latency_factor: responses count as slow when their recent average
+        latency is this many times the long-run average.
+    :param cooldown: the least number of seconds between two cuts.
+    """
+
+    def __init__(
+        self,
+        rate=1 / DEFAULT_REQUEST_INTERVAL,
+        min_rate=0.05,
+        max_rate=2.0,
+        rate_step=0.05,
+        concurrency=1,
+        min_concurrency=1,
+        max_concurrency=8,
+        decrease=0.5,
+        latency_factor=2.0,
+        cooldown=10,
+    ):
+        super(AdaptiveLimiter, self).__init__(1 / rate)
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate_step = rate_step
+        self.concurrency = concurrency
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.cooldown = cooldown
+
+        self._slots = threading.Condition()
+        self._in_flight = 0
+        self._successes = 0
+        self._last_cut = None
+
+        # Fast- and slow-moving averages of the latency of good responses.
+        self._latency = None
+        self._baseline = None
+        self._samples = 0
+
+        self._counts = {"requests": 0, "errors": 0, "increases": 0, "decreases": 0}
+
+    def __repr__(self):
+        return (
+            f"{type(self).__name__}(rate={self.rate:.3g}, "
+            f"concurrency={self.concurrency!r})"
+        )
+
+    @property
+    def interval(self):
+        return 1 / self.rate
+
+    @interval.setter
+    def interval(self, value):
+        # Set by RateLimiter.__init__; the rate is what we keep.
+        self.rate = 1 / value
+
+    def call(self, func, stream=False):
+        """Call ``func()`` (which sends a request and returns the response)
+        once there's room for another request in flight, and learn from how
+        it goes.
+
+        A ``stream``ed response is still in flight while its body is being
+        read, so it keeps its place until ``response.close()`` is called.
+        """
+        with self._slots:
+            while self._in_flight >= self.concurrency:
+                self._slots.wait()
+            self._in_flight += 1
+
+        started = time.monotonic()
+        try:
+            response = func()
+        except Exception:
+            self._release()
+            self.record(time.monotonic() - started, error=True)
+            raise
+
+        if stream:
+            self._release_on_close(response)
+        else:
+            self._release()
+        self.record(time.monotonic() - started, response)
+        return response
+
+    def _release(self):
+        with self._slots:
+            self._in_flight -= 1
+            self._slots.notify()
+
+    def _release_on_close(self, response):
+        close = response.close
+        released = []
+
+        def close_and_release():
+            try:
+                close()
+            finally:
+                # Closing twice mustn't free two places.
+                if not released:
+                    released.append(True)
+                    self._release()
+
+        response.close = close_and_release
+
+    def _is_overloaded(self, response):
+        return response.status_code in OVERLOAD_STATUSES or is_retry_later(response)
+
+    def _is_slow(self, latency):
+        if self._latency is None:
+            self._latency = self._baseline = latency
+        else:
+            self._latency += 0.2 * (latency - self._latency)
+            self._baseline += 0.02 * (latency - self._baseline)
+        self._samples += 1
+        # Give the long-run average a few samples to settle first.
+        return (
+            self._samples >= 10 and self._latency > self.latency_factor * self._baseline
+        )
+
+    def record(self, latency, response=None, error=False):
+        """Adjust the limits for one request that took ``latency`` seconds,
+        and either got ``response`` or failed with an error.
+        """
+        with self._slots:
+            self._counts["requests"] += 1
+            if error or self._is_overloaded(response):
+                self._counts["errors"] += 1
+                self._cut()
+            elif self._is_slow(latency):
+                self._cut()
+            else:
+                self._successes += 1
+                if self._successes >= self.concurrency:
+                    self._successes = 0
+                    self._raise()
+            # A bigger limit may let waiting requests through.
+            self._slots.notify_all()
+
+    def _raise(self):
+        rate = min(self.max_rate, self.rate + self.rate_step)
+        concurrency = min(self.max_concurrency, self.concurrency + 1)
+        if (rate, concurrency) != (self.rate, self.concurrency):
+            self.rate = rate
+            self.concurrency = concurrency
+            self._counts["increases"] += 1
+
+    def _cut(self):
+        now = time.monotonic()
+        if self._last_cut is not None and now - self._last_cut < self.cooldown:
+            return
+        self._last_cut = now
+        self._successes = 0
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        self.concurrency = max(
+            self.min_concurrency, int(self.concurrency * self.decrease)
+        )
+        self._counts["decreases"] += 1
+
+    def metrics(self):
+        """Returns a dict of the current limits and what they're based on.
+
+        ``rate`` is in requests per second, and ``interval`` is the seconds
+        between requests that works out to.  ``latency`` and
+        ``latency_baseline`` are the recent and long-run average response
+        times.  ``increases`` and ``decreases`` count the adjustments made.
+        """
+        with self._slots:
+            return dict(
+                rate=self.rate,
+                interval=self.interval,
+                concurrency=self.concurrency,
+                in_flight=self._in_flight,
+                latency=self._latency,
+                latency_baseline=self._baseline,
+                **self._counts,
+            )
@@ -0,0 +1,365 @@
+# -*- encoding: utf-8
+"""Reading work blurbs: the summaries of works on listing pages.
+
+Bookmarks, reading history, a user's works, series, collections and search
+results all list works as blurbs of the same shape:
+
+    <li id="work_12345" class="work blurb group" role="article">
+      <div class="header module">
+        <h4 class="heading">
+          <a href="/works/12345">[title]</a> by
+          <a rel="author" href="/users/[author]/pseuds/[author]">[author]</a>
+        </h4>
+        <h5 class="fandoms heading">
+          <span class="landmark">Fandoms:</span>
+          <a class="tag" href="/tags/[fandom]/works">[fandom]</a>
+        </h5>
+        <ul class="required-tags">
+          <li><a ...><span class="rating-teen rating"
+                           title="Teen And Up Audiences">...</span></a></li>
+          <li><a ...><span class="category-slash category"
+                           title="M/M">...</span></a></li>
+          <li><a ...><span class="complete-yes iswip"
+                           title="Complete Work">...</span></a></li>
+          ...
+        </ul>
+        <p class="datetime">24 Dec 2012</p>
+      </div>
+      <ul class="tags commas">
+        <li class="warnings"><strong><a class="tag">[warning]</a></strong></li>
+        <li class="relationships"><a class="tag">[relationship]</a></li>
+        <li class="characters"><a class="tag">[character]</a></li>
+        <li class="freeforms"><a class="tag">[tag]</a></li>
+      </ul>
+      <blockquote class="userstuff summary">[summary]</blockquote>
+      <dl class="stats">
+        <dt class="words">Words:</dt> <dd class="words">1,234</dd>
+        <dt class="chapters">Chapters:</dt>
+        <dd class="chapters"><a href="...">3</a>/5</dd>
+        <dt class="kudos">Kudos:</dt> <dd class="kudos"><a href="...">56</a></dd>
+        ...
+      </dl>
+      <div class="user module group">
+        <!-- on bookmarks, the date it was bookmarked -->
+        <p class="datetime">01 Jan 2020</p>
+        <!-- on the reading history, when it was last visited -->
+        <h4 class="viewed heading">
+          <span>Last visited:</span> 24 Dec 2012 (Latest version.) Visited 3 times
+        </h4>
+      </div>
+    </li>
+
+parse_blurb() reads all of that in one walk over the <li>, rather than
+searching it again for each field, and never modifies the tree.  Dates go
+through parse_date(), which remembers the ones it's seen: a page of 20
+blurbs only has a handful of distinct dates.
+"""
+
+import functools
+import re
+from datetime import datetime
+
+MONTHS = {
+    "Jan": 1,
+    "Feb": 2,
+    "Mar": 3,
+    "Apr": 4,
+    "May": 5,
+    "Jun": 6,
+    "Jul": 7,
+    "Aug": 8,
+    "Sep": 9,
+    "Oct": 10,
+    "Nov": 11,
+    "Dec": 12,
+}
+
+STAT_FIELDS = ("words", "comments", "kudos", "bookmarks", "hits")
+TAG_LISTS = ("warnings", "relationships", "characters", "freeforms")
+
+VIEWED_DATE_REGEX = re.compile(r"[0-9]{1,2} [A-Z][a-z]+ [0-9]{4}")
+VISITS_REGEX = re.compile(r"Visited (\d+) times")
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_date(text):
+    """Parse one of AO3's dates, e.g. "24 Dec 2012", as a datetime.
+
+    Does the same as datetime.strptime(text, "%d %b %Y"), several times
+    faster, and faster again for a date it's seen before.
+    """
+    try:
+        day, month, year = text.split()
+        return datetime(int(year), MONTHS[month], int(day))
+    except (KeyError, ValueError):
+        raise ValueError(f"Unrecognised AO3 date {text!r}") from None
+
+
+def _stat(text):
+    text = text.replace(",", "").strip()
+    return int(text) if text.isdigit() else 0
+
+
+class Blurb(object):
+    """Everything in one work (or series) blurb.
+
+    ``updated`` is the date in the blurb's header (when the work was last
+    updated), and ``user_date`` the date in its user section: when it was
+    bookmarked, or last visited.  Dates are datetimes, and the stats are
+    ints.  ``chapters`` is as AO3 shows it, e.g. "3/5" or "3/?".  A series
+    blurb has the number of works in the series as ``works``.
+
+    A deleted work's blurb has ``deleted`` set, and a locked one (one you'd
+    need to log in to see) has ``mystery`` set; the other fields are empty.
+    """
+
+    __slots__ = (
+        (
+            "work_id",
+            "series_id",
+            "title",
+            "authors",
+            "fandoms",
+            "rating",
+            "categories",
+            "complete",
+            "updated",
+            "user_date",
+            "visits",
+            "language",
+            "chapters",
+            "works",
+            "deleted",
+            "mystery",
+        )
+        + TAG_LISTS
+        + STAT_FIELDS
+    )
+
+    def __init__(self):
+        self.work_id = None
+        self.series_id = None
+        self.title = None
+        self.authors = []
+        self.fandoms = []
+        self.rating = None
+        self.categories = []
+        self.complete = None
+        self.updated = None
+        self.user_date = None
+        self.visits = None
+        self.language = None
+        self.chapters = None
+        self.works = None
+        self.deleted = False
+        self.mystery = False
+        for name in TAG_LISTS:
+            setattr(self, name, [])
+        for name in STAT_FIELDS:
+            setattr(self, name, 0)
+
+    def __repr__(self):
+        return (
+            f"{type(self).__name__}(work_id={self.work_id!r}, "
+            f"series_id={self.series_id!r}, title={self.title!r})"
+        )
+
+    @property
+    def posted_chapters(self):
+        """How many chapters have been posted, or None if we don't know."""
+        if self.chapters is None:
+            return None
+        return _stat(self.chapters.split("/")[0])
+
+    @property
+    def tags(self):
+        """All the tags on the work: its fandoms, rating, warnings,
+        relationships, characters and additional tags.
+        """
+        tags = list(self.fandoms)
+        if self.rating:
+            tags.append(self.rating)
+        for name in TAG_LISTS:
+            tags.extend(getattr(self, name))
+        return tags
+
+
+def _text(tag):
+    """The text in a tag; quicker than get_text() for the usual case of a
+    tag with a single string or a single link in it.
+    """
+    contents = tag.contents
+    if len(contents) == 1:
+        child = contents[0]
+        if child.name is None:
+            return child.strip()
+        if len(child.contents) == 1 and child.contents[0].name is None:
+            return child.contents[0].strip()
+    return tag.get_text().strip()
+
+
+def _links(tag):
+    return [child for child in tag.children if child.name == "a"]
+
+
+def _read_heading(h4_tag, blurb):
+    for a_tag in _links(h4_tag):
+        href = a_tag.get("href") or ""
+        if "author" in (a_tag.get("rel") or ()):
+            blurb.authors.append(_text(a_tag))
+        elif "/works/" in href and "external_works" not in href:
+            # Links on collection pages are /collections/[name]/works/[id]
+            if blurb.work_id is None:
+                blurb.work_id = href.split("/works/")[-1]
+                blurb.title = _text(a_tag)
+        elif "/series/" in href:
+            if blurb.series_id is None:
+                blurb.series_id = href.replace("/series/", "")
+                blurb.title = _text(a_tag)
+
+
+def _read_viewed(h4_tag, blurb):
+    text = h4_tag.get_text()
+    match = VIEWED_DATE_REGEX.search(text)
+    if match:
+        blurb.user_date = parse_date(match.group(0))
+    if "Visited once" in text:
+        blurb.visits = 1
+    else:
+        match = VISITS_REGEX.search(text)
+        if match:
+            blurb.visits = int(match.group(1))
+
+
+# Each of the functions below reads one kind of tag in a blurb, and returns
+# False if it's not one we want, so that _walk() looks inside it instead.
+
+
+def _read_h4(tag, classes, blurb, in_user):
+    if "viewed" in classes:
+        _read_viewed(tag, blurb)
+    elif "heading" in classes:
+        _read_heading(tag, blurb)
+    return True
+
+
+def _read_h5(tag, classes, blurb, in_user):
+    if "fandoms" not in classes:
+        return False
+    blurb.fandoms.extend(_text(a_tag) for a_tag in _links(tag))
+    return True
+
+
+def _read_span(tag, classes, blurb, in_user):
+    if "rating" in classes:
+        blurb.rating = tag.get("title")
+    elif "category" in classes:
+        title = tag.get("title") or ""
+        blurb.categories = [c for c in title.split(", ") if c]
+    elif "iswip" in classes:
+        blurb.complete = "complete-yes" in classes
+    else:
+        return False
+    return True
+
+
+def _read_li(tag, classes, blurb, in_user):
+    if not classes or classes[0] not in TAG_LISTS:
+        return False
+    getattr(blurb, classes[0]).append(_text(tag))
+    return True
+
+
+def _read_p(tag, classes, blurb, in_user):
+    if "datetime" not in classes:
+        return False
+    date = parse_date(_text(tag))
+    if in_user:
+        blurb.user_date = date
+    else:
+        blurb.updated = date
+    return True
+
+
+def _read_dd(tag, classes, blurb, in_user):
+    field = classes[0] if classes else None
+    if field in STAT_FIELDS:
+        setattr(blurb, field, _stat(_text(tag)))
+    elif field == "chapters":
+        blurb.chapters = tag.get_text().strip()
+    elif field == "works":
+        blurb.works = _stat(_text(tag))
+    elif field == "language":
+        blurb.language = _text(tag)
+    return True
+
+
+def _skip(tag, classes, blurb, in_user):
+    # e.g. the summary; there's nothing we want in it.
+    return True
+
+
+def _read_div(tag, classes, blurb, in_user):
+    if "mystery" not in classes:
+        return False
+    blurb.mystery = True
+    return True
+
+
+_READERS = {
+    "h4": _read_h4,
+    "h5": _read_h5,
+    "span": _read_span,
+    "li": _read_li,
+    "p": _read_p,
+    "dd": _read_dd,
+    "blockquote": _skip,
+    "div": _read_div,
+}
+
+
+def _walk(tag, blurb, in_user):
+    for child in tag.children:
+        name = child.name
+        if name is None:
+            # A string between tags.
+            continue
+        classes = child.get("class") or ()
+
+        read = _READERS.get(name)
+        if read is None or not read(child, classes, blurb, in_user):
+            _walk(child, blurb, in_user or (name == "div" and "user" in classes))
+
+
+def parse_blurb(li_tag):
+    """Returns a Blurb with everything in a blurb's <li>."""
+    blurb = Blurb()
+    classes = li_tag.get("class") or ()
+    if "deleted" in classes:
+        blurb.deleted = True
+        return blurb
+
+    _walk(li_tag, blurb, in_user=False)
+
+    # Works in a reading history or a user's works are also identified by
+    # the <li>: <li id="work_12345" ...>.  A locked work's title isn't
+    # shown, so it stays unidentified.
+    li_id = li_tag.get("id") or ""
+    if blurb.work_id is None and not blurb.mystery and li_id.startswith("work_"):
+        blurb.work_id = li_id[len("work_") :]
+    return blurb
+
+
+def iter_blurbs(soup):
+    """Generates a Blurb for each blurb in the list on a listing page."""
+    list_tag = soup.find("ol", attrs={"class": "index"})
+    if not list_tag:
+        list_tag = soup.find("ul", attrs={"class": "index"})
+    if not list_tag:
+        return
+
+    # The blurbs are the list's own items; searching the whole list would
+    # also look through every tag inside each of them.
+    for li_tag in list_tag.children:
+        if li_tag.name == "li" and "blurb" in (li_tag.get("class") or ()):
+            yield parse_blurb(li_tag)
@@ -0,0 +1,134 @@
+# -*- encoding: utf-8
+"""Persist Cloudflare clearance between processes.
+
+When Cloudflare challenges a new session, cloudscraper has to solve the
+challenge before the first real request goes through.  The clearance it gets
+back (a handful of cookies, tied to the User-Agent that solved it) is good for
+a while, so we save it to disk and hand it to the next process, which can then
+skip the challenge entirely.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+DEFAULT_CLEARANCE_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "ao3", "clearance.json"
+)
+
+# Cloudflare's clearance and bot-management cookies, e.g. cf_clearance,
+# __cf_bm and __cflb.
+CLEARANCE_COOKIE_PREFIXES = ("cf_", "__cf")
+
+
+def is_cloudflare_challenge(response, check_body=True):
+    """Is this response Cloudflare refusing us, rather than AO3 answering?
+
+    Pass ``check_body=False`` for streamed responses, whose body we mustn't
+    read here; then only the headers are checked.
+    """
+    if response.status_code not in (403, 429, 503):
+        return False
+    if response.headers.get("cf-mitigated") == "challenge":
+        return True
+    if "cloudflare" not in response.headers.get("Server", "").lower():
+        return False
+    if not check_body:
+        return False
+    return "challenge-platform" in response.text or "Just a moment" in response.text
+
+
+class ClearanceStore(object):
+    """A small JSON file of Cloudflare clearance cookies, keyed by domain.
+
+    Each entry records the clearance cookies and the User-Agent that earned
+    them; Cloudflare rejects the cookies if they come back with a different
+    User-Agent.  The file contains session secrets, so it's only readable by
+    the current user.
+    """
+
+    def __init__(self, path=DEFAULT_CLEARANCE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._saved = {}
+
+    def __repr__(self):
+        return f"{type(self).__name__}(path={self.path!r})"
+
+    def _read(self):
+        try:
+            with open(self.path, encoding="utf-8") as infile:
+                return json.load(infile)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, data):
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".clearance")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as outfile:
+                json.dump(data, outfile)
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def load(self, session, domain):
+        """Copy any saved clearance for ``domain`` into ``session``.
+
+        Returns True if there was a saved clearance to reuse.
+        """
+        with self._lock:
+            entry = self._read().get(domain)
+            if not entry:
+                return False
+
+            session.headers["User-Agent"] = entry["user_agent"]
+            for name, value in entry["cookies"].items():
+                session.cookies.set(name, value, domain=domain)
+            self._saved[domain] = entry["cookies"]
+            return True
+
+    def save(self, session, domain):
+        """Record the clearance currently held by ``session`` for ``domain``.
+
+        Does nothing if the clearance hasn't changed since it was last saved
+        or loaded, so this is cheap enough to call after every response.
+        """
+        cookies = {
+            cookie.name: cookie.value
+            for cookie in session.cookies
+            if cookie.name.startswith(CLEARANCE_COOKIE_PREFIXES)
+            and cookie.domain.lstrip(".") == domain
+        }
+        if not cookies or self._saved.get(domain) == cookies:
+            return
+
+        with self._lock:
+            data = self._read()
+            data[domain] = {
+                "user_agent": session.headers["User-Agent"],
+                "cookies": cookies,
+                "saved_at": time.time(),
+            }
+            self._write(data)
+            self._saved[domain] = cookies
+
+    def clear(self, session, domain):
+        """Forget the clearance for ``domain``, because Cloudflare rejected it."""
+        for cookie in list(session.cookies):
+            if (
+                cookie.name.startswith(CLEARANCE_COOKIE_PREFIXES)
+                and cookie.domain.lstrip(".") == domain
+            ):
+                session.cookies.clear(cookie.domain, cookie.path, cookie.name)
+
+        with self._lock:
+            self._saved.pop(domain, None)
+            data = self._read()
+            if data.pop(domain, None) is not None:
+                self._write(data)
@@ -0,0 +1,407 @@
+# -*- encoding: utf-8
+"""The ``python -m ao3`` command: export works, bookmarks, reading history
+and comments as NDJSON (one JSON object per line) or CSV.
+
+    $ python -m ao3 works 258626 1234 > works.ndjson
+    $ python -m ao3 --username me --cookie ... bookmarks me --resume done.txt -o bookmarks.ndjson
+    $ python -m ao3 --format csv series 1234 > series.csv
+
+Rows are written as soon as they're ready.  With ``--resume FILE``, the key
+of every row written is recorded in FILE, and the output file is appended
+to rather than replaced, so an interrupted export can be run again with the
+same arguments and picks up where it stopped.
+
+Progress messages (and a summary at the end) go to stderr, so they don't
+mix with the rows on stdout.
+"""
+
+import argparse
+import collections
+import contextlib
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import AO3
+from .adaptive import AdaptiveLimiter
+from .utils import BASE_URL, DEFAULT_REQUEST_INTERVAL
+
+FORMATS = ("ndjson", "csv")
+
+READING_HISTORY_FIELDS = (
+    "work_id",
+    "last_visited",
+    "visits",
+    "title",
+    "authors",
+    "fandoms",
+    "warnings",
+    "relationships",
+    "characters",
+    "freeforms",
+    "words",
+    "chapters",
+    "comments",
+    "kudos",
+    "bookmarks",
+    "hits",
+    "updated",
+)
+
+COMMENT_FIELDS = (
+    "work_id",
+    "user",
+    "anonymous",
+    "top_level",
+    "date",
+    "timezone",
+    "chapter",
+    "content",
+)
+
+
+# Errors that mean we can't export one work, but can carry on with the rest.
+def _skippable_errors():
+    from .works import HiddenWork, RestrictedWork, WorkNotFound
+
+    return (HiddenWork, RestrictedWork, WorkNotFound, RuntimeError)
+
+
+class ResumeLog(object):
+    """The keys of the rows already exported, one per line."""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if path is not None and os.path.exists(path):
+            with open(path, encoding="utf-8") as infile:
+                self.done = {line.rstrip("\n") for line in infile}
+        self._file = open(path, "a", encoding="utf-8") if path is not None else None
+
+    def __contains__(self, key):
+        return key in self.done
+
+    def mark(self, key):
+        self.done.add(key)
+        if self._file is not None:
+            self._file.write(key + "\n")
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class NdjsonWriter(object):
+    def __init__(self, outfile):
+        self.outfile = outfile
+
+    def write(self, row):
+        self.outfile.write(json.dumps(row, default=str, ensure_ascii=False) + "\n")
+        self.outfile.flush()
+
+
+class CsvWriter(object):
+    """Writes rows as CSV, with the columns taken from the first row.
+
+    Nested dicts (e.g. a work's stats) become columns like ``stats.kudos``,
+    and lists are written as JSON, since tag names can contain commas.
+    """
+
+    def __init__(self, outfile, write_header=True):
+        self.outfile = outfile
+        self.write_header = write_header
+        self._writer = None
+
+    @staticmethod
+    def flatten(row, prefix=""):
+        flat = {}
+        for key, value in row.items():
+            if isinstance(value, dict):
+                flat.update(CsvWriter.flatten(value, prefix=f"{prefix}{key}."))
+            elif isinstance(value, (list, tuple)):
+                flat[prefix + key] = json.dumps(value, ensure_ascii=False)
+            else:
+                flat[prefix + key] = value
+        return flat
+
+    def write(self, row):
+        flat = self.flatten(row)
+        if self._writer is None:
+            self._writer = csv.DictWriter(
+                self.outfile, fieldnames=list(flat), extrasaction="ignore"
+            )
+            if self.write_header:
+                self._writer.writeheader()
+        self._writer.writerow(flat)
+        self.outfile.flush()
+
+
+class Progress(object):
+    """Counts rows, and prints a summary when the export finishes."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.started = time.monotonic()
+        self.counts = collections.Counter()
+
+    def add(self, outcome):
+        self.counts[outcome] += 1
+        done = self.counts["written"] + self.counts["failed"]
+        if outcome != "skipped" and done % 100 == 0:
+            print(f"... {done} rows so far", file=self.stream)
+
+    def summary(self, session=None):
+        elapsed = time.monotonic() - self.started
+        written = self.counts["written"]
+        rate = written / elapsed if elapsed else 0
+        lines = [
+            f"Wrote {written} rows in {elapsed:.1f}s ({rate:.2f} rows/s)",
+            f"Skipped {self.counts['skipped']} rows already exported, "
+            f"{self.counts['failed']} rows failed",
+        ]
+        if session is not None and hasattr(session, "stats"):
+            stats = session.stats()
+            lines.append(
+                f"Requests: {stats['requests']} sent, {stats['coalesced']} coalesced"
+            )
+            if "limiter" in stats:
+                limiter = stats["limiter"]
+                lines.append(
+                    f"Adaptive limit: {limiter['rate']:.2f} requests/s, "
+                    f"{limiter['concurrency']} at once "
+                    f"({limiter['increases']} increases, "
+                    f"{limiter['decreases']} decreases)"
+                )
+        return "\n".join(lines)
+
+
+def _ordered_map(func, items, workers):
+    """Generates (item, func(item) or the exception it raised) in the order
+    of ``items``, running up to ``workers`` calls at once.
+    """
+
+    def call(item):
+        try:
+            return func(item)
+        except _skippable_errors() as err:
+            return err
+
+    with ThreadPoolExecutor(workers) as executor:
+        pending = collections.deque()
+        for item in items:
+            pending.append((item, executor.submit(call, item)))
+            if len(pending) >= workers * 2:
+                item, future = pending.popleft()
+                yield item, future.result()
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
+
+
+def _work_rows(api, work_ids, args, resume):
+    """Fetch each work that hasn't been exported yet.  Generates (key, row or
+    exception, or None if the row was exported by an earlier run).
+    """
+
+    def fetch(work_id):
+        if f"work:{work_id}" in resume:
+            return None
+        return json.loads(api.work(work_id).json())
+
+    for work_id, row in _ordered_map(fetch, work_ids, args.workers):
+        yield f"work:{work_id}", row
+
+
+def _id_rows(work_ids):
+    for work_id in work_ids:
+        yield f"work:{work_id}", {"id": work_id}
+
+
+def _listed_work_ids(api, args):
+    """The IDs of the works in the list that the command is for."""
+    if args.command == "bookmarks":
+        return api.author(args.username).bookmarks_ids(
+            max_count=args.max_count, expand_series=args.expand_series
+        )
+    if args.command == "user-works":
+        return api.author(args.username).work_ids(max_count=args.max_count)
+    if args.command == "series":
+        return api.series(args.id).work_ids(max_count=args.max_count)
+    if args.recursive:
+        crawl = api.collection(args.id).crawl(workers=args.workers)
+        return itertools.islice((result.work_id for result in crawl), args.max_count)
+    return api.collection(args.id).work_ids(max_count=args.max_count)
+
+
+def _rows_for(api, args, resume):
+    if args.command == "works":
+        work_ids = args.ids
+        if work_ids == ["-"]:
+            work_ids = [line.strip() for line in sys.stdin if line.strip()]
+        return _work_rows(api, work_ids, args, resume)
+
+    if args.command == "reading-history":
+        if api.user is None:
+            raise SystemExit("reading-history needs --username and --cookie")
+        return (
+            (f"reading:{entry[0]}", dict(zip(READING_HISTORY_FIELDS, entry)))
+            for entry in api.user.reading_history()
+        )
+
+    if args.command == "comments":
+        return (
+            (f"comment:{work_id}:{i}", dict(zip(COMMENT_FIELDS, comment)))
+            for work_id in args.ids
+            for i, comment in enumerate(api.comments(work_id).comment_contents())
+        )
+
+    work_ids = _listed_work_ids(api, args)
+    if args.ids_only:
+        return _id_rows(work_ids)
+    return _work_rows(api, work_ids, args, resume)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m ao3",
+        description="Export data from AO3 as NDJSON or CSV.",
+    )
+    parser.add_argument("--ao3-url", default=BASE_URL)
+    parser.add_argument(
+        "--username", default=os.environ.get("AO3_USERNAME"), help="log in as this user"
+    )
+    parser.add_argument(
+        "--cookie",
+        default=os.environ.get("AO3_COOKIE"),
+        help="the value of your _otwarchive_session cookie (or set AO3_COOKIE)",
+    )
+    parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    parser.add_argument(
+        "-o", "--output", help="write rows to this file instead of stdout"
+    )
+    parser.add_argument(
+        "--resume",
+        metavar="FILE",
+        help="record exported rows in FILE, and skip them when run again",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=2,
+        help="how many works to fetch at once (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--request-interval",
+        type=float,
+        default=DEFAULT_REQUEST_INTERVAL,
+        help="minimum seconds between requests (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="adjust the request rate to how AO3 is coping, "
+        "starting from --request-interval",
+    )
+    parser.add_argument("--max-count", type=int, default=None)
+
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    works = subparsers.add_parser("works", help="works by ID")
+    works.add_argument("ids", nargs="+", help="work IDs, or - to read them from stdin")
+
+    for name, arg, help_text in [
+        ("bookmarks", "username", "a user's bookmarked works"),
+        ("user-works", "username", "a user's works"),
+        ("series", "id", "the works in a series"),
+        ("collection", "id", "the works in a collection"),
+    ]:
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument(arg)
+        sub.add_argument(
+            "--ids-only",
+            action="store_true",
+            help="only list the work IDs, rather than fetching each work",
+        )
+        if name == "bookmarks":
+            sub.add_argument("--expand-series", action="store_true")
+        if name == "collection":
+            sub.add_argument(
+                "--recursive",
+                action="store_true",
+                help="include the works in its subcollections",
+            )
+
+    subparsers.add_parser(
+        "reading-history", help="your reading history (needs --username/--cookie)"
+    )
+
+    comments = subparsers.add_parser("comments", help="the comments on works")
+    comments.add_argument("ids", nargs="+", help="work IDs")
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    resume = ResumeLog(args.resume)
+    if args.output:
+        appending = args.resume is not None and os.path.exists(args.output)
+        outfile = open(
+            args.output, "a" if appending else "w", encoding="utf-8", newline=""
+        )
+    else:
+        appending = False
+        outfile = sys.stdout
+
+    if args.format == "csv":
+        writer = CsvWriter(outfile, write_header=not appending)
+    else:
+        writer = NdjsonWriter(outfile)
+
+    progress = Progress(sys.stderr)
+    limiter = None
+    if args.adaptive:
+        rate = 1 / args.request_interval if args.request_interval > 0 else 2.0
+        limiter = AdaptiveLimiter(
+            rate=rate, max_rate=max(2.0, rate), max_concurrency=args.workers
+        )
+    api = AO3(
+        ao3_url=args.ao3_url,
+        pool_maxsize=max(10, args.workers),
+        request_interval=args.request_interval,
+        limiter=limiter,
+    )
+    if args.cookie:
+        api.login(args.username, args.cookie)
+
+    status = 0
+    # The library reports its progress with print(); keep that out of the rows.
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            for key, row in _rows_for(api, args, resume):
+                if row is None or key in resume:
+                    progress.add("skipped")
+                elif isinstance(row, Exception):
+                    print(f"Skipping {key}: {row}", file=sys.stderr)
+                    progress.add("failed")
+                    status = 1
+                else:
+                    writer.write(row)
+                    resume.mark(key)
+                    progress.add("written")
+        except KeyboardInterrupt:
+            print("Interrupted", file=sys.stderr)
+            status = 130
+        finally:
+            print(progress.summary(api.session), file=sys.stderr)
+            resume.close()
+            if args.output:
+                outfile.close()
+
+    return status
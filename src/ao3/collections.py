@@ -1,5 +1,25 @@
 # -*- encoding: utf-8
-from .utils import DATE_UPDATED, get_list_of_work_ids
+import collections
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .seen import SeenSet
+from .utils import (
+    DATE_UPDATED,
+    TYPE_WORKS,
+    get_ids_and_dates_from_page,
+    get_list_of_work_ids,
+    iter_pages,
+)
+
+# How many collections crawl() fetches at once.  Every request still goes
+# through the session's rate limiter.
+DEFAULT_CRAWL_WORKERS = 4
+
+CollectionWork = collections.namedtuple(
+    "CollectionWork", ["collection", "work_id", "date"]
+)
 
 
 class Collection(object):
@@ -11,11 +31,173 @@ class Collection(object):
         self.ao3_url = ao3_url
         self.url = f"{self.ao3_url}/collections/{self.id}"
 
-    def work_ids(self, max_count=0, oldest_date=None):
+    def __repr__(self):
+        return f"{type(self).__name__}(id={self.id!r})"
+
+    def work_ids(self, max_count=0, oldest_date=None, seen=None):
         return get_list_of_work_ids(
             f"{self.url}/works",
             self.session,
             max_count=max_count,
             oldest_date=oldest_date,
             date_type=DATE_UPDATED,
+            owner=self.url,
+            seen=seen,
         )
+
+    def iter_work_ids(self, oldest_date=None):
+        """Generates (work ID, date updated) for each work in the collection,
+        a page at a time, stopping at the first work older than
+        ``oldest_date``.
+        """
+        for _, soup in iter_pages(f"{self.url}/works", self.session, owner=self.url):
+            for id_type, work_id, date in get_ids_and_dates_from_page(
+                soup, DATE_UPDATED
+            ):
+                if oldest_date and date and date < oldest_date:
+                    return
+                if id_type == TYPE_WORKS:
+                    yield work_id, date
+
+    def subcollections(self):
+        """Returns a Collection for each of this collection's subcollections
+        (e.g. the parts of a challenge or exchange).
+        """
+        # The subcollections are listed as
+        #
+        #     <ul class="collection picture index group">
+        #       <li class="collection picture blurb group" role="article">
+        #         <div class="header module">
+        #           <h4 class="heading">
+        #             <a href="/collections/[subcollection_id]">[title]</a>
+        #           </h4>
+        #           ...
+        #
+        found = []
+        for _, soup in iter_pages(
+            f"{self.url}/collections", self.session, owner=self.url
+        ):
+            for li_tag in soup.find_all("li", attrs={"class": "collection"}):
+                heading = li_tag.find(attrs={"class": "heading"})
+                link = heading.find("a") if heading is not None else None
+                if link is None or "/collections/" not in link.get("href", ""):
+                    continue
+                sub_id = link["href"].split("/collections/")[-1].strip("/")
+                if sub_id != self.id and sub_id not in found:
+                    found.append(sub_id)
+        return [Collection(sub_id, self.session, self.ao3_url) for sub_id in found]
+
+    def crawl(
+        self,
+        workers=DEFAULT_CRAWL_WORKERS,
+        max_depth=None,
+        max_collections=None,
+        oldest_date=None,
+        buffer_size=1000,
+        seen=None,
+    ):
+        """Generates a CollectionWork (collection ID, work ID, date updated)
+        for every work in this collection and its subcollections, and theirs,
+        and so on.
+
+        Collections are fetched ``workers`` at a time.  A work that's in
+        several of them (a collection's listing includes its subcollections'
+        works) is only generated once, for whichever collection it was found
+        in first.
+
+        :param max_depth: how many levels of subcollections to follow.  AO3
+            only nests them one level deep at the moment, so ``max_depth=1``
+            saves looking for subcollections of each subcollection.
+        :param max_collections: stop following subcollections once this many
+            collections (including this one) have been found.
+        :param buffer_size: how many results can be waiting for you to take
+            them before the crawl pauses, so a slow consumer doesn't mean an
+            ever-growing backlog.
+        :param seen: a SeenSet (see ao3.seen) of works to leave out, e.g.
+            the ones found by an earlier crawl.  The works found are added
+            to it.
+        """
+        crawl = _Crawl(self, workers, max_depth, max_collections, oldest_date, seen)
+        return crawl.run(buffer_size)
+
+
+class _Crawl(object):
+    _DONE = object()
+
+    def __init__(self, root, workers, max_depth, max_collections, oldest_date, seen):
+        self.root = root
+        self.workers = workers
+        self.max_depth = max_depth
+        self.max_collections = max_collections
+        self.oldest_date = oldest_date
+
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._collections = {root.id}
+        self._work_ids = seen if seen is not None else SeenSet()
+        self._pending = 0
+
+    def run(self, buffer_size):
+        self._results = queue.Queue(maxsize=buffer_size)
+        self._executor = ThreadPoolExecutor(self.workers)
+        self._pending = 1
+        self._executor.submit(self._visit, self.root, 0)
+        try:
+            while True:
+                item = self._results.get()
+                if item is self._DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Either we're done, or the caller stopped early (or something
+            # failed): let any workers still running know, so they don't
+            # wait for room in the queue forever.
+            self._stopped.set()
+            self._executor.shutdown(wait=True)
+
+    def _put(self, item):
+        while not self._stopped.is_set():
+            try:
+                self._results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _claim(self, collection):
+        with self._lock:
+            if collection.id in self._collections:
+                return False
+            if (
+                self.max_collections is not None
+                and len(self._collections) >= self.max_collections
+            ):
+                return False
+            self._collections.add(collection.id)
+            self._pending += 1
+            return True
+
+    def _visit(self, collection, depth):
+        try:
+            if self.max_depth is None or depth < self.max_depth:
+                for sub in collection.subcollections():
+                    if self._stopped.is_set():
+                        return
+                    if self._claim(sub):
+                        self._executor.submit(self._visit, sub, depth + 1)
+
+            for work_id, date in collection.iter_work_ids(self.oldest_date):
+                if not self._work_ids.add(work_id):
+                    continue
+                if not self._put(CollectionWork(collection.id, work_id, date)):
+                    return
+        except Exception as err:
+            self._put(err)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                finished = self._pending == 0
+            if finished:
+                self._put(self._DONE)
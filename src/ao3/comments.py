@@ -1,13 +1,125 @@
 # -*- encoding: utf-8
 
+import collections
 import itertools
-import time
+import re
 
-import cloudscraper
 from bs4 import BeautifulSoup
 
+from .session import default_session
 from .utils import BASE_URL, get_with_timeout
 
+# A link to the rest of a comment thread, which is on another page.
+MoreComments = collections.namedtuple("MoreComments", ["path"])
+
+COMMENT_LINK_REGEX = re.compile(r"/comments/(\d+)")
+
+
+class Comment(
+    collections.namedtuple(
+        "Comment",
+        [
+            "work_id",
+            "user",
+            "anonymous",
+            "top_level",
+            "date",
+            "timezone",
+            "chapter",
+            "content",
+        ],
+    )
+):
+    """One comment, as the tuple Comments.comment_contents() has always
+    generated.  It also knows where it sits in its thread: ``comment_id`` is
+    AO3's ID for it, and ``parent_id`` the ID of the comment it replies to
+    (None for a top-level comment, or if AO3 didn't show them).
+    """
+
+    comment_id = None
+    parent_id = None
+
+
+def parse_comment(li_tag, work_id):
+    """Returns the Comment for one comment; see Comments.comment_contents()."""
+    h4_tag = li_tag.find("h4", attrs={"class": "heading"})
+    if h4_tag.find("a") is None:
+        user = str(h4_tag.contents[0].strip())
+        anon = True
+    else:
+        user = str(h4_tag.find("a").contents[0])
+        anon = False
+
+    if h4_tag.find("span", attrs={"class": "parent"}) is None:
+        chapter = "on Chapter 1"
+    else:
+        chapter = str(h4_tag.find("span", attrs={"class": "parent"}).contents[0])
+
+    ul_tag = li_tag.find("ul", attrs={"class": "actions"})
+    if "Parent Thread" in str(
+        ul_tag
+    ):  # this is possibly the laziest way to search but hey, it works
+        toplevel = False
+    else:
+        toplevel = True
+
+    # A reply links to the comment it's replying to:
+    #
+    #     <li id="comment_12345" class="comment group odd" role="article">
+    #       ...
+    #       <ul class="actions" id="navigation_for_comment_12345">
+    #         <li><a href="/comments/12340">Parent Thread</a></li>
+    #
+    parent_id = None
+    if not toplevel:
+        for a_tag in ul_tag.find_all("a"):
+            match = COMMENT_LINK_REGEX.search(a_tag.get("href") or "")
+            if match and "Parent Thread" in a_tag.get_text():
+                parent_id = match.group(1)
+                break
+
+    date = str(li_tag.find("span", attrs={"class": "date"}).contents[0])
+    month = str(li_tag.find("abbr", attrs={"class": "month"}).contents[0])
+    year = str(li_tag.find("span", attrs={"class": "year"}).contents[0])
+    time = str(li_tag.find("span", attrs={"class": "time"}).contents[0])
+    timezone = str(li_tag.find("abbr", attrs={"class": "timezone"}).contents[0])
+    date_time = date + " " + month + " " + year + " " + time
+
+    content = str(
+        li_tag.find("blockquote", attrs={"class": "userstuff"}).contents[0]
+    )
+
+    comment = Comment(
+        work_id, user, anon, toplevel, date_time, timezone, chapter, content
+    )
+    li_id = li_tag.get("id") or ""
+    if li_id.startswith("comment_"):
+        comment.comment_id = li_id[len("comment_") :]
+    comment.parent_id = parent_id
+    return comment
+
+
+def parse_comments_page(soup, work_id):
+    """Returns the comments on a page, in order, as a list of comment tuples
+    and, where a thread continues on another page, MoreComments.
+    """
+    items = []
+    for li_tag in soup.findAll("li", attrs={"class": "comment"}):
+        try:
+            items.append(parse_comment(li_tag, work_id))
+        except AttributeError:
+            # deleted comment only has text
+            if "Previous comment deleted" in str(li_tag):
+                pass
+            elif "more comments in this thread" in str(
+                li_tag
+            ):  # potentially will break if nested further?? unsure what that looks like though
+                items.append(MoreComments(li_tag.find("a").get("href")))
+            else:
+                raise
+    return items
+
+
 # Making this a separate class from Work bc the URL being fetched is different and we
 # will need to iterate through pages of comments.
 
@@ -24,93 +136,44 @@ class Comments(object):
     def __init__(self, id, sess=None, ao3_url=BASE_URL):
         self.id = id
         if sess is None:
-            sess = cloudscraper.create_scraper()
+            sess = default_session()
         self.sess = sess
         self.ao3_url = ao3_url
+        # Comment pages for one work share a lane in the scheduler.
+        self._owner = f"{ao3_url}/works/{id}/comments"
 
     def __repr__(self):
         return f"{type(self).__name__}(id={self.id!r})"
 
-    def parsecomment(self, li_tag):  # inside class so the self info stays attached
-        h4_tag = li_tag.find("h4", attrs={"class": "heading"})
-        if h4_tag.find("a") is None:
-            user = str(h4_tag.contents[0].strip())
-            anon = True
-        else:
-            user = str(h4_tag.find("a").contents[0])
-            anon = False
-
-        if h4_tag.find("span", attrs={"class": "parent"}) is None:
-            chapter = "on Chapter 1"
-        else:
-            chapter = str(h4_tag.find("span", attrs={"class": "parent"}).contents[0])
-
-        ul_tag = li_tag.find("ul", attrs={"class": "actions"})
-        if "Parent Thread" in str(
-            ul_tag
-        ):  # this is possibly the laziest way to search but hey, it works
-            toplevel = False
-        else:
-            toplevel = True
-
-        work_id_raw = str(self)
-        work_id_split = work_id_raw.split("'")
-        work_id_num = work_id_split[1]
-        work_id = work_id_num[:-2]
-
-        date = str(li_tag.find("span", attrs={"class": "date"}).contents[0])
-        month = str(li_tag.find("abbr", attrs={"class": "month"}).contents[0])
-        year = str(li_tag.find("span", attrs={"class": "year"}).contents[0])
-        time = str(li_tag.find("span", attrs={"class": "time"}).contents[0])
-        timezone = str(li_tag.find("abbr", attrs={"class": "timezone"}).contents[0])
-        date_time = date + " " + month + " " + year + " " + time
-
-        content = str(
-            li_tag.find("blockquote", attrs={"class": "userstuff"}).contents[0]
-        )
-
-        return work_id, user, anon, toplevel, date_time, timezone, chapter, content
+    def parsecomment(self, li_tag):
+        return parse_comment(li_tag, self.id)
+
+    def _expand(self, items):
+        for item in items:
+            if isinstance(item, MoreComments):
+                yield from self.recursemorecomments(BASE_URL + item.path)
+            else:
+                yield item
 
     def recursemorecomments(self, url):
-        mc_req = get_with_timeout(self.sess, url)
-        # if timeout, wait and try again
-        while len(mc_req.text) < 20 and "Retry later" in mc_req.text:
-            print("timeout... waiting 3 mins and trying again")
-            time.sleep(180)
-            mc_req = get_with_timeout(self.sess, url)
+        mc_req = get_with_timeout(self.sess, url, owner=self._owner)
 
         mc_soup = BeautifulSoup(mc_req.text, features="html.parser")
-        for mc_li_tag in mc_soup.findAll("li", attrs={"class": "comment"}):
-            try:
-                yield self.parsecomment(mc_li_tag)
-            except AttributeError:
-                if "more comments in this thread" in str(
-                    mc_li_tag
-                ):  # potentially will break if nested further?? unsure what that looks like though
-                    for x in self.recursemorecomments(
-                        BASE_URL + mc_li_tag.find("a").get("href")
-                    ):
-                        yield x
-                else:
-                    raise
+        yield from self._expand(parse_comments_page(mc_soup, self.id))
 
     def comment_contents(self):
         """Generator for next comment on the work.
         Generates a tuple of user, anon (boolean value -- true if anon), toplevel (boolean value - true if toplevel comment), (day of month, month, year, time), timezone, content
         Unless otherwise specified, all values are returned as strings
         Returned datetime is for the time the comment was made, not the edited time
+        Each tuple is a Comment, which also has the comment's comment_id and parent_id
 
         """
 
         api_url = f"{self.ao3_url}/works/{self.id}?page=%d&show_comments=true&view_full_work=true"
 
         for page_no in itertools.count(start=1):
-            req = get_with_timeout(self.sess, api_url % page_no)
-            # if timeout, wait and try again
-            while len(req.text) < 20 and "Retry later" in req.text:
-                print("timeout... waiting 3 mins and trying again")
-                time.sleep(180)
-                req = get_with_timeout(self.sess, api_url % page_no)
+            req = get_with_timeout(self.sess, api_url % page_no, owner=self._owner)
 
             # make sure work can be found
             if req.status_code == 404:
@@ -127,20 +190,7 @@ class Comments(object):
                 raise RestrictedWork("Looking at work ID %s requires login")
 
             soup = BeautifulSoup(req.text, features="html.parser")
-            for li_tag in soup.findAll("li", attrs={"class": "comment"}):
-                try:
-                    yield self.parsecomment(li_tag)
-                except AttributeError:
-                    # deleted comment only has text
-                    if "Previous comment deleted" in str(li_tag):
-                        pass
-                    elif "more comments in this thread" in str(li_tag):
-                        for x in self.recursemorecomments(
-                            BASE_URL + li_tag.find("a").get("href")
-                        ):
-                            yield x
-                    else:
-                        raise
+            yield from self._expand(parse_comments_page(soup, self.id))
 
             # The pagination button at the end of the page is of the form
             #
@@ -0,0 +1,366 @@
+# -*- encoding: utf-8
+"""A local SQLite archive of comments, with a full-text index.
+
+Comments written out as tuples in flat files can only be searched by reading
+all of them.  A CommentStore keeps them in SQLite instead:
+
+* ``comments``: one row per comment, with indexes on its work and chapter,
+  its author, its date and its place in its thread;
+* ``comments_fts``: an FTS5 full-text index of the comments' text (without
+  the HTML), kept in step with ``comments`` by triggers;
+
+so "comments mentioning X" or "everything user Y has said on work Z" are an
+index lookup, even with millions of comments stored.
+
+    >>> store = CommentStore("comments.sqlite")
+    >>> store.put_many(api.comments(work_id).comment_contents())
+    >>> store.search('"found family" NOT angst', work_id="258626")
+    [{'comment_id': 123, 'work_id': 258626, 'user': 'alice', ...}, ...]
+
+Comments are written in batches as they're generated, so a long crawl can be
+streamed straight into the store.  Storing a comment that's already there
+(crawling a work again, to pick up new comments) updates it in place.
+"""
+
+import html
+import re
+import sqlite3
+import threading
+
+from .blurbs import MONTHS
+
+# Columns of the comments table that are returned for each comment, in order.
+COMMENT_COLUMNS = [
+    "comment_id",
+    "work_id",
+    "chapter",
+    "user",
+    "anonymous",
+    "date",
+    "timezone",
+    "parent_id",
+    "thread_id",
+    "depth",
+    "content",
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS comments (
+    id INTEGER PRIMARY KEY,
+    comment_id INTEGER UNIQUE,
+    work_id INTEGER NOT NULL,
+    chapter INTEGER,
+    user TEXT,
+    anonymous INTEGER NOT NULL,
+    date TEXT,
+    timezone TEXT,
+    parent_id INTEGER,
+    thread_id INTEGER,
+    depth INTEGER NOT NULL,
+    content TEXT,
+    text TEXT
+);
+CREATE INDEX IF NOT EXISTS comments_work ON comments (work_id, chapter);
+CREATE INDEX IF NOT EXISTS comments_user ON comments (user, date);
+CREATE INDEX IF NOT EXISTS comments_date ON comments (date);
+CREATE INDEX IF NOT EXISTS comments_thread ON comments (thread_id, id);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS comments_fts USING fts5(
+    text, content='comments', content_rowid='id'
+);
+
+CREATE TRIGGER IF NOT EXISTS comments_ai AFTER INSERT ON comments BEGIN
+    INSERT INTO comments_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS comments_ad AFTER DELETE ON comments BEGIN
+    INSERT INTO comments_fts (comments_fts, rowid, text)
+    VALUES ('delete', old.id, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS comments_au AFTER UPDATE OF text ON comments BEGIN
+    INSERT INTO comments_fts (comments_fts, rowid, text)
+    VALUES ('delete', old.id, old.text);
+    INSERT INTO comments_fts (rowid, text) VALUES (new.id, new.text);
+END;
+"""
+
+TAG_REGEX = re.compile(r"<[^>]+>")
+CHAPTER_REGEX = re.compile(r"Chapter (\d+)")
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def comment_text(content):
+    """The text of a comment's HTML, for the full-text index."""
+    return " ".join(html.unescape(TAG_REGEX.sub(" ", content or "")).split())
+
+
+def parse_comment_date(date_time):
+    """Turn a comment's date, e.g. "12 Jan 2020 10:15PM", into an ISO 8601
+    string that sorts properly.  Anything unrecognised is kept as it is.
+
+    Does the same as datetime.strptime(date_time, "%d %b %Y %I:%M%p"), which
+    is slow enough to show up when storing a lot of comments.
+    """
+    try:
+        day, month, year, clock = date_time.split()
+        hour, minute = clock[:-2].split(":")
+        hour = int(hour) % 12 + (12 if clock[-2:].upper() == "PM" else 0)
+        return (
+            f"{int(year):04d}-{MONTHS[month]:02d}-{int(day):02d} "
+            f"{hour:02d}:{int(minute):02d}"
+        )
+    except (AttributeError, KeyError, ValueError):
+        return date_time
+
+
+def _int_or_none(value):
+    return int(value) if value is not None else None
+
+
+class CommentStore(object):
+    """Comments in a SQLite database, with a full-text index of their text.
+
+    :param path: the SQLite file to use.  By default the store is in memory,
+        and lasts only as long as this object.
+    """
+
+    def __init__(self, path=":memory:"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def __repr__(self):
+        return f"{type(self).__name__}(path={self.path!r})"
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM comments").fetchone()[0]
+
+    def __contains__(self, comment_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM comments WHERE comment_id = ?", (int(comment_id),)
+            ).fetchone()
+        return row is not None
+
+    def _thread_position(self, comment_id, parent_id, batch_threads):
+        """Returns (thread ID, depth) for a comment: a reply is in the same
+        thread as the comment it replies to, one level deeper.
+        """
+        if parent_id is None:
+            return comment_id, 0
+        # Replies usually come right after their parent, in the same batch.
+        row = batch_threads.get(parent_id)
+        if row is None:
+            row = self._conn.execute(
+                "SELECT thread_id, depth FROM comments WHERE comment_id = ?",
+                (parent_id,),
+            ).fetchone()
+        if row is None:
+            # We haven't stored its parent (yet); start from there.
+            return parent_id, 1
+        return row[0], row[1] + 1
+
+    def _row(self, comment, batch_threads):
+        work_id, user, anonymous, _, date, timezone, chapter, content = comment
+        comment_id = _int_or_none(getattr(comment, "comment_id", None))
+        parent_id = _int_or_none(getattr(comment, "parent_id", None))
+        thread_id, depth = self._thread_position(comment_id, parent_id, batch_threads)
+        if comment_id is not None:
+            batch_threads[comment_id] = (thread_id, depth)
+
+        match = CHAPTER_REGEX.search(chapter or "")
+        return (
+            comment_id,
+            int(work_id),
+            int(match.group(1)) if match else None,
+            user,
+            bool(anonymous),
+            parse_comment_date(date),
+            timezone,
+            parent_id,
+            thread_id,
+            depth,
+            content,
+            comment_text(content),
+        )
+
+    def put(self, comment):
+        """Add a comment, or update it if it's already stored."""
+        self.put_many([comment])
+
+    def put_many(self, comments, batch_size=DEFAULT_BATCH_SIZE):
+        """Add or update comments, committing every ``batch_size`` of them.
+
+        ``comments`` can be any iterable of comment tuples, such as
+        Comments.comment_contents(), and is read as it goes: whatever was
+        committed before an error (or an interrupted crawl) stays stored.
+        Returns the number of comments stored.
+        """
+        count = 0
+        batch = []
+        for comment in comments:
+            batch.append(comment)
+            if len(batch) >= batch_size:
+                count += self._put_batch(batch)
+                batch = []
+        if batch:
+            count += self._put_batch(batch)
+        return count
+
+    def _put_batch(self, batch):
+        batch_threads = {}
+        with self._lock:
+            with self._conn:
+                rows = [self._row(comment, batch_threads) for comment in batch]
+                # Keep the row (and its place in the order comments were
+                # crawled) if we've seen this comment before, but pick up
+                # any edits.
+                self._conn.executemany(
+                    "INSERT INTO comments (comment_id, work_id, chapter, user, "
+                    "anonymous, date, timezone, parent_id, thread_id, depth, "
+                    "content, text) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (comment_id) DO UPDATE SET "
+                    "user = excluded.user, date = excluded.date, "
+                    "parent_id = excluded.parent_id, "
+                    "thread_id = excluded.thread_id, depth = excluded.depth, "
+                    "content = excluded.content, text = excluded.text",
+                    rows,
+                )
+                # Replies stored before this comment were put in a thread of
+                # their own, starting from it; move them into its thread.
+                self._conn.executemany(
+                    "UPDATE comments SET thread_id = ?, depth = depth + ? "
+                    "WHERE thread_id = ? AND comment_id != ?",
+                    [
+                        (thread_id, depth, comment_id, comment_id)
+                        for comment_id, (thread_id, depth) in batch_threads.items()
+                        if depth > 0
+                    ],
+                )
+        return len(batch)
+
+    def _select(self, clauses, params, order, limit, join_fts=False):
+        columns = ", ".join(f"c.{column}" for column in COMMENT_COLUMNS)
+        sql = f"SELECT {columns} FROM comments c"
+        if join_fts:
+            sql += " JOIN comments_fts ON comments_fts.rowid = c.id"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += f" ORDER BY {order}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        results = []
+        for row in rows:
+            result = dict(zip(COMMENT_COLUMNS, row))
+            result["anonymous"] = bool(result["anonymous"])
+            results.append(result)
+        return results
+
+    @staticmethod
+    def _filters(work_id, chapter, user, since, until):
+        clauses = []
+        params = []
+        if work_id is not None:
+            clauses.append("c.work_id = ?")
+            params.append(int(work_id))
+        if chapter is not None:
+            clauses.append("c.chapter = ?")
+            params.append(int(chapter))
+        if user is not None:
+            clauses.append("c.user = ?")
+            params.append(user)
+        if since is not None:
+            clauses.append("c.date >= ?")
+            params.append(str(since))
+        if until is not None:
+            until = str(until)
+            if len(until) == len("YYYY-MM-DD"):
+                # Include the whole of that day.
+                until += " 23:59"
+            clauses.append("c.date <= ?")
+            params.append(until)
+        return clauses, params
+
+    def search(
+        self,
+        query,
+        work_id=None,
+        chapter=None,
+        user=None,
+        since=None,
+        until=None,
+        limit=100,
+    ):
+        """Returns the comments matching a full-text ``query``, as dicts with
+        the keys in COMMENT_COLUMNS.
+
+        ``query`` uses SQLite's FTS5 syntax: words, "quoted phrases",
+        AND/OR/NOT, and prefix* searches.  The other filters narrow it down;
+        ``since`` and ``until`` are dates (or datetimes) as ISO 8601 strings,
+        and both include the day they name.
+
+        With only a query, the best matches come first.  With filters, the
+        results are in the order they were stored: ranking every match of a
+        common word, only to throw most of them away, would take far longer
+        than finding the few that pass the filters.
+        """
+        clauses, params = self._filters(work_id, chapter, user, since, until)
+        if not clauses:
+            return self._select(
+                ["comments_fts MATCH ?"], [query], "comments_fts.rank", limit, True
+            )
+        clauses.append(
+            "c.id IN (SELECT rowid FROM comments_fts WHERE comments_fts MATCH ?)"
+        )
+        params.append(query)
+        return self._select(clauses, params, "c.id", limit)
+
+    def comments(
+        self,
+        work_id=None,
+        chapter=None,
+        user=None,
+        since=None,
+        until=None,
+        limit=None,
+    ):
+        """Returns the stored comments matching every filter, in the order
+        they were first stored.
+        """
+        clauses, params = self._filters(work_id, chapter, user, since, until)
+        return self._select(clauses, params, "c.id", limit)
+
+    def thread(self, comment_id):
+        """Returns every stored comment in the same thread as ``comment_id``,
+        in the order they were first stored (which, for a crawl, is the order
+        they appear on AO3).
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT thread_id FROM comments WHERE comment_id = ?",
+                (int(comment_id),),
+            ).fetchone()
+        if row is None:
+            return []
+        return self._select(["c.thread_id = ?"], [row[0]], "c.id", None)
+
+    def optimize(self):
+        """Merge the full-text index into as few pieces as possible, which
+        makes searches quicker after a lot of inserts.
+        """
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT INTO comments_fts (comments_fts) VALUES ('optimize')"
+                )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
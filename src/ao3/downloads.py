@@ -0,0 +1,226 @@
+# -*- encoding: utf-8
+"""Downloading works in AO3's download formats (EPUB, PDF, and so on).
+
+A download is streamed to disk a chunk at a time, so even a work that's
+hundreds of megabytes as a PDF never has to fit in memory.  Next to each
+file is a small JSON sidecar, ``<file>.ao3.json``, recording the URL it came
+from, its size and its SHA-256:
+
+* AO3's download URLs end with ``?updated_at=<timestamp>``, so if the
+  sidecar's URL is the one on the work page now, the file is up to date and
+  isn't downloaded again;
+* the file is written to ``<file>.part`` and only renamed once it's all
+  there, so an interrupted download is picked up from where it stopped
+  (with an HTTP Range request) rather than started again.
+
+    >>> work = api.work(id="258626")
+    >>> work.download("epub", "archive/")
+    Download(path='archive/258626.epub', size=28711, sha256='9f2c...', skipped=False)
+"""
+
+import collections
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from .retry import DEFAULT_RETRY_POLICY
+from .utils import DEFAULT_RATE_LIMITER
+
+FORMATS = ("azw3", "epub", "mobi", "pdf", "html")
+
+CHUNK_SIZE = 64 * 1024
+
+Download = collections.namedtuple("Download", ["path", "size", "sha256", "skipped"])
+
+
+def download_path(dest, work_id, fmt):
+    """If ``dest`` is a directory, the file goes in it as <work ID>.<format>;
+    otherwise ``dest`` is the file.
+    """
+    if os.path.isdir(dest) or dest.endswith(os.sep):
+        return os.path.join(dest, f"{work_id}.{fmt}")
+    return dest
+
+
+def _read_sidecar(path):
+    try:
+        with open(path + ".ao3.json", encoding="utf-8") as infile:
+            return json.load(infile)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_sidecar(path, data):
+    tmp_path = path + ".ao3.json.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as outfile:
+        json.dump(data, outfile)
+    os.replace(tmp_path, path + ".ao3.json")
+
+
+def file_sha256(path, chunk_size=CHUNK_SIZE):
+    """The SHA-256 of a file, read a chunk at a time."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as infile:
+        for chunk in iter(lambda: infile.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest
+
+
+def _stream(session, url, headers):
+    """Send a streamed GET under the session's rate limiter (or its
+    scheduler's), retrying as its RetryPolicy says.
+
+    This deliberately skips SingleFlight and the Scheduler's queue: they
+    share one response between callers, and a streamed body can only be
+    read once.
+    """
+    scheduler = getattr(session, "scheduler", None)
+    if scheduler is not None:
+        rate_limiter = scheduler.rate_limiter
+    else:
+        rate_limiter = getattr(session, "rate_limiter", None) or DEFAULT_RATE_LIMITER
+    rate_limiter.wait()
+
+    retry_policy = getattr(session, "retry_policy", None) or DEFAULT_RETRY_POLICY
+    return retry_policy.send(session, url, stream=True, headers=headers)
+
+
+def _up_to_date(path, url, sidecar, verify):
+    """Returns a Download if ``path`` is already a complete download of
+    ``url``, or None.
+    """
+    if sidecar.get("url") != url or not sidecar.get("complete"):
+        return None
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return None
+    if size != sidecar.get("size"):
+        return None
+    if verify and file_sha256(path).hexdigest() != sidecar.get("sha256"):
+        return None
+    return Download(path, size, sidecar["sha256"], True)
+
+
+def _receive(response, url, part_path, offset, chunk_size):
+    """Write a response's body to the .part file: after what's already there
+    if it's the rest of the file, or over it if it's the whole file.
+
+    Returns (the SHA-256 of the whole file, its size).
+    """
+    try:
+        if response.status_code == 206 and offset:
+            digest = file_sha256(part_path, chunk_size)
+            mode = "ab"
+        elif response.status_code == 200:
+            # No partial file, or the server ignored the Range header.
+            digest = hashlib.sha256()
+            offset = 0
+            mode = "wb"
+        else:
+            raise RuntimeError(
+                f"Error getting url {url}: {response.status_code}, {response.reason}"
+            )
+
+        expected = response.headers.get("Content-Length")
+        received = 0
+        with open(part_path, mode) as outfile:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    outfile.write(chunk)
+                    digest.update(chunk)
+                    received += len(chunk)
+    finally:
+        response.close()
+
+    if expected is not None and expected.isdigit() and int(expected) != received:
+        # Keep the .part file: the next try will ask for the rest.
+        raise RuntimeError(
+            f"Download of {url} was cut short: got {received} of {expected} bytes"
+        )
+    return digest, offset + received
+
+
+def download(session, url, path, verify=False, chunk_size=CHUNK_SIZE):
+    """Stream ``url`` to ``path``, unless ``path`` is already a complete
+    download of the same URL.  Returns a Download.
+
+    :param verify: also check the SHA-256 of an existing file before
+        deciding it's up to date, rather than only its size.
+    """
+    sidecar = _read_sidecar(path)
+    existing = _up_to_date(path, url, sidecar, verify)
+    if existing is not None:
+        return existing
+
+    part_path = path + ".part"
+    headers = {}
+    offset = 0
+    if sidecar.get("url") == url and os.path.exists(part_path):
+        offset = os.path.getsize(part_path)
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+    else:
+        _write_sidecar(path, {"url": url, "complete": False})
+
+    response = _stream(session, url, headers)
+    if response.status_code == 416 and offset:
+        # The .part file is already as long as the file (or longer); it's
+        # not safe to trust, so start again.
+        response.close()
+        os.remove(part_path)
+        return download(session, url, path, verify=verify, chunk_size=chunk_size)
+
+    digest, size = _receive(response, url, part_path, offset, chunk_size)
+    os.replace(part_path, path)
+    _write_sidecar(
+        path,
+        {"url": url, "complete": True, "size": size, "sha256": digest.hexdigest()},
+    )
+    return Download(path, size, digest.hexdigest(), False)
+
+
+def _skippable_errors():
+    from .works import HiddenWork, RestrictedWork, WorkNotFound
+
+    return (HiddenWork, RestrictedWork, WorkNotFound, RuntimeError, OSError)
+
+
+def download_many(
+    session, work_ids, fmt, dest, ao3_url, workers=2, verify=False, max_in_flight=None
+):
+    """Download many works into the directory ``dest``, ``workers`` at a time.
+
+    Generates (work ID, Download) in the order of ``work_ids``.  A work that
+    can't be downloaded (e.g. it's been deleted) gives (work ID, the
+    exception) instead of stopping the rest.
+
+    Every request goes through the session's rate limiter, so more workers
+    mostly help by overlapping the time spent writing files.  At most
+    ``max_in_flight`` (by default, twice ``workers``) downloads are started
+    ahead of the one being waited for.
+    """
+    from .works import Work
+
+    os.makedirs(dest, exist_ok=True)
+    if max_in_flight is None:
+        max_in_flight = 2 * workers
+
+    def fetch(work_id):
+        try:
+            work = Work(work_id, session, ao3_url)
+            return work.download(fmt, dest, verify=verify)
+        except _skippable_errors() as err:
+            return err
+
+    with ThreadPoolExecutor(workers) as executor:
+        pending = collections.deque()
+        for work_id in work_ids:
+            pending.append((work_id, executor.submit(fetch, work_id)))
+            if len(pending) >= max_in_flight:
+                work_id, future = pending.popleft()
+                yield work_id, future.result()
+        while pending:
+            work_id, future = pending.popleft()
+            yield work_id, future.result()
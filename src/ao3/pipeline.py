@@ -0,0 +1,232 @@
+# -*- encoding: utf-8
+"""Parsing pages in other processes while the next ones are fetched.
+
+Parsing a page with BeautifulSoup is CPU-bound, and holds the GIL while it
+does it, so however many threads fetch pages, they're parsed one at a time
+on one core.  A ParsePipeline hands the raw bytes of each page to a pool of
+worker processes instead, and gets back only what was extracted from it: a
+WorkRecord, or a list of IDs, reading history entries or comments.
+
+The number of pages fetched or being parsed at once is bounded by
+``max_in_flight``, so a long crawl doesn't pile up pages in memory when the
+parsers fall behind (or when you stop reading the results).
+
+    >>> pipeline = api.pipeline(processes=4)
+    >>> for work in pipeline.works(work_ids):
+    ...     print(work.title, work.kudos)
+"""
+
+import collections
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .utils import (
+    BASE_URL,
+    DATE_UPDATED,
+    PRIORITY_BACKGROUND,
+    get_with_timeout,
+    page_url,
+)
+
+
+def _soup(content, encoding):
+    from bs4 import BeautifulSoup
+
+    return BeautifulSoup(_decode(content, encoding), features="html.parser")
+
+
+def _decode(content, encoding):
+    if isinstance(content, bytes):
+        return content.decode(encoding or "utf-8", "replace")
+    return content
+
+
+# These run in the worker processes, so they have to be module-level
+# functions, and take and return only things that can be pickled.
+
+
+def parse_work(content, encoding, work_id, ao3_url):
+    """Returns the WorkRecord for a work page, or None if it's the page asking
+    whether we want to see adult content.
+    """
+    from .works import ADULT_CONTENT_WARNING, Work, check_work_page
+
+    html = _decode(content, encoding)
+    if ADULT_CONTENT_WARNING in html:
+        return None
+    check_work_page(work_id, html)
+    return Work.from_html(work_id, html, ao3_url)._record
+
+
+def parse_listing(content, encoding, date_type):
+    """Returns ((id type, id, date) for each entry, number of pages)."""
+    from .utils import get_ids_and_dates_from_page, last_page_number
+
+    soup = _soup(content, encoding)
+    return list(get_ids_and_dates_from_page(soup, date_type)), last_page_number(soup)
+
+
+def parse_reading_history(content, encoding):
+    """Returns (entries, number of deleted works, number of pages)."""
+    from .users import parse_reading_history_page
+    from .utils import last_page_number
+
+    soup = _soup(content, encoding)
+    entries, deleted = parse_reading_history_page(soup)
+    return entries, deleted, last_page_number(soup)
+
+
+def parse_comments(content, encoding, work_id):
+    """Returns (comments and MoreComments, number of pages)."""
+    from .comments import parse_comments_page
+    from .utils import last_page_number
+
+    soup = _soup(content, encoding)
+    return parse_comments_page(soup, work_id), last_page_number(soup)
+
+
+class ParsePipeline(object):
+    """Fetches pages with threads, and parses them in worker processes.
+
+    :param session: the session to fetch pages with.  Its rate limit (or
+        scheduler) still decides when each request is sent.
+    :param processes: the number of worker processes; by default, one per CPU.
+    :param max_in_flight: the most pages that may be fetched or parsed at
+        once; by default, two per worker process.
+    """
+
+    def __init__(self, session, ao3_url=BASE_URL, processes=None, max_in_flight=None):
+        self.session = session
+        self.ao3_url = ao3_url
+        self.processes = processes or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight or 2 * self.processes
+        self.deleted = 0
+
+        self._parsers = None
+        self._fetchers = ThreadPoolExecutor(self.max_in_flight)
+        # Every future not yet done, so close() can cancel them.
+        self._lock = threading.Lock()
+        self._futures = set()
+
+    def __repr__(self):
+        return (
+            f"{type(self).__name__}(processes={self.processes!r}, "
+            f"max_in_flight={self.max_in_flight!r})"
+        )
+
+    def _submit(self, executor, func, *args):
+        future = executor.submit(func, *args)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._forget)
+        return future
+
+    def _forget(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def _parse(self, url, parse, *args, priority=PRIORITY_BACKGROUND, owner=None):
+        """Fetch a page in this thread, and parse it in a worker process."""
+        if self._parsers is None:
+            self._parsers = ProcessPoolExecutor(self.processes)
+        response = get_with_timeout(self.session, url, priority=priority, owner=owner)
+        content = getattr(response, "content", None) or response.text
+        encoding = getattr(response, "encoding", None)
+        return self._submit(self._parsers, parse, content, encoding, *args).result()
+
+    def _map(self, func, jobs):
+        """Run ``func(*job)`` for each job in a fetcher thread, and generate
+        the results in order.  No more than max_in_flight jobs are started
+        before their results are taken.
+        """
+        pending = collections.deque()
+        try:
+            for job in jobs:
+                pending.append(self._submit(self._fetchers, func, *job))
+                if len(pending) >= self.max_in_flight:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def _fetch_work(self, work_id):
+        from .works import Work
+
+        url = f"{self.ao3_url}/works/{work_id}"
+        record = self._parse(url, parse_work, work_id, self.ao3_url)
+        if record is None:
+            record = self._parse(
+                url + "?view_adult=true", parse_work, work_id, self.ao3_url
+            )
+        return Work.from_record(work_id, record, self.ao3_url, sess=self.session)
+
+    def works(self, work_ids):
+        """Generates a Work for each ID, in order.  The Works are compact (see
+        Work): the page was never in this process.
+        """
+        return self._map(self._fetch_work, ((work_id,) for work_id in work_ids))
+
+    def _pages(self, url, parse, *args, owner=None):
+        """Generates the parsed pages of a paginated list.  The first page says
+        how many there are; the rest are fetched and parsed together.
+        """
+        first = self._parse(page_url(url, 1), parse, *args, owner=owner)
+        yield first
+        last_page = first[-1]
+        yield from self._map(
+            lambda next_url: self._parse(next_url, parse, *args, owner=owner),
+            ((page_url(url, page_no),) for page_no in range(2, last_page + 1)),
+        )
+
+    def work_ids(self, list_url, date_type=DATE_UPDATED):
+        """Generates (id type, id, date) for every entry in a paginated list
+        of works, e.g. a user's works or bookmarks, or a tag.
+        """
+        for entries, _ in self._pages(list_url, parse_listing, date_type):
+            yield from entries
+
+    def reading_history(self, username):
+        """Generates the entries in a user's reading history, as
+        User.reading_history() does.  You need to be logged in as them.
+        """
+        url = f"{self.ao3_url}/users/{username}/readings"
+        for entries, deleted, _ in self._pages(
+            url, parse_reading_history, owner=username
+        ):
+            self.deleted += deleted
+            yield from entries
+
+    def _expand_comments(self, items, work_id, owner):
+        from .comments import MoreComments
+
+        for item in items:
+            if isinstance(item, MoreComments):
+                thread, _ = self._parse(
+                    self.ao3_url + item.path, parse_comments, work_id, owner=owner
+                )
+                yield from self._expand_comments(thread, work_id, owner)
+            else:
+                yield item
+
+    def comments(self, work_id):
+        """Generates the comments on a work, as Comments.comment_contents()
+        does.
+        """
+        url = f"{self.ao3_url}/works/{work_id}?show_comments=true&view_full_work=true"
+        owner = f"{self.ao3_url}/works/{work_id}/comments"
+        for items, _ in self._pages(url, parse_comments, work_id, owner=owner):
+            yield from self._expand_comments(items, work_id, owner)
+
+    def close(self):
+        # Executor.shutdown(cancel_futures=True) would do this, but only from
+        # Python 3.9.
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            future.cancel()
+        self._fetchers.shutdown()
+        if self._parsers is not None:
+            self._parsers.shutdown()
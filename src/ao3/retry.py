@@ -0,0 +1,183 @@
+# -*- encoding: utf-8
+"""How long to wait, and how often to retry, when AO3 turns a request away.
+
+AO3 answers an overloaded or rate-limited request with a 429/503 (sometimes
+with a ``Retry-After`` header) or with a tiny "Retry later" page, and
+Cloudflare adds its own 52x errors.  A RetryPolicy decides which of those are
+worth retrying, and how long to back off before each retry: exponentially,
+with full jitter so that several workers that were turned away together
+don't all come back at the same moment.
+"""
+
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+# Statuses that mean "not now" rather than "no".  52x are Cloudflare's
+# errors for an unreachable or overloaded origin.
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504, 520, 521, 522, 523, 524, 525])
+
+
+class RetriesExhausted(RuntimeError):
+    """Raised when a request is still failing after the last allowed retry."""
+
+    def __init__(self, url, attempts, response):
+        self.url = url
+        self.attempts = attempts
+        self.response = response
+        super(RetriesExhausted, self).__init__(
+            f"Error getting url {url}: still failing after {attempts} attempts "
+            f"({response.status_code}, {response.reason})"
+        )
+
+
+class RetryDeadlineExceeded(RetriesExhausted):
+    """Raised when waiting for another retry would run past the deadline."""
+
+
+def parse_retry_after(value):
+    """Returns the number of seconds a ``Retry-After`` header asks us to wait,
+    or None if it's missing or unparseable.  It's either a number of seconds,
+    or an HTTP date.
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0)
+
+
+def is_retry_later(response):
+    """AO3's rate limiter sometimes replies with a bare "Retry later" page."""
+    if not getattr(response, "_content_consumed", True):
+        # A streamed download: reading .text would pull the whole body into
+        # memory, so only look at it if it's tiny.
+        length = response.headers.get("Content-Length", "")
+        if not length.isdigit() or int(length) >= 20:
+            return False
+    return len(response.text) < 20 and "Retry later" in response.text
+
+
+def _close(response):
+    close = getattr(response, "close", None)
+    if close is not None:
+        close()
+
+
+class RetryPolicy(object):
+    """Retry with exponential backoff and full jitter.
+
+    :param max_attempts: the most times a request is sent, including the
+        first try.
+    :param base_delay: the backoff before the first retry is drawn from
+        [0, base_delay] seconds; the upper bound doubles with every retry...
+    :param max_delay: ...up to this many seconds.
+    :param deadline: if given, give up rather than wait past this many seconds
+        after the first attempt.
+    :param respect_retry_after: wait as long as a ``Retry-After`` header asks
+        (even beyond ``max_delay``), instead of using the backoff.
+    """
+
+    def __init__(
+        self,
+        max_attempts=10,
+        base_delay=5,
+        max_delay=300,
+        deadline=None,
+        respect_retry_after=True,
+        retry_statuses=RETRY_STATUSES,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.respect_retry_after = respect_retry_after
+        self.retry_statuses = retry_statuses
+
+    def __repr__(self):
+        return (
+            f"{type(self).__name__}(max_attempts={self.max_attempts!r}, "
+            f"base_delay={self.base_delay!r}, max_delay={self.max_delay!r}, "
+            f"deadline={self.deadline!r})"
+        )
+
+    def should_retry(self, response):
+        return response.status_code in self.retry_statuses or is_retry_later(
+            response
+        )
+
+    def backoff(self, attempt):
+        """A random delay before retry number ``attempt`` (starting at 1)."""
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(0, ceiling)
+
+    def delay(self, attempt, response):
+        """How long to wait before retry number ``attempt``."""
+        if self.respect_retry_after:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                return retry_after
+        return self.backoff(attempt)
+
+    def _next_delay(self, url, attempt, response, started):
+        """How long to wait before trying ``url`` again, or raise if we
+        shouldn't.
+        """
+        if attempt >= self.max_attempts:
+            raise RetriesExhausted(url, attempt, response)
+
+        delay = self.delay(attempt, response)
+        elapsed = time.monotonic() - started
+        if self.deadline is not None and elapsed + delay > self.deadline:
+            raise RetryDeadlineExceeded(url, attempt, response)
+
+        print(
+            f"Got {response.status_code} for {url}... "
+            f"waiting {delay:.1f} seconds and trying again"
+        )
+        return delay
+
+    def send(self, session, url, **kwargs):
+        """Send ``session.get(url)``, retrying until it succeeds, the request
+        fails in a way that isn't worth retrying, or we run out of attempts.
+        """
+        started = time.monotonic()
+        attempt = 0
+
+        while True:
+            response = session.get(url, **kwargs)
+            attempt += 1
+
+            if not self.should_retry(response):
+                return response
+            try:
+                delay = self._next_delay(url, attempt, response, started)
+            finally:
+                # We're done with it, so let its connection go (and, if it
+                # was streamed, its place in an AdaptiveLimiter).
+                _close(response)
+            time.sleep(delay)
+
+    async def asend(self, session, url, **kwargs):
+        """Like send(), but with ``await session.aget(url)``."""
+        import asyncio
+
+        started = time.monotonic()
+        attempt = 0
+
+        while True:
+            response = await session.aget(url, **kwargs)
+            attempt += 1
+
+            if not self.should_retry(response):
+                return response
+            await asyncio.sleep(self._next_delay(url, attempt, response, started))
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
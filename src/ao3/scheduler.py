@@ -0,0 +1,288 @@
+# -*- encoding: utf-8
+"""A scheduler that shares the request budget between everything in a process.
+
+Without one, every loop that fetches pages competes for the same rate limit,
+and whichever starts first (usually a long crawl) gets all of it.  With a
+Scheduler on the session, every request is queued as a job instead:
+
+* jobs in a higher-priority lane (lower number) always go first, so
+  interactive lookups aren't stuck behind a crawl;
+* within a lane, jobs are taken round-robin from each owner (e.g. each user
+  whose bookmarks are being crawled), so one big crawl can't starve another;
+* a URL that's already queued isn't queued twice;
+* if a ``queue_path`` is given, queued jobs are recorded in SQLite, and a
+  restarted process can pick up where the last one left off.
+
+Use it by passing one to AO3:
+
+    >>> api = AO3(scheduler=Scheduler(workers=2, queue_path="jobs.sqlite"))
+"""
+
+import collections
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from .singleflight import normalize_url
+from .utils import (
+    DEFAULT_REQUEST_INTERVAL,
+    PRIORITY_BACKGROUND,
+    RateLimiter,
+    send_with_retries,
+)
+
+DEFAULT_WORKERS = 2
+
+
+class _Job(object):
+    def __init__(self, key, session, url, priority, owner):
+        self.key = key
+        self.session = session
+        self.url = url
+        self.priority = priority
+        self.owner = owner
+        self.future = Future()
+        self.queued_at = time.monotonic()
+
+
+class _JobQueue(object):
+    """A SQLite table of queued jobs, so they survive a restart.
+
+    Rows are keyed on the normalized URL alone: sessions don't outlive the
+    process, so a job resumed with a new one must replace the old row.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    key TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    priority INTEGER NOT NULL,
+                    owner TEXT,
+                    queued_at REAL NOT NULL
+                )
+                """
+            )
+
+    def add(self, job):
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?)",
+                (
+                    normalize_url(job.url),
+                    job.url,
+                    job.priority,
+                    job.owner,
+                    time.time(),
+                ),
+            )
+
+    def remove(self, job):
+        with self._conn:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE key = ?", (normalize_url(job.url),)
+            )
+
+    def pending(self):
+        return self._conn.execute(
+            "SELECT url, priority, owner FROM jobs ORDER BY priority, queued_at"
+        ).fetchall()
+
+    def close(self):
+        self._conn.close()
+
+
+class Scheduler(object):
+    """Sends queued requests in priority order, fairly, within a rate limit.
+
+    :param workers: how many requests may be in flight at once.  The rate
+        limit still applies; extra workers only help when responses are slow
+        compared to ``request_interval``.
+    :param request_interval: the minimum number of seconds between requests.
+    :param rate_limiter: a RateLimiter to use instead of ``request_interval``,
+        e.g. the AdaptiveLimiter (see ao3.adaptive) your session has.
+    :param queue_path: if given, the path of a SQLite file recording the jobs
+        that are queued but not yet finished.
+    """
+
+    def __init__(
+        self,
+        workers=DEFAULT_WORKERS,
+        request_interval=DEFAULT_REQUEST_INTERVAL,
+        queue_path=None,
+        rate_limiter=None,
+    ):
+        self.workers = workers
+        self.rate_limiter = rate_limiter or RateLimiter(request_interval)
+        self._queue = _JobQueue(queue_path) if queue_path is not None else None
+
+        self._lock = threading.Condition()
+        # priority -> owner -> deque of jobs
+        self._lanes = collections.defaultdict(collections.OrderedDict)
+        self._queued = {}
+        self._threads = []
+        self._closed = False
+
+        self._completed = collections.Counter()
+        self._waited = collections.Counter()
+
+    def __repr__(self):
+        return f"{type(self).__name__}(workers={self.workers!r})"
+
+    def submit(self, session, url, priority=PRIORITY_BACKGROUND, owner=None):
+        """Queue a request for ``url``, and return a Future for the response.
+
+        If the URL is already queued, you get the Future for that job; it's
+        moved to the higher of the two priorities.
+        """
+        key = f"{id(session)} {normalize_url(url)}"
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Cannot submit jobs to a closed Scheduler")
+            self._start_workers()
+
+            job = self._queued.get(key)
+            if job is not None:
+                if priority < job.priority:
+                    lane = self._lanes[job.priority]
+                    lane[job.owner].remove(job)
+                    if not lane[job.owner]:
+                        del lane[job.owner]
+                    job.priority = priority
+                    self._enqueue(job)
+                return job.future
+
+            job = _Job(key, session, url, priority, owner)
+            self._queued[key] = job
+            self._enqueue(job)
+            if self._queue is not None:
+                self._queue.add(job)
+            return job.future
+
+    def fetch(self, session, url, priority=PRIORITY_BACKGROUND, owner=None):
+        """Queue a request, and wait for its response."""
+        return self.submit(session, url, priority=priority, owner=owner).result()
+
+    def pending(self):
+        """Returns (url, priority, owner) for every job left in the persistent
+        queue, e.g. by a process that was interrupted.
+        """
+        if self._queue is None:
+            return []
+        with self._lock:
+            return self._queue.pending()
+
+    def resume(self, session):
+        """Re-queue the jobs left in the persistent queue.
+
+        Returns a dict of url -> Future.
+        """
+        return {
+            url: self.submit(session, url, priority=priority, owner=owner)
+            for url, priority, owner in self.pending()
+        }
+
+    def _enqueue(self, job):
+        lane = self._lanes[job.priority]
+        lane.setdefault(job.owner, collections.deque()).append(job)
+        self._lock.notify()
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _has_jobs(self):
+        return any(self._lanes.values())
+
+    def _next_job(self):
+        """Take the next job: the highest-priority lane, round-robin by owner."""
+        for priority in sorted(self._lanes):
+            lane = self._lanes[priority]
+            if not lane:
+                continue
+            owner, jobs = lane.popitem(last=False)
+            job = jobs.popleft()
+            if jobs:
+                # Back of the line for this owner's remaining jobs.
+                lane[owner] = jobs
+            del self._queued[job.key]
+            return job
+        return None
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while not self._has_jobs() and not self._closed:
+                    self._lock.wait()
+                if self._closed:
+                    return
+
+            # Wait for our slot *before* choosing a job, so that anything
+            # urgent submitted in the meantime still goes first.
+            self.rate_limiter.wait()
+
+            with self._lock:
+                job = self._next_job()
+            if job is None:
+                continue
+
+            self._run(job)
+
+    def _run(self, job):
+        started = time.monotonic()
+        try:
+            response = send_with_retries(job.session, job.url)
+        except BaseException as err:
+            job.future.set_exception(err)
+        else:
+            job.future.set_result(response)
+
+        with self._lock:
+            self._completed[job.priority] += 1
+            self._waited[job.priority] += started - job.queued_at
+            if self._queue is not None:
+                self._queue.remove(job)
+
+    def stats(self):
+        """Returns, for each priority, the number of queued and completed jobs
+        and the mean time (in seconds) jobs waited before they were sent.
+        """
+        with self._lock:
+            priorities = set(self._completed) | set(self._lanes)
+            return {
+                priority: {
+                    "queued": sum(len(jobs) for jobs in self._lanes[priority].values()),
+                    "completed": self._completed[priority],
+                    "mean_wait": (
+                        self._waited[priority] / self._completed[priority]
+                        if self._completed[priority]
+                        else 0
+                    ),
+                }
+                for priority in sorted(priorities)
+            }
+
+    def close(self):
+        """Stop the workers.  Jobs still queued are cancelled, but stay in the
+        persistent queue.
+        """
+        with self._lock:
+            self._closed = True
+            for lane in self._lanes.values():
+                for jobs in lane.values():
+                    for job in jobs:
+                        job.future.cancel()
+            self._lanes.clear()
+            self._queued.clear()
+            self._lock.notify_all()
+        for thread in self._threads:
+            thread.join()
+        if self._queue is not None:
+            self._queue.close()
@@ -0,0 +1,153 @@
+# -*- encoding: utf-8
+"""Searching AO3's works.
+
+Rather than fetching every candidate work and checking its tags and stats
+ourselves, we ask AO3's own work search to do the filtering, and read the
+matching works 20 at a time from the result listing.
+"""
+
+import collections
+import datetime
+from urllib.parse import urlencode
+
+from .utils import (
+    BASE_URL,
+    DATE_UPDATED,
+    TYPE_WORKS,
+    get_ids_and_dates_from_page,
+    iter_pages,
+)
+
+# The IDs AO3 uses for its ratings in search queries.
+RATINGS = {
+    "Not Rated": 9,
+    "General Audiences": 10,
+    "Teen And Up Audiences": 11,
+    "Mature": 12,
+    "Explicit": 13,
+}
+
+# Friendly names for the columns search results can be sorted by.
+SORT_COLUMNS = {
+    "best_match": "_score",
+    "author": "authors_to_sort_on",
+    "title": "title_to_sort_on",
+    "posted": "created_at",
+    "updated": "revised_at",
+    "words": "word_count",
+    "hits": "hits",
+    "kudos": "kudos_count",
+    "comments": "comments_count",
+    "bookmarks": "bookmarks_count",
+}
+
+SearchResult = collections.namedtuple("SearchResult", ["work_id", "updated"])
+
+
+def _range(value):
+    """Turn a (min, max) pair into AO3's range syntax.
+
+    Either end may be None.  A string is passed through as-is, so you can use
+    anything AO3 understands, e.g. "<5000" or "> 2 weeks".
+    """
+    if value is None or isinstance(value, str):
+        return value
+    low, high = value
+    if low is not None and high is not None:
+        return f"{low}-{high}"
+    # AO3's one-sided ranges are exclusive; ours are inclusive like the above.
+    if low is not None:
+        return f">{low - 1}"
+    if high is not None:
+        return f"<{high + 1}"
+    return None
+
+
+def _date_range(value):
+    """Like _range(), for a (start, end) pair of dates."""
+    if value is None or isinstance(value, str):
+        return value
+    low, high = value
+    if low is not None and high is not None:
+        return f"{low.isoformat()} - {high.isoformat()}"
+    if low is not None:
+        return f"> {(low - datetime.timedelta(days=1)).isoformat()}"
+    if high is not None:
+        return f"< {(high + datetime.timedelta(days=1)).isoformat()}"
+    return None
+
+
+def search_url(
+    ao3_url=BASE_URL,
+    query=None,
+    title=None,
+    creators=None,
+    fandoms=(),
+    characters=(),
+    relationships=(),
+    tags=(),
+    rating=None,
+    words=None,
+    complete=None,
+    crossover=None,
+    language=None,
+    updated=None,
+    sort="best_match",
+    ascending=False,
+):
+    """Build the URL of an AO3 work search.
+
+    :param query: free text, in AO3's search syntax.
+    :param fandoms, characters, relationships, tags: lists of tag names that
+        every result must have.  ``tags`` are additional ("freeform") tags.
+    :param rating: a rating name, e.g. "Teen And Up Audiences".
+    :param words: a word count range: (min, max) with either end None, or a
+        string in AO3's own syntax like "<5000".
+    :param complete: True for complete works only, False for works in
+        progress only, None for both.
+    :param crossover: like ``complete``, for crossover works.
+    :param language: a language code, e.g. "en".
+    :param updated: a range of dates the work was last updated, as a
+        (start, end) pair of dates with either end None, or a string like
+        "< 2 weeks".
+    :param sort: one of the keys of SORT_COLUMNS.
+    """
+    params = [
+        ("work_search[query]", query),
+        ("work_search[title]", title),
+        ("work_search[creators]", creators),
+        ("work_search[fandom_names]", ",".join(fandoms)),
+        ("work_search[character_names]", ",".join(characters)),
+        ("work_search[relationship_names]", ",".join(relationships)),
+        ("work_search[freeform_names]", ",".join(tags)),
+        ("work_search[rating_ids]", rating and RATINGS[rating]),
+        ("work_search[word_count]", _range(words)),
+        ("work_search[revised_at]", _date_range(updated)),
+        ("work_search[language_id]", language),
+        ("work_search[sort_column]", SORT_COLUMNS[sort]),
+        ("work_search[sort_direction]", "asc" if ascending else "desc"),
+    ]
+    for name, flag in [("complete", complete), ("crossover", crossover)]:
+        if flag is not None:
+            params.append((f"work_search[{name}]", "T" if flag else "F"))
+
+    query_string = urlencode([(key, value) for key, value in params if value])
+    return f"{ao3_url}/works/search?{query_string}"
+
+
+def search(session, ao3_url=BASE_URL, max_count=None, **filters):
+    """Generates a SearchResult for each work matching the search.
+
+    ``filters`` are as for search_url().  Pages of results are fetched as
+    they're needed, so stopping early doesn't cost any extra requests.
+    """
+    url = search_url(ao3_url, **filters)
+    found = 0
+    for _, soup in iter_pages(url, session):
+        for id_type, work_id, date in get_ids_and_dates_from_page(soup, DATE_UPDATED):
+            if id_type != TYPE_WORKS:
+                continue
+            yield SearchResult(work_id, date)
+            found += 1
+            if max_count and found >= max_count:
+                return
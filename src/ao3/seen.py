@@ -0,0 +1,238 @@
+# -*- encoding: utf-8
+"""A compact set of work IDs, for deduplicating big crawls.
+
+A Python set of ID strings costs around 100 bytes per ID, so a crawl that
+has seen tens of millions of works needs gigabytes just to remember them.
+AO3's work IDs are integers, handed out in order, so they're dense: a
+bitmap with one bit per possible ID is 8 MB for every ID up to 64 million,
+however many of them you've seen.
+
+    >>> seen = SeenSet(path="seen.bits")
+    >>> seen.add("258626")
+    True
+    >>> "258626" in seen
+    True
+    >>> alice.bookmarks_ids(seen=seen)    # only works we haven't seen yet
+
+With a ``path``, the bitmap is a memory-mapped file: it's written as it
+changes, and the next SeenSet opened on the same file starts from it.
+
+Union, intersection and difference work on the whole bitmap at once, so
+comparing the works two users have bookmarked doesn't loop over IDs in
+Python:
+
+    >>> both = alice_seen & bob_seen
+"""
+
+import mmap
+import os
+import threading
+
+MAGIC = b"AO3SEEN\x01"
+
+# The bitmap grows in steps of at least this many bytes.
+GROWTH = 64 * 1024
+
+
+def _popcount(value):
+    try:
+        return value.bit_count()
+    except AttributeError:
+        # Before Python 3.10
+        return bin(value).count("1")
+
+
+def _to_int(work_id):
+    work_id = int(work_id)
+    if work_id < 0:
+        raise ValueError(f"Work IDs can't be negative: {work_id!r}")
+    return work_id
+
+
+class SeenSet(object):
+    """A set of work IDs (as ints or strings), kept as a bitmap.
+
+    :param ids: IDs to start with.
+    :param path: keep the bitmap in this file, memory-mapped.  It's created
+        if it doesn't exist.
+
+    A SeenSet is thread-safe, so one can be shared by several crawls.
+    """
+
+    def __init__(self, ids=(), path=None):
+        self.path = path
+        self._lock = threading.RLock()
+        self._file = None
+        if path is None:
+            self._offset = 0
+            self._bits = bytearray()
+        else:
+            self._open(path)
+        self._count = _popcount(self._as_int())
+        self.update(ids)
+
+    def _open(self, path):
+        if not os.path.exists(path) or not os.path.getsize(path):
+            with open(path, "wb") as outfile:
+                outfile.write(MAGIC)
+                outfile.write(bytes(GROWTH))
+
+        self._file = open(path, "r+b")
+        if self._file.read(len(MAGIC)) != MAGIC:
+            self._file.close()
+            raise ValueError(f"{path!r} is not a SeenSet file")
+        self._offset = len(MAGIC)
+        self._bits = mmap.mmap(self._file.fileno(), 0)
+
+    def __repr__(self):
+        return f"{type(self).__name__}(<{len(self)} IDs>, path={self.path!r})"
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def nbytes(self):
+        """The size of the bitmap, in bytes."""
+        return len(self._bits) - self._offset
+
+    def _grow(self, nbytes):
+        """Make room for at least ``nbytes`` bytes of bitmap."""
+        if nbytes <= self.nbytes:
+            return
+        nbytes = max(nbytes, 2 * self.nbytes, GROWTH)
+        nbytes += -nbytes % GROWTH
+        if self._file is None:
+            self._bits.extend(bytes(nbytes - self.nbytes))
+        else:
+            self._bits.flush()
+            self._bits.close()
+            self._file.truncate(self._offset + nbytes)
+            self._bits = mmap.mmap(self._file.fileno(), 0)
+
+    def _as_int(self):
+        return int.from_bytes(self._bits[self._offset :], "little")
+
+    def _set_int(self, value):
+        nbytes = (value.bit_length() + 7) // 8
+        self._grow(nbytes)
+        self._bits[self._offset :] = value.to_bytes(self.nbytes, "little")
+        self._count = _popcount(value)
+
+    @classmethod
+    def _from_int(cls, value):
+        seen = cls()
+        seen._set_int(value)
+        return seen
+
+    def add(self, work_id):
+        """Add a work ID.  Returns True if it wasn't already in the set."""
+        byte, bit = divmod(_to_int(work_id), 8)
+        mask = 1 << bit
+        with self._lock:
+            self._grow(byte + 1)
+            i = self._offset + byte
+            if self._bits[i] & mask:
+                return False
+            self._bits[i] |= mask
+            self._count += 1
+            return True
+
+    def discard(self, work_id):
+        byte, bit = divmod(_to_int(work_id), 8)
+        mask = 1 << bit
+        with self._lock:
+            if byte < self.nbytes and self._bits[self._offset + byte] & mask:
+                self._bits[self._offset + byte] &= ~mask & 0xFF
+                self._count -= 1
+
+    def __contains__(self, work_id):
+        try:
+            byte, bit = divmod(_to_int(work_id), 8)
+        except ValueError:
+            return False
+        with self._lock:
+            if byte >= self.nbytes:
+                return False
+            return bool(self._bits[self._offset + byte] & (1 << bit))
+
+    def __iter__(self):
+        """Generates the IDs in the set as ints, smallest first."""
+        with self._lock:
+            bits = bytes(self._bits[self._offset :])
+        for byte, value in enumerate(bits):
+            if value:
+                for bit in range(8):
+                    if value & (1 << bit):
+                        yield byte * 8 + bit
+
+    def update(self, ids):
+        """Add many IDs, or everything in another SeenSet."""
+        if isinstance(ids, SeenSet):
+            other = ids._snapshot()
+            with self._lock:
+                self._set_int(self._as_int() | other)
+            return
+        with self._lock:
+            for work_id in ids:
+                self.add(work_id)
+
+    def intersection_update(self, other):
+        other = other._snapshot()
+        with self._lock:
+            self._set_int(self._as_int() & other)
+
+    def difference_update(self, other):
+        other = other._snapshot()
+        with self._lock:
+            self._set_int(self._as_int() & ~other)
+
+    def _snapshot(self):
+        with self._lock:
+            return self._as_int()
+
+    def union(self, other):
+        return SeenSet._from_int(self._snapshot() | other._snapshot())
+
+    def intersection(self, other):
+        return SeenSet._from_int(self._snapshot() & other._snapshot())
+
+    def difference(self, other):
+        return SeenSet._from_int(self._snapshot() & ~other._snapshot())
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __iand__(self, other):
+        self.intersection_update(other)
+        return self
+
+    def __isub__(self, other):
+        self.difference_update(other)
+        return self
+
+    def save(self, path=None):
+        """Write the set to ``path``, or if it's file-backed, make sure its
+        file is up to date.
+        """
+        with self._lock:
+            if path is None:
+                if self._file is not None:
+                    self._bits.flush()
+                return
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as outfile:
+                outfile.write(MAGIC)
+                outfile.write(self._bits[self._offset :])
+            os.replace(tmp_path, path)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._bits.flush()
+                self._bits.close()
+                self._file.close()
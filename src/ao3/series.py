@@ -1,7 +1,18 @@
 # -*- encoding: utf-8
-from bs4 import BeautifulSoup
+import json
+import os
+import threading
+import time
 
-from .utils import DATE_UPDATED, get_list_of_work_ids, get_with_timeout
+from .utils import (
+    DATE_UPDATED,
+    PRIORITY_INTERACTIVE,
+    get_list_of_work_ids,
+    get_soup,
+)
+
+# How long a series' list of works is trusted before we fetch it again.
+DEFAULT_SERIES_MEMO_TTL = 24 * 60 * 60
 
 
 class Series(object):
@@ -13,18 +24,19 @@ class Series(object):
         self.ao3_url = ao3_url
         self.url = f"{self.ao3_url}/series/{self.id}"
 
-    def work_ids(self, max_count=0, oldest_date=None):
+    def work_ids(self, max_count=0, oldest_date=None, seen=None):
         return get_list_of_work_ids(
             self.url,
             self.session,
             max_count=max_count,
             oldest_date=oldest_date,
             date_type=DATE_UPDATED,
+            owner=self.url,
+            seen=seen,
         )
 
     def info(self):
-        req = get_with_timeout(self.session, self.url)
-        soup = BeautifulSoup(req.text, features="html.parser")
+        soup = get_soup(self.session, self.url, priority=PRIORITY_INTERACTIVE)
 
         info = {"Title": soup.h2.text.strip()}
 
@@ -37,3 +49,49 @@ class Series(object):
                 info[keys[i]] = values[i]
 
         return info
+
+
+class SeriesMemo(object):
+    """Remembers the work IDs in each series we've already expanded.
+
+    Share one SeriesMemo between crawls (e.g. the bookmarks of several users)
+    so a series is only paginated once.  Entries older than ``ttl`` seconds
+    are ignored and fetched again.  If ``path`` is given, the memo is loaded
+    from that JSON file, and save() writes it back, so it can outlive the
+    process.
+    """
+
+    def __init__(self, path=None, ttl=DEFAULT_SERIES_MEMO_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+
+        if path is not None and os.path.exists(path):
+            with open(path, encoding="utf-8") as infile:
+                self._entries = json.load(infile)
+
+    def __repr__(self):
+        return f"{type(self).__name__}(path={self.path!r}, ttl={self.ttl!r})"
+
+    def get(self, series_id):
+        """Returns the work IDs of a series, or None if we don't know them."""
+        with self._lock:
+            entry = self._entries.get(series_id)
+        if entry is None:
+            return None
+        fetched_at, work_ids = entry
+        if time.time() - fetched_at > self.ttl:
+            return None
+        return work_ids
+
+    def put(self, series_id, work_ids):
+        with self._lock:
+            self._entries[series_id] = [time.time(), list(work_ids)]
+
+    def save(self):
+        if self.path is None:
+            return
+        with self._lock:
+            with open(self.path, "w", encoding="utf-8") as outfile:
+                json.dump(self._entries, outfile)
@@ -0,0 +1,191 @@
+# -*- encoding: utf-8
+"""The HTTP session shared by every object created from one AO3 instance."""
+
+import threading
+import time
+from urllib.parse import urlparse
+
+from .clearance import is_cloudflare_challenge
+from .retry import DEFAULT_RETRY_POLICY
+from .singleflight import SingleFlight
+from .transport import (
+    DEFAULT_POOL_CONNECTIONS,
+    DEFAULT_POOL_MAXSIZE,
+    CloudscraperTransport,
+)
+from .utils import DEFAULT_REQUEST_INTERVAL, RateLimiter
+
+
+class Session(object):
+    """A pooled, keep-alive HTTP session for talking to AO3.
+
+    This wraps a single transport (see ao3.transport), so the TLS handshake,
+    the connections and any Cloudflare clearance are paid for once and then
+    shared by every Work, User, Series, Collection and Comments object that
+    uses it.  By default that's a cloudscraper session.
+
+    :param pool_connections: the number of per-host connection pools to cache.
+    :param pool_maxsize: the maximum number of keep-alive connections to hold
+        open per host.  Raise this if you fetch from several threads at once.
+    :param pool_block: if True, threads wait for a free connection instead of
+        opening (and then discarding) connections beyond ``pool_maxsize``.
+    :param request_interval: the minimum number of seconds between the start
+        of one request and the next, across all threads using this session.
+    :param retry_policy: the RetryPolicy that decides how requests turned
+        away by AO3 or Cloudflare are retried.
+    :param scheduler: an optional Scheduler.  If given, requests are queued
+        there rather than sent directly, and ``request_interval`` is ignored
+        in favour of the scheduler's own.
+    :param clearance_store: an optional ClearanceStore.  Cloudflare clearance
+        is saved to it whenever it changes, and dropped from it as soon as
+        Cloudflare rejects it.
+    :param transport: send requests with this transport instead of a new
+        CloudscraperTransport, e.g. an HttpxTransport to multiplex them over
+        HTTP/2.  The pool arguments only apply to the default transport.
+    :param limiter: an AdaptiveLimiter (see ao3.adaptive).  If given, it sets
+        the pace instead of ``request_interval``, limits how many requests
+        are in flight, and learns from every response.  If you use a
+        scheduler too, give it the same limiter.
+
+    A Session can be shared between threads.
+    """
+
+    def __init__(
+        self,
+        pool_connections=DEFAULT_POOL_CONNECTIONS,
+        pool_maxsize=DEFAULT_POOL_MAXSIZE,
+        pool_block=False,
+        request_interval=DEFAULT_REQUEST_INTERVAL,
+        retry_policy=DEFAULT_RETRY_POLICY,
+        scheduler=None,
+        clearance_store=None,
+        transport=None,
+        limiter=None,
+    ):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.clearance_store = clearance_store
+        self.limiter = limiter
+        self.rate_limiter = limiter or RateLimiter(request_interval)
+        self.single_flight = SingleFlight()
+        self.retry_policy = retry_policy
+        self.scheduler = scheduler
+
+        if transport is None:
+            transport = CloudscraperTransport(
+                pool_connections=pool_connections,
+                pool_maxsize=pool_maxsize,
+                pool_block=pool_block,
+            )
+        self.transport = transport
+
+        self._lock = threading.Lock()
+        self._requests = 0
+
+        if clearance_store is not None:
+            self.transport.add_response_hook(self._track_clearance)
+
+    def __repr__(self):
+        return f"{type(self).__name__}(transport={self.transport!r})"
+
+    @property
+    def scraper(self):
+        """The cloudscraper session, if that's the transport."""
+        return getattr(self.transport, "scraper", None)
+
+    @property
+    def cookies(self):
+        return self.transport.cookies
+
+    @cookies.setter
+    def cookies(self, jar):
+        self.transport.cookies = jar
+        # Pages fetched with the old cookies may not be what we'd see now.
+        self.single_flight.clear()
+
+    @property
+    def headers(self):
+        return self.transport.headers
+
+    def get(self, url, stream=False, headers=None):
+        with self._lock:
+            self._requests += 1
+        if self.limiter is not None:
+            return self.limiter.call(
+                lambda: self.transport.get(url, stream=stream, headers=headers),
+                stream=stream,
+            )
+        return self.transport.get(url, stream=stream, headers=headers)
+
+    async def aget(self, url, headers=None):
+        """Send a request from asyncio code, if the transport can (see
+        HttpxTransport).  Like get(), this doesn't wait for the rate limiter
+        or retry; see ao3.utils.aget_with_timeout for that.
+
+        An AdaptiveLimiter learns from these responses too, but doesn't hold
+        them back when there are too many in flight.
+        """
+        if not hasattr(self.transport, "aget"):
+            raise TypeError(f"{self.transport!r} doesn't support asyncio")
+        with self._lock:
+            self._requests += 1
+        started = time.monotonic()
+        try:
+            response = await self.transport.aget(url, headers=headers)
+        except Exception:
+            if self.limiter is not None:
+                self.limiter.record(time.monotonic() - started, error=True)
+            raise
+        if self.limiter is not None:
+            self.limiter.record(time.monotonic() - started, response)
+        return response
+
+    def _track_clearance(self, response, stream=False):
+        domain = urlparse(response.url).hostname
+        if is_cloudflare_challenge(response, check_body=not stream):
+            self.clearance_store.clear(self, domain)
+        elif response.status_code < 400:
+            self.clearance_store.save(self, domain)
+
+    def stats(self):
+        """Returns a dict describing how well connections are being reused.
+
+        ``connections`` is the number of TCP/TLS connections opened so far,
+        and ``reused`` is the number of requests that went over a connection
+        that was already open (over HTTP/2, that includes requests sent at
+        the same time as others).  ``coalesced`` is the number of requests
+        that were never sent, because an identical request was already in
+        flight.  With an AdaptiveLimiter, ``limiter`` has its metrics().
+        """
+        transport_stats = self.transport.stats()
+        connections = transport_stats["connections"]
+        stats = {
+            "requests": self._requests,
+            "connections": connections,
+            "reused": max(transport_stats["requests"] - connections, 0),
+            "coalesced": self.single_flight.saved,
+        }
+        if self.limiter is not None:
+            stats["limiter"] = self.limiter.metrics()
+        return stats
+
+    def close(self):
+        self.transport.close()
+
+
+_default_session = None
+_default_session_lock = threading.Lock()
+
+
+def default_session():
+    """Returns the Session used by objects that weren't given one explicitly.
+
+    It's created the first time it's needed, and then shared, so standalone
+    Work and Comments objects don't each open their own connections.
+    """
+    global _default_session
+    with _default_session_lock:
+        if _default_session is None:
+            _default_session = Session()
+        return _default_session
@@ -0,0 +1,161 @@
+# -*- encoding: utf-8
+"""Coalesce duplicate requests so they share one network call.
+
+The same page is often asked for twice in quick succession: Series.info()
+and Series.work_ids() both load page 1 of a series, and concurrent crawls of
+different users' bookmarks run into the same series.  A SingleFlight makes
+the second caller wait for (or reuse) the first caller's response instead of
+making a request of its own.
+"""
+
+import collections
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+# How long a finished response can still be handed to a caller who asks
+# for the same URL.  Long enough to cover back-to-back calls like
+# Series.info() then Series.work_ids(); short enough that nobody gets a
+# noticeably stale page.
+DEFAULT_WINDOW = 10
+
+
+def normalize_url(url):
+    """Returns a canonical form of ``url``, for spotting duplicate requests.
+
+    The scheme and host are lowercased, query parameters are sorted, the
+    fragment is dropped, and ``page=1`` is removed, since AO3 serves the first
+    page of a listing whether or not you ask for it.
+    """
+    parts = urlparse(url)
+    query = sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if (key, value) != ("page", "1")
+    )
+    return urlunparse(
+        (
+            parts.scheme.lower(),
+            parts.netloc.lower(),
+            parts.path,
+            parts.params,
+            urlencode(query),
+            "",
+        )
+    )
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.finished_at = None
+
+
+class SingleFlight(object):
+    """Runs at most one call per key at a time, and shares its result.
+
+    While a call for a key is running, anybody else asking for that key
+    waits for it and gets the same result (or the same exception).  A
+    successful result is also reused for ``window`` seconds afterwards, and
+    then let go of, whether or not anybody asks again.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._finished = collections.OrderedDict()
+        self._timer = None
+        self.calls = 0
+        self.saved = 0
+
+    def __repr__(self):
+        return f"{type(self).__name__}(window={self.window!r})"
+
+    def _forget_expired(self, now):
+        while self._finished:
+            key, call = next(iter(self._finished.items()))
+            if now - call.finished_at < self.window:
+                break
+            del self._finished[key]
+            del self._calls[key]
+
+    def _expire(self):
+        # Responses hold on to their parsed pages, so don't keep them until
+        # the next do() call: that might not come until the session is
+        # used again, long after a crawl has finished.
+        with self._lock:
+            if self._timer is not threading.current_thread():
+                return  # clear() has since replaced us.
+            self._timer = None
+            now = time.monotonic()
+            self._forget_expired(now)
+            if self._finished:
+                call = next(iter(self._finished.values()))
+                self._expire_after(call.finished_at + self.window - now)
+
+    def _expire_after(self, delay):
+        if self._timer is None:
+            self._timer = threading.Timer(delay, self._expire)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def do(self, key, func):
+        """Returns ``func()``, or the result of a matching call already made."""
+        with self._lock:
+            self._forget_expired(time.monotonic())
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+                leader = True
+            else:
+                self.saved += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except BaseException as err:
+            call.error = err
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            raise
+        finally:
+            call.done.set()
+
+        with self._lock:
+            # Unless clear() was called while we were busy.
+            if self._calls.get(key) is call:
+                if self.window > 0:
+                    call.finished_at = time.monotonic()
+                    self._finished[key] = call
+                    self._expire_after(self.window)
+                else:
+                    del self._calls[key]
+        return call.result
+
+    def clear(self):
+        """Forget every call, so the next caller for any key makes a new one.
+
+        Use this when the results would be different now, e.g. after logging
+        in.  Callers already waiting for a call still get its result.
+        """
+        with self._lock:
+            self._calls.clear()
+            self._finished.clear()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def stats(self):
+        """How many calls were made, and how many were saved by sharing."""
+        return {"calls": self.calls, "saved": self.saved}
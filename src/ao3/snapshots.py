@@ -0,0 +1,263 @@
+# -*- encoding: utf-8
+"""An append-only log of how works' stats change over time.
+
+Saving the whole of Work.json() every time you check a work repeats all the
+metadata that hasn't changed, which is nearly all of it.  A SnapshotStore
+only records the numbers in STATS, and only the ones that changed since the
+last snapshot of that work, as varint deltas:
+
+    work ID, seconds since its last snapshot, bitmask of changed stats,
+    change in each of those stats
+
+so a snapshot of a work where only the hits went up is a handful of bytes,
+and a work where nothing changed isn't written at all.
+
+Reading the log back builds, for each work, an array of times and an array
+for each stat, so a work's history over any range of time is a binary
+search and a slice.
+
+    >>> store = SnapshotStore("stats.log")
+    >>> store.record_work(api.work(id="258626"))
+    >>> store.history("258626", start=datetime(2020, 1, 1))
+    [Snapshot(when=datetime(...), words=4112, comments=14, kudos=1210, ...), ...]
+"""
+
+import array
+import bisect
+import collections
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from . import varint
+from .blurbs import parse_blurb
+from .store import work_record
+
+MAGIC = b"AO3SNAP\x01"
+
+STATS = ("words", "comments", "kudos", "bookmarks", "hits")
+
+Snapshot = collections.namedtuple("Snapshot", ("when",) + STATS)
+
+
+def _timestamp(when):
+    if when is None:
+        return int(time.time())
+    if isinstance(when, datetime):
+        return int(when.timestamp())
+    return int(when)
+
+
+class _WorkHistory(object):
+    __slots__ = ("times",) + STATS
+
+    def __init__(self):
+        self.times = array.array("q")
+        for name in STATS:
+            setattr(self, name, array.array("q"))
+
+    def last(self):
+        return [getattr(self, name)[-1] for name in STATS] if self.times else None
+
+    def append(self, when, values):
+        self.times.append(when)
+        for name, value in zip(STATS, values):
+            getattr(self, name).append(value)
+
+    def snapshot(self, i):
+        return Snapshot(
+            datetime.fromtimestamp(self.times[i], timezone.utc),
+            *(getattr(self, name)[i] for name in STATS),
+        )
+
+
+class SnapshotStore(object):
+    """Stats snapshots for many works, in an append-only file.
+
+    :param path: the log file.  It's created if it doesn't exist, and read
+        back if it does.  A record left half-written by a crash is dropped.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._works = {}
+        self._load()
+        self._file = open(self.path, "ab")
+
+    def __repr__(self):
+        return f"{type(self).__name__}(path={self.path!r})"
+
+    def __len__(self):
+        return len(self._works)
+
+    def __contains__(self, work_id):
+        return int(work_id) in self._works
+
+    def _load(self):
+        if not os.path.exists(self.path) or not os.path.getsize(self.path):
+            with open(self.path, "wb") as outfile:
+                outfile.write(MAGIC)
+            return
+
+        with open(self.path, "rb") as infile:
+            buf = infile.read()
+        if not buf.startswith(MAGIC):
+            raise ValueError(f"{self.path!r} is not a snapshot log")
+
+        pos = good = len(MAGIC)
+        try:
+            while pos < len(buf):
+                work_id, pos = varint.decode(buf, pos)
+                elapsed, pos = varint.decode(buf, pos)
+                changed, pos = varint.decode(buf, pos)
+                deltas = [0] * len(STATS)
+                for i in range(len(STATS)):
+                    if changed & (1 << i):
+                        deltas[i], pos = varint.decode_signed(buf, pos)
+
+                # Only now that the whole record has been read can it go in
+                # the histories.
+                history = self._works.get(work_id)
+                if history is None:
+                    history = self._works[work_id] = _WorkHistory()
+                    when, values = elapsed, [0] * len(STATS)
+                else:
+                    when, values = history.times[-1] + elapsed, history.last()
+                history.append(when, [v + d for v, d in zip(values, deltas)])
+                good = pos
+        except ValueError:
+            # The last record was cut short; throw it away.
+            with open(self.path, "r+b") as outfile:
+                outfile.truncate(good)
+
+    def _encode(self, work_id, when, values, out):
+        history = self._works.get(work_id)
+        if history is None:
+            history = self._works[work_id] = _WorkHistory()
+            elapsed, previous = when, [0] * len(STATS)
+        else:
+            last_time = history.times[-1]
+            if when < last_time:
+                raise ValueError(
+                    f"Snapshot of work {work_id} is older than its last snapshot"
+                )
+            previous = history.last()
+            if values == previous:
+                return False
+            elapsed = when - last_time
+
+        changed = 0
+        for i, (new, old) in enumerate(zip(values, previous)):
+            if new != old:
+                changed |= 1 << i
+
+        varint.encode(work_id, out)
+        varint.encode(elapsed, out)
+        varint.encode(changed, out)
+        for i, (new, old) in enumerate(zip(values, previous)):
+            if changed & (1 << i):
+                varint.encode_signed(new - old, out)
+        history.append(when, values)
+        return True
+
+    def record_many(self, snapshots, when=None):
+        """Record many (work ID, stats) snapshots in one write, where stats is
+        a dict with the keys in STATS.  Returns how many were written: a work
+        whose stats haven't changed since its last snapshot is skipped.
+        """
+        when = _timestamp(when)
+        out = bytearray()
+        written = 0
+        with self._lock:
+            try:
+                for work_id, stats in snapshots:
+                    values = [int(stats.get(name) or 0) for name in STATS]
+                    if self._encode(int(work_id), when, values, out):
+                        written += 1
+            finally:
+                # Whatever we've added to the histories has to be in the log.
+                self._file.write(out)
+                self._file.flush()
+        return written
+
+    def record(self, work_id, stats, when=None):
+        """Record one work's stats.  Returns True if they were written."""
+        return self.record_many([(work_id, stats)], when) == 1
+
+    def record_works(self, works, when=None):
+        """Record the stats of Works, or dicts in the shape of Work.json()."""
+        records = (work_record(work) for work in works)
+        return self.record_many(
+            ((record["id"], record["stats"]) for record in records), when
+        )
+
+    def record_work(self, work, when=None):
+        return self.record_works([work], when) == 1
+
+    def record_blurbs(self, li_tags, when=None):
+        """Record the stats shown in work blurbs on listing pages, so you can
+        track a whole tag or a user's works without fetching each one.
+        """
+
+        def snapshots():
+            for li_tag in li_tags:
+                blurb = parse_blurb(li_tag)
+                if blurb.work_id is None:
+                    continue
+                yield blurb.work_id, {name: getattr(blurb, name) for name in STATS}
+
+        return self.record_many(snapshots(), when)
+
+    def _range(self, history, start, end):
+        lo = (
+            0 if start is None else bisect.bisect_left(history.times, _timestamp(start))
+        )
+        hi = (
+            len(history.times)
+            if end is None
+            else bisect.bisect_right(history.times, _timestamp(end))
+        )
+        return lo, hi
+
+    def history(self, work_id, start=None, end=None):
+        """Returns the Snapshots of a work between ``start`` and ``end``
+        (datetimes or Unix times, both inclusive), oldest first.
+        """
+        with self._lock:
+            history = self._works.get(int(work_id))
+            if history is None:
+                return []
+            lo, hi = self._range(history, start, end)
+            return [history.snapshot(i) for i in range(lo, hi)]
+
+    def latest(self, work_id):
+        """Returns the most recent Snapshot of a work, or None."""
+        with self._lock:
+            history = self._works.get(int(work_id))
+            if history is None or not history.times:
+                return None
+            return history.snapshot(len(history.times) - 1)
+
+    def downsample(self, work_id, interval, start=None, end=None):
+        """Returns the last Snapshot in each ``interval`` seconds (e.g. 86400
+        for daily) between ``start`` and ``end``, for drawing a growth curve
+        without every point.
+        """
+        with self._lock:
+            history = self._works.get(int(work_id))
+            if history is None:
+                return []
+            lo, hi = self._range(history, start, end)
+            points = []
+            for i in range(lo, hi):
+                bucket = history.times[i] // interval
+                if i + 1 < hi and history.times[i + 1] // interval == bucket:
+                    continue
+                points.append(history.snapshot(i))
+            return points
+
+    def close(self):
+        with self._lock:
+            self._file.close()
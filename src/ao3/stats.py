@@ -0,0 +1,300 @@
+# -*- encoding: utf-8
+"""Vectorised statistics over many works, using NumPy.
+
+Summing kudos or finding the median word count across a reading history of
+thousands of works is slow if every step is a Python loop over Work objects
+and a string-to-int cast.  A WorkStatsFrame collects the stats once into
+typed NumPy arrays (one per column), and does its filters and aggregates on
+the whole array at once:
+
+    >>> frame = WorkStatsFrame.from_reading_history(api.user.reading_history())
+    >>> long_works = frame.where(words=(50000, None))
+    >>> long_works.percentiles("kudos")
+    {25: 40.0, 50: 120.0, 75: 410.0, 90: 1210.0, 99: 6020.0}
+    >>> long_works.group_by_fandom("kudos")[:2]
+    [FandomSummary(fandom='Star Wars', works=120, total=51000, mean=425.0), ...]
+
+This needs NumPy (``pip install ao3[stats]``), and to_arrow() needs pyarrow.
+"""
+
+import collections
+from datetime import datetime
+
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError(
+        "ao3.stats needs NumPy; install it with 'pip install ao3[stats]'"
+    ) from None
+
+from .blurbs import parse_blurb
+from .store import work_record
+from .utils import AO3_DATE_FORMAT
+
+INT_COLUMNS = ["work_id", "words", "chapters", "comments", "kudos", "bookmarks", "hits"]
+DATE_COLUMNS = ["published", "updated"]
+COLUMNS = INT_COLUMNS + DATE_COLUMNS
+
+DEFAULT_PERCENTILES = (25, 50, 75, 90, 99)
+
+FandomSummary = collections.namedtuple(
+    "FandomSummary", ["fandom", "works", "total", "mean"]
+)
+
+
+def _to_int(value):
+    """Turn '1,234', 1234 or None into an int (None counts as 0)."""
+    if value is None:
+        return 0
+    if isinstance(value, int):
+        return value
+    value = str(value).replace(",", "").strip()
+    return int(value) if value else 0
+
+
+def _to_date(value):
+    """Turn a date, 'YYYY-MM-DD' or AO3's '24 Dec 2012' into a NumPy date."""
+    if value is None or value == "":
+        return np.datetime64("NaT", "D")
+    if isinstance(value, str) and not value[:4].isdigit():
+        value = datetime.strptime(value, AO3_DATE_FORMAT).date()
+    return np.datetime64(str(value)[:10], "D")
+
+
+def _posted_chapters(value):
+    # "3/5", "3/?" -> 3
+    if value is None or isinstance(value, int):
+        return value or 0
+    return _to_int(str(value).split("/")[0])
+
+
+class WorkStatsFrame(object):
+    """Columns of work stats as NumPy arrays.
+
+    Every column in COLUMNS has one entry per work: ints for the counts, and
+    ``datetime64[D]`` for the dates (NaT where we don't know the date).  A
+    work can be in several fandoms, so they're kept separately, as parallel
+    arrays of (row, fandom code) pairs.
+    """
+
+    def __init__(self, columns, fandom_rows, fandom_codes, fandom_names):
+        self._columns = columns
+        self._fandom_rows = fandom_rows
+        self._fandom_codes = fandom_codes
+        self.fandom_names = fandom_names
+
+    def __repr__(self):
+        return f"<{type(self).__name__} works={len(self)}>"
+
+    def __len__(self):
+        return len(self._columns["work_id"])
+
+    def __getitem__(self, key):
+        """``frame["kudos"]`` is a column; ``frame[mask]`` is the frame with
+        only the rows where the boolean array ``mask`` is true.
+        """
+        if isinstance(key, str):
+            return self._columns[key]
+        return self.filter(key)
+
+    @classmethod
+    def from_records(cls, records):
+        """Build a frame from dicts with some of the keys in COLUMNS, plus
+        ``fandoms`` (a list of names).  Missing counts are 0, and missing
+        dates are NaT.
+        """
+        values = {name: [] for name in COLUMNS}
+        fandom_rows = []
+        fandom_codes = []
+        fandom_numbers = {}
+
+        for row, record in enumerate(records):
+            for name in INT_COLUMNS:
+                values[name].append(_to_int(record.get(name)))
+            for name in DATE_COLUMNS:
+                values[name].append(_to_date(record.get(name)))
+            for fandom in record.get("fandoms") or []:
+                code = fandom_numbers.setdefault(fandom, len(fandom_numbers))
+                fandom_rows.append(row)
+                fandom_codes.append(code)
+
+        columns = {name: np.array(values[name], dtype=np.int64) for name in INT_COLUMNS}
+        for name in DATE_COLUMNS:
+            columns[name] = np.array(values[name], dtype="datetime64[D]")
+        return cls(
+            columns,
+            np.array(fandom_rows, dtype=np.int64),
+            np.array(fandom_codes, dtype=np.int32),
+            list(fandom_numbers),
+        )
+
+    @classmethod
+    def from_works(cls, works):
+        """Build a frame from Works, or dicts in the shape of Work.json()."""
+
+        def records():
+            for work in works:
+                record = work_record(work)
+                stats = record.get("stats", {})
+                yield dict(
+                    stats,
+                    work_id=record["id"],
+                    fandoms=record.get("fandoms"),
+                    updated=stats.get("completed"),
+                )
+
+        return cls.from_records(records())
+
+    @classmethod
+    def from_blurbs(cls, li_tags):
+        """Build a frame from work blurbs on listing pages, e.g. from
+        ao3.utils.iter_pages(), so you don't have to fetch each work.
+
+        The stats in a blurb are of the form
+
+            <dl class="stats">
+              <dt>Words:</dt> <dd class="words">1,234</dd>
+              <dt>Chapters:</dt> <dd class="chapters"><a href="...">3</a>/5</dd>
+              <dt>Kudos:</dt> <dd class="kudos"><a href="...">56</a></dd>
+              ...
+            </dl>
+        """
+
+        def records():
+            for li_tag in li_tags:
+                blurb = parse_blurb(li_tag)
+                if blurb.work_id is None:
+                    continue
+                yield {
+                    "work_id": blurb.work_id,
+                    "words": blurb.words,
+                    "chapters": blurb.posted_chapters,
+                    "comments": blurb.comments,
+                    "kudos": blurb.kudos,
+                    "bookmarks": blurb.bookmarks,
+                    "hits": blurb.hits,
+                    "updated": blurb.updated,
+                    "fandoms": blurb.fandoms,
+                }
+
+        return cls.from_records(records())
+
+    @classmethod
+    def from_reading_history(cls, entries):
+        """Build a frame from the tuples generated by User.reading_history()."""
+
+        def records():
+            for entry in entries:
+                work_id, fandoms = entry[0], entry[5]
+                words, chapters, comments, kudos, bookmarks, hits, updated = entry[
+                    10:17
+                ]
+                yield {
+                    "work_id": work_id,
+                    "words": words,
+                    "chapters": _posted_chapters(chapters),
+                    "comments": comments,
+                    "kudos": kudos,
+                    "bookmarks": bookmarks,
+                    "hits": hits,
+                    "updated": updated,
+                    "fandoms": fandoms,
+                }
+
+        return cls.from_records(records())
+
+    def filter(self, mask):
+        """Returns a frame with the rows where ``mask`` is true."""
+        mask = np.asarray(mask, dtype=bool)
+        columns = {name: column[mask] for name, column in self._columns.items()}
+
+        keep = mask[self._fandom_rows]
+        # Where each kept row ends up in the new frame.
+        new_rows = np.cumsum(mask) - 1
+        return type(self)(
+            columns,
+            new_rows[self._fandom_rows[keep]],
+            self._fandom_codes[keep],
+            self.fandom_names,
+        )
+
+    def where(self, fandom=None, **ranges):
+        """Returns the rows in ``fandom`` (if given) and within every range.
+
+        Each of ``ranges`` is a column name and an inclusive (min, max) pair,
+        either end None, e.g. ``where(words=(50000, None))``.  Dates can be
+        given as dates or strings.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for name, (low, high) in ranges.items():
+            column = self._columns[name]
+            if name in DATE_COLUMNS:
+                low = _to_date(low) if low is not None else None
+                high = _to_date(high) if high is not None else None
+            if low is not None:
+                mask &= column >= low
+            if high is not None:
+                mask &= column <= high
+        if fandom is not None:
+            in_fandom = np.zeros(len(self), dtype=bool)
+            if fandom in self.fandom_names:
+                code = self.fandom_names.index(fandom)
+                in_fandom[self._fandom_rows[self._fandom_codes == code]] = True
+            mask &= in_fandom
+        return self.filter(mask)
+
+    def ratio(self, numerator, denominator):
+        """Returns numerator / denominator for every row, e.g. the ratio of
+        kudos to hits; NaN where the denominator is 0.
+        """
+        top = self._columns[numerator].astype(np.float64)
+        bottom = self._columns[denominator].astype(np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(bottom > 0, top / bottom, np.nan)
+
+    def percentiles(self, column, q=DEFAULT_PERCENTILES):
+        """Returns a dict of percentile -> value of a column."""
+        if not len(self):
+            return {p: None for p in q}
+        values = np.percentile(self._columns[column], q)
+        return {p: float(value) for p, value in zip(q, values)}
+
+    def group_by_fandom(self, column="kudos"):
+        """Returns a FandomSummary (number of works, total and mean of
+        ``column``) for each fandom, the biggest fandoms first.  A crossover
+        counts towards each of its fandoms.
+        """
+        size = len(self.fandom_names)
+        weights = self._columns[column][self._fandom_rows].astype(np.float64)
+        counts = np.bincount(self._fandom_codes, minlength=size)
+        totals = np.bincount(self._fandom_codes, weights=weights, minlength=size)
+
+        order = np.argsort(-counts, kind="stable")
+        return [
+            FandomSummary(
+                self.fandom_names[code],
+                int(counts[code]),
+                int(totals[code]),
+                float(totals[code] / counts[code]),
+            )
+            for code in order
+            if counts[code]
+        ]
+
+    def to_arrow(self):
+        """Returns the frame as a pyarrow Table.
+
+        The integer columns are shared with the NumPy arrays rather than
+        copied, and ``fandoms`` is a list of dictionary-encoded strings.
+        """
+        import pyarrow as pa
+
+        arrays = {name: pa.array(self._columns[name]) for name in COLUMNS}
+        offsets = np.searchsorted(self._fandom_rows, np.arange(len(self) + 1))
+        arrays["fandoms"] = pa.ListArray.from_arrays(
+            pa.array(offsets.astype(np.int32)),
+            pa.DictionaryArray.from_arrays(
+                pa.array(self._fandom_codes), pa.array(self.fandom_names, pa.string())
+            ),
+        )
+        return pa.table(arrays)
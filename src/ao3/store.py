@@ -0,0 +1,358 @@
+# -*- encoding: utf-8
+"""A local SQLite store of work metadata, for querying what you've crawled.
+
+Keeping a pile of Work.json() blobs means every question ("works in fandom X
+over 50,000 words with more than 1,000 kudos") is a scan over all of them in
+Python.  A WorkStore keeps the same data in normalised, indexed tables
+instead:
+
+* ``works``: one row per work, with its stats;
+* ``tags``: one row per (type, name), e.g. ("fandom", "Star Wars");
+* ``work_tags``: which works have which tags.
+
+so those questions become an indexed SQL query.
+
+    >>> store = WorkStore("works.sqlite")
+    >>> store.put_many(api.work(work_id) for work_id in work_ids)
+    >>> store.query(fandoms=["Star Wars"], words=(50000, None), kudos=(1000, None))
+    [258626, ...]
+"""
+
+import json
+import sqlite3
+import threading
+
+# The keys of Work.json() that hold lists of tags, and the tag type we store
+# them under.
+TAG_FIELDS = [
+    ("rating", "rating"),
+    ("warnings", "warning"),
+    ("category", "category"),
+    ("fandoms", "fandom"),
+    ("relationship", "relationship"),
+    ("characters", "character"),
+    ("additional_tags", "freeform"),
+]
+
+# Columns of the works table, in order.
+WORK_COLUMNS = [
+    "id",
+    "title",
+    "author",
+    "summary",
+    "language",
+    "collections",
+    "published",
+    "completed",
+    "words",
+    "comments",
+    "kudos",
+    "bookmarks",
+    "hits",
+]
+
+STAT_COLUMNS = ["words", "comments", "kudos", "bookmarks", "hits"]
+
+SORT_COLUMNS = ["id", "title", "author", "published", "completed"] + STAT_COLUMNS
+
+# How many works put_many() writes in each transaction.
+DEFAULT_BATCH_SIZE = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS works (
+    id INTEGER PRIMARY KEY,
+    title TEXT,
+    author TEXT,
+    summary TEXT,
+    language TEXT,
+    collections TEXT,
+    published TEXT,
+    completed TEXT,
+    words INTEGER,
+    comments INTEGER,
+    kudos INTEGER,
+    bookmarks INTEGER,
+    hits INTEGER
+);
+CREATE INDEX IF NOT EXISTS works_words ON works (words);
+CREATE INDEX IF NOT EXISTS works_kudos ON works (kudos);
+CREATE INDEX IF NOT EXISTS works_hits ON works (hits);
+CREATE INDEX IF NOT EXISTS works_published ON works (published);
+
+CREATE TABLE IF NOT EXISTS tags (
+    id INTEGER PRIMARY KEY,
+    type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    UNIQUE (type, name)
+);
+
+CREATE TABLE IF NOT EXISTS work_tags (
+    work_id INTEGER NOT NULL,
+    tag_id INTEGER NOT NULL,
+    PRIMARY KEY (tag_id, work_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS work_tags_work ON work_tags (work_id);
+"""
+
+
+def work_record(work):
+    """Returns a work as a dict in the shape of Work.json().
+
+    ``work`` can be a Work, or a dict you've already loaded from its JSON.
+    """
+    if isinstance(work, dict):
+        return work
+    return json.loads(work.json())
+
+
+def _range_clause(column, value, params):
+    """Turn a (min, max) pair, either end None, into an inclusive SQL range."""
+    low, high = value
+    clauses = []
+    if low is not None:
+        clauses.append(f"w.{column} >= ?")
+        params.append(str(low) if column == "published" else low)
+    if high is not None:
+        clauses.append(f"w.{column} <= ?")
+        params.append(str(high) if column == "published" else high)
+    return clauses
+
+
+class WorkStore(object):
+    """Work metadata, tags and stats in a SQLite database.
+
+    :param path: the SQLite file to use.  By default the store is in memory,
+        and lasts only as long as this object.
+    """
+
+    def __init__(self, path=":memory:"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._tag_ids = {}
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def __repr__(self):
+        return f"{type(self).__name__}(path={self.path!r})"
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM works").fetchone()[0]
+
+    def __contains__(self, work_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM works WHERE id = ?", (int(work_id),)
+            ).fetchone()
+        return row is not None
+
+    def _tag_id(self, tag_type, name):
+        key = (tag_type, name)
+        tag_id = self._tag_ids.get(key)
+        if tag_id is None:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO tags (type, name) VALUES (?, ?)", key
+            )
+            tag_id = self._conn.execute(
+                "SELECT id FROM tags WHERE type = ? AND name = ?", key
+            ).fetchone()[0]
+            self._tag_ids[key] = tag_id
+        return tag_id
+
+    def _put(self, record):
+        stats = record.get("stats", {})
+        row = [
+            int(record["id"]),
+            record.get("title"),
+            record.get("author"),
+            record.get("summary"),
+            record.get("language"),
+            record.get("collections"),
+            stats.get("published"),
+            stats.get("completed"),
+        ] + [stats.get(column) for column in STAT_COLUMNS]
+        self._conn.execute(
+            f"INSERT OR REPLACE INTO works VALUES ({', '.join('?' * len(row))})",
+            row,
+        )
+
+        # Replace the work's tags, in case they've changed since last time.
+        self._conn.execute("DELETE FROM work_tags WHERE work_id = ?", (row[0],))
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO work_tags (work_id, tag_id) VALUES (?, ?)",
+            [
+                (row[0], self._tag_id(tag_type, name))
+                for field, tag_type in TAG_FIELDS
+                for name in record.get(field) or []
+            ],
+        )
+
+    def put(self, work):
+        """Add a work, or update it if it's already stored."""
+        self.put_many([work])
+
+    def put_many(self, works, batch_size=DEFAULT_BATCH_SIZE):
+        """Add or update works, committing every ``batch_size`` of them.
+
+        ``works`` can be any iterable of Work objects or Work.json() dicts,
+        and is read as it goes, without holding the database: a generator
+        that fetches each work doesn't lock out the rest of the store while
+        it waits on the network.  If reading ``works`` fails (or a crawl is
+        interrupted), the works read before that are still stored.
+        Returns the number of works stored.
+        """
+        count = 0
+        batch = []
+        try:
+            for work in works:
+                batch.append(work_record(work))
+                if len(batch) >= batch_size:
+                    pending, batch = batch, []
+                    count += self._put_batch(pending)
+        finally:
+            if batch:
+                count += self._put_batch(batch)
+        return count
+
+    def _put_batch(self, records):
+        with self._lock:
+            try:
+                with self._conn:
+                    for record in records:
+                        self._put(record)
+            except BaseException:
+                # Any tags we added were rolled back too.
+                self._tag_ids = {}
+                raise
+        return len(records)
+
+    def get(self, work_id):
+        """Returns a stored work as a dict in the shape of Work.json(), or
+        None if it isn't stored.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(WORK_COLUMNS)} FROM works WHERE id = ?",
+                (int(work_id),),
+            ).fetchone()
+            if row is None:
+                return None
+            tags = self._conn.execute(
+                "SELECT t.type, t.name FROM work_tags wt "
+                "JOIN tags t ON t.id = wt.tag_id WHERE wt.work_id = ? "
+                "ORDER BY t.id",
+                (int(work_id),),
+            ).fetchall()
+
+        values = dict(zip(WORK_COLUMNS, row))
+        record = {
+            key: values[key]
+            for key in ["id", "title", "author", "summary", "language", "collections"]
+        }
+        for field, tag_type in TAG_FIELDS:
+            record[field] = [name for t, name in tags if t == tag_type]
+        record["stats"] = {
+            key: values[key] for key in ["published", "completed"] + STAT_COLUMNS
+        }
+        return record
+
+    def query(
+        self,
+        fandoms=(),
+        characters=(),
+        relationships=(),
+        tags=(),
+        rating=None,
+        language=None,
+        words=None,
+        comments=None,
+        kudos=None,
+        bookmarks=None,
+        hits=None,
+        published=None,
+        sort="id",
+        ascending=True,
+        limit=None,
+    ):
+        """Returns the IDs of the stored works that match every filter.
+
+        :param fandoms, characters, relationships, tags: lists of tag names
+            that every result must have.  ``tags`` are additional ("freeform")
+            tags.
+        :param rating: a rating name, e.g. "Teen And Up Audiences".
+        :param language: the language as it's shown on the work, e.g. "English".
+        :param words, comments, kudos, bookmarks, hits: an inclusive (min, max)
+            range, with either end None.
+        :param published: a (start, end) range of dates.
+        :param sort: one of SORT_COLUMNS.
+        """
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"Cannot sort by {sort!r}; choose from {SORT_COLUMNS}")
+
+        clauses = []
+        params = []
+
+        required_tags = [
+            ("fandom", fandoms),
+            ("character", characters),
+            ("relationship", relationships),
+            ("freeform", tags),
+            ("rating", [rating] if rating else []),
+        ]
+        for tag_type, names in required_tags:
+            for name in names:
+                clauses.append(
+                    "w.id IN (SELECT wt.work_id FROM work_tags wt "
+                    "JOIN tags t ON t.id = wt.tag_id "
+                    "WHERE t.type = ? AND t.name = ?)"
+                )
+                params.extend([tag_type, name])
+
+        if language is not None:
+            clauses.append("w.language = ?")
+            params.append(language)
+
+        ranges = [
+            ("words", words),
+            ("comments", comments),
+            ("kudos", kudos),
+            ("bookmarks", bookmarks),
+            ("hits", hits),
+            ("published", published),
+        ]
+        for column, value in ranges:
+            if value is not None:
+                clauses.extend(_range_clause(column, value, params))
+
+        sql = "SELECT w.id FROM works w"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += f" ORDER BY w.{sort} {'ASC' if ascending else 'DESC'}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        with self._lock:
+            return [row[0] for row in self._conn.execute(sql, params)]
+
+    def records(self, **filters):
+        """Generates the stored dict (see get()) for each work matching the
+        filters of query().
+        """
+        for work_id in self.query(**filters):
+            yield self.get(work_id)
+
+    def works(self, sess=None, ao3_url=None, **filters):
+        """Generates a Work for each stored work matching the filters of
+        query().  Each work is only fetched from AO3 when you get to it.
+        """
+        from .utils import BASE_URL
+        from .works import Work
+
+        for work_id in self.query(**filters):
+            yield Work(str(work_id), sess, ao3_url or BASE_URL)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,208 @@
+# -*- encoding: utf-8
+"""Spotting which of a user's subscriptions have been updated.
+
+The subscriptions page only lists titles and authors, so the obvious way to
+find what's changed (loading every subscribed work) costs one big request
+per subscription.  Instead, SubscriptionMonitor reads the update date and
+chapter count from pages that show them for many works at once:
+
+* for works, the author's works listing, newest updates first: one page
+  covers 20 works, and we stop as soon as we reach works older than anything
+  we're waiting for;
+* for series, the author's series listing, which shows the update date and
+  number of works of 20 series a page;
+* for anything else (anonymous works or series, or ones we didn't find in
+  their author's listing), the work's small "navigate" page, which lists its
+  chapters and their dates, or the first page of the series.
+
+The subscriptions page itself can't be used: its entries are just a title
+and an author, with no dates.
+
+The results are compared with what was seen last time, and only the
+subscriptions that changed are reported.
+"""
+
+import collections
+import json
+import os
+
+from .blurbs import iter_blurbs
+from .series import Series
+from .utils import (
+    TYPE_SERIES,
+    TYPE_WORKS,
+    iter_pages,
+)
+from .works import chapter_index
+
+# How many pages of an author's works listing to read when looking for a
+# subscribed work we have no previous state for, before falling back to the
+# work's navigate page.
+MAX_AUTHOR_PAGES = 3
+
+SubscriptionChange = collections.namedtuple(
+    "SubscriptionChange", ["type", "id", "title", "old", "new"]
+)
+
+
+def _work_status(blurb):
+    updated = blurb.updated.date().isoformat() if blurb.updated else None
+    return blurb.work_id, {"updated": updated, "chapters": blurb.posted_chapters}
+
+
+def _series_status(blurb):
+    updated = blurb.updated.date().isoformat() if blurb.updated else None
+    return blurb.series_id, {"updated": updated, "works": blurb.works or 0}
+
+
+# For each type of subscription: the author's listing to read (under
+# /users/[username]/), whether it's sorted by update date (newest first),
+# and how to read a status from one of its blurbs.
+AUTHOR_LISTINGS = {
+    TYPE_WORKS: ("works?work_search[sort_column]=revised_at", True, _work_status),
+    TYPE_SERIES: ("series", False, _series_status),
+}
+
+
+def _navigate_status(session, ao3_url, work_id):
+    """Returns the update date and chapter count from a work's navigate page."""
+    chapters = chapter_index(work_id, session, ao3_url)
+    dates = [str(c.published) for c in chapters if c.published is not None]
+    return {"updated": max(dates) if dates else None, "chapters": len(chapters)}
+
+
+class SubscriptionMonitor(object):
+    """Reports which of a user's subscribed works and series have changed.
+
+    :param user: the User whose subscriptions to check.  You need to be logged
+        in as them.
+    :param state_path: a JSON file to keep the last-seen state in between
+        runs.  Without it, the state only lasts as long as this object.
+    """
+
+    def __init__(self, user, state_path=None):
+        self.user = user
+        self.session = user.session
+        self.ao3_url = user.ao3_url
+        self.state_path = state_path
+        self.state = {TYPE_WORKS: {}, TYPE_SERIES: {}}
+
+        if state_path is not None and os.path.exists(state_path):
+            with open(state_path, encoding="utf-8") as infile:
+                self.state.update(json.load(infile))
+
+    def __repr__(self):
+        return f"{type(self).__name__}(user={self.user!r})"
+
+    def _subscriptions(self, sub_type):
+        """Returns a dict of id -> (title, author username or None)."""
+        subs = {}
+        for dt in self.user._iter_subscription_entries(sub_type):
+            links = dt.find_all("a")
+            if not links:
+                continue
+            sub_id = links[0].get("href").replace("/" + sub_type + "/", "")
+            author = None
+            for link in links[1:]:
+                # /users/[username]/pseuds/[pseud]
+                if link.get("rel") == ["author"]:
+                    author = link.get("href").split("/")[2]
+                    break
+            subs[sub_id] = (links[0].text.strip(), author)
+        return subs
+
+    def _statuses(self, sub_type, subs):
+        """Returns a dict of id -> status, e.g. {"updated", "chapters"}."""
+        by_author = collections.defaultdict(set)
+        for sub_id, (_, author) in subs.items():
+            by_author[author].add(sub_id)
+
+        statuses = {}
+        for author, sub_ids in by_author.items():
+            if author is not None:
+                statuses.update(
+                    self._statuses_from_author_listing(sub_type, author, sub_ids)
+                )
+
+        for sub_id in subs:
+            if sub_id not in statuses:
+                if sub_type == TYPE_WORKS:
+                    status = _navigate_status(self.session, self.ao3_url, sub_id)
+                else:
+                    status = self._series_page_status(sub_id)
+                statuses[sub_id] = status
+        return statuses
+
+    def _statuses_from_author_listing(self, sub_type, author, sub_ids):
+        path, sorted_by_update, read_status = AUTHOR_LISTINGS[sub_type]
+        known = self.state[sub_type]
+        waiting = set(sub_ids)
+        statuses = {}
+
+        # Things we've seen before can't have changed if they're not in the
+        # listing above the date they were last updated.
+        if sorted_by_update and all(w in known for w in waiting):
+            stop_before = min(known[w]["updated"] or "" for w in waiting)
+        else:
+            stop_before = None
+
+        url = f"{self.ao3_url}/users/{author}/{path}"
+        for page_no, soup in iter_pages(url, self.session, owner=self.user.username):
+            for blurb in iter_blurbs(soup):
+                sub_id, status = read_status(blurb)
+                updated = status["updated"]
+
+                if sub_id in waiting:
+                    waiting.discard(sub_id)
+                    statuses[sub_id] = status
+                elif stop_before and updated and updated < stop_before:
+                    # Everything we're still waiting for is further down, so
+                    # it hasn't been updated.
+                    for w in waiting:
+                        statuses[w] = known[w]
+                    return statuses
+
+            if not waiting:
+                break
+            if stop_before is None and page_no >= MAX_AUTHOR_PAGES:
+                break
+
+        return statuses
+
+    def _series_page_status(self, series_id):
+        info = Series(series_id, self.session, self.ao3_url).info()
+        return {
+            "updated": info.get("Series Updated", "").strip() or None,
+            "works": int(info.get("Works", "0").replace(",", "") or 0),
+        }
+
+    def check(self, types=(TYPE_WORKS, TYPE_SERIES)):
+        """Returns a list of SubscriptionChange for every subscribed work or
+        series whose update date or chapter/work count has changed since the
+        last check.
+
+        Subscriptions seen for the first time are recorded, but not reported.
+        """
+        changes = []
+        for sub_type in types:
+            subs = self._subscriptions(sub_type)
+            statuses = self._statuses(sub_type, subs)
+
+            known = self.state[sub_type]
+            for sub_id, new in statuses.items():
+                old = known.get(sub_id)
+                if old is not None and old != new:
+                    changes.append(
+                        SubscriptionChange(sub_type, sub_id, subs[sub_id][0], old, new)
+                    )
+            # Forget anything we've unsubscribed from.
+            self.state[sub_type] = statuses
+
+        self.save()
+        return changes
+
+    def save(self):
+        if self.state_path is None:
+            return
+        with open(self.state_path, "w", encoding="utf-8") as outfile:
+            json.dump(self.state, outfile)
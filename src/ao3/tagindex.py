@@ -0,0 +1,232 @@
+# -*- encoding: utf-8
+"""An in-memory inverted index of the tags on works.
+
+Questions like "works tagged with both character A and relationship B, but
+not warning C" are set operations over the works that have each tag.  A
+TagIndex interns every tag name to a small integer, and keeps a sorted list
+of (interned) works for each tag, so those questions never touch a string
+comparison:
+
+    >>> index = TagIndex()
+    >>> for work in works:
+    ...     index.add_work(work)
+    >>> index.query(all_of=["Rey", "Finn/Rey"], none_of=["Major Character Death"])
+    [258626, ...]
+    >>> index.co_occurring(all_of=["Rey"], top=3)
+    [('Star Wars', 120), ('Finn (Star Wars)', 45), ('Fluff', 30)]
+
+Tag names on AO3 are unique across all tag types, so tags are identified by
+name alone.  An index can be saved to, and loaded from, a compact binary
+file.
+"""
+
+import array
+import bisect
+import collections
+import os
+
+from . import varint
+from .blurbs import parse_blurb
+from .store import TAG_FIELDS, work_record
+
+MAGIC = b"AO3TAGIX\x01"
+
+
+class TagIndex(object):
+    def __init__(self):
+        # tag name <-> tag number
+        self._tag_numbers = {}
+        self._tags = []
+        # tag number -> sorted array of doc numbers
+        self._postings = []
+
+        # work ID <-> doc number
+        self._doc_numbers = {}
+        self._work_ids = []
+        # doc number -> array of tag numbers
+        self._doc_tags = []
+
+    def __repr__(self):
+        return f"<{type(self).__name__} works={len(self)} tags={len(self._tags)}>"
+
+    def __len__(self):
+        return len(self._work_ids)
+
+    def __contains__(self, work_id):
+        return int(work_id) in self._doc_numbers
+
+    @property
+    def tags(self):
+        """Every tag name in the index."""
+        return list(self._tags)
+
+    def _intern(self, name):
+        number = self._tag_numbers.get(name)
+        if number is None:
+            number = self._tag_numbers[name] = len(self._tags)
+            self._tags.append(name)
+            self._postings.append(array.array("I"))
+        return number
+
+    def add(self, work_id, tags):
+        """Index a work with the given tag names, replacing its tags if it's
+        already in the index.
+        """
+        work_id = int(work_id)
+        tag_numbers = array.array("I", sorted({self._intern(t) for t in tags}))
+
+        doc = self._doc_numbers.get(work_id)
+        if doc is None:
+            # New docs always have the highest number, so appending keeps
+            # every posting list sorted.
+            doc = self._doc_numbers[work_id] = len(self._work_ids)
+            self._work_ids.append(work_id)
+            self._doc_tags.append(tag_numbers)
+            for number in tag_numbers:
+                self._postings[number].append(doc)
+            return
+
+        old = set(self._doc_tags[doc])
+        for number in old.difference(tag_numbers):
+            self._postings[number].remove(doc)
+        for number in set(tag_numbers).difference(old):
+            bisect.insort(self._postings[number], doc)
+        self._doc_tags[doc] = tag_numbers
+
+    def add_work(self, work):
+        """Index a Work, or a dict in the shape of Work.json()."""
+        record = work_record(work)
+        tags = [name for field, _ in TAG_FIELDS for name in record.get(field) or []]
+        self.add(record["id"], tags)
+
+    def add_blurb(self, li_tag):
+        """Index a work from its blurb on a listing page (works, bookmarks,
+        search results...), so you don't have to fetch each work.
+
+        The tags in a blurb are links of the form
+
+            <a class="tag" href="/tags/[tag]/works">[tag name]</a>
+
+        and the rating is
+
+            <span class="rating-general-audience rating" title="General Audiences">
+        """
+        blurb = parse_blurb(li_tag)
+        if blurb.work_id is None:
+            # e.g. a bookmarked series
+            return
+        self.add(blurb.work_id, blurb.tags)
+
+    def _posting(self, name):
+        number = self._tag_numbers.get(name)
+        if number is None:
+            return array.array("I")
+        return self._postings[number]
+
+    def _match(self, all_of, any_of, none_of):
+        """Returns the set of doc numbers matching the query."""
+        docs = None
+        if all_of:
+            # Start from the rarest tag, so the set we carry around is small.
+            postings = sorted((self._posting(t) for t in all_of), key=len)
+            docs = set(postings[0])
+            for posting in postings[1:]:
+                if not docs:
+                    break
+                docs.intersection_update(posting)
+        if any_of:
+            union = set()
+            for name in any_of:
+                union.update(self._posting(name))
+            docs = union if docs is None else docs & union
+        if docs is None:
+            docs = set(range(len(self._work_ids)))
+        for name in none_of:
+            docs.difference_update(self._posting(name))
+        return docs
+
+    def query(self, all_of=(), any_of=(), none_of=()):
+        """Returns the IDs of the works that have every tag in ``all_of``, at
+        least one tag in ``any_of`` (if given), and no tag in ``none_of``.
+        """
+        docs = self._match(all_of, any_of, none_of)
+        return sorted(self._work_ids[doc] for doc in docs)
+
+    def count(self, all_of=(), any_of=(), none_of=()):
+        """Returns the number of works query() would return."""
+        if len(all_of) == 1 and not any_of and not none_of:
+            return len(self._posting(all_of[0]))
+        return len(self._match(all_of, any_of, none_of))
+
+    def co_occurring(self, all_of=(), any_of=(), none_of=(), top=10):
+        """Returns the ``top`` most common (tag, count) pairs among the works
+        matching the query, leaving out the tags in the query itself.
+        """
+        counts = collections.Counter()
+        for doc in self._match(all_of, any_of, none_of):
+            counts.update(self._doc_tags[doc])
+
+        excluded = {
+            self._tag_numbers[name]
+            for name in list(all_of) + list(any_of)
+            if name in self._tag_numbers
+        }
+        for number in excluded:
+            del counts[number]
+        return [
+            (self._tags[number], count) for number, count in counts.most_common(top)
+        ]
+
+    def save(self, path):
+        """Write the index to a binary file.
+
+        The file holds the work IDs, then each tag's name and its sorted list
+        of works, written as varint deltas.
+        """
+        out = bytearray(MAGIC)
+        varint.encode(len(self._work_ids), out)
+        for work_id in self._work_ids:
+            varint.encode(work_id, out)
+        varint.encode(len(self._tags), out)
+        for name, posting in zip(self._tags, self._postings):
+            encoded = name.encode("utf-8")
+            varint.encode(len(encoded), out)
+            out.extend(encoded)
+            varint.encode_deltas(posting, out)
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as outfile:
+            outfile.write(out)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Read an index written by save()."""
+        with open(path, "rb") as infile:
+            buf = infile.read()
+        if not buf.startswith(MAGIC):
+            raise ValueError(f"{path!r} is not a saved TagIndex")
+
+        index = cls()
+        pos = len(MAGIC)
+        doc_count, pos = varint.decode(buf, pos)
+        for doc in range(doc_count):
+            work_id, pos = varint.decode(buf, pos)
+            index._doc_numbers[work_id] = doc
+            index._work_ids.append(work_id)
+            index._doc_tags.append(array.array("I"))
+
+        tag_count, pos = varint.decode(buf, pos)
+        for number in range(tag_count):
+            length, pos = varint.decode(buf, pos)
+            name = buf[pos : pos + length].decode("utf-8")
+            pos += length
+            posting, pos = varint.decode_deltas(buf, pos)
+
+            index._tag_numbers[name] = number
+            index._tags.append(name)
+            index._postings.append(array.array("I", posting))
+            for doc in posting:
+                index._doc_tags[doc].append(number)
+
+        return index
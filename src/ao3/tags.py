@@ -0,0 +1,218 @@
+# -*- encoding: utf-8
+"""AO3 tags, and polling their Atom feeds for new works.
+
+Every canonical tag on AO3 has an Atom feed of its most recent works at
+/tags/<tag id>/feed.atom.  It's much smaller than a page of the HTML listing,
+and needs no BeautifulSoup to read, so it's the cheap way to watch a tag (or
+thousands of them) for new works.
+"""
+
+import collections
+import json
+import os
+import re
+import threading
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from urllib.parse import quote
+
+from .utils import (
+    BASE_URL,
+    DATE_UPDATED,
+    get_list_of_work_ids,
+    get_soup,
+    get_with_timeout,
+)
+
+ATOM_NS = {"atom": "http://www.w3.org/2005/Atom"}
+
+# e.g. tag:archiveofourown.org,2005:Work/12345
+ENTRY_ID_REGEX = re.compile(r"Work/(?P<work_id>[0-9]+)$")
+
+# e.g. /tags/12345/feed.atom
+FEED_URL_REGEX = re.compile(r"/tags/(?P<feed_id>[0-9]+)/feed\.atom")
+
+FeedEntry = collections.namedtuple(
+    "FeedEntry", ["work_id", "title", "author", "published", "updated", "url"]
+)
+
+# AO3 escapes these characters in tag URLs, because they'd otherwise be
+# taken as part of the path.
+TAG_URL_ESCAPES = [
+    ("/", "*s*"),
+    ("&", "*a*"),
+    (".", "*d*"),
+    ("?", "*q*"),
+    ("#", "*h*"),
+]
+
+
+def tag_url_name(name):
+    """Returns the form of a tag name used in AO3's URLs."""
+    for char, escape in TAG_URL_ESCAPES:
+        name = name.replace(char, escape)
+    return quote(name, safe="*")
+
+
+def _parse_timestamp(value):
+    # AO3 writes UTC times as e.g. 2020-01-01T12:00:00Z, which
+    # fromisoformat() only understands from Python 3.11.
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def parse_feed(text):
+    """Returns a list of FeedEntry for the works in an AO3 Atom feed."""
+    root = ET.fromstring(text)
+    entries = []
+    for entry in root.iterfind("atom:entry", ATOM_NS):
+        match = ENTRY_ID_REGEX.search(entry.findtext("atom:id", "", ATOM_NS))
+        if not match:
+            continue
+        link = entry.find("atom:link[@rel='alternate']", ATOM_NS)
+        entries.append(
+            FeedEntry(
+                work_id=match.group("work_id"),
+                title=entry.findtext("atom:title", "", ATOM_NS),
+                author=[
+                    name.text
+                    for name in entry.iterfind("atom:author/atom:name", ATOM_NS)
+                ],
+                published=_parse_timestamp(
+                    entry.findtext("atom:published", "", ATOM_NS)
+                ),
+                updated=_parse_timestamp(entry.findtext("atom:updated", "", ATOM_NS)),
+                url=link.get("href") if link is not None else None,
+            )
+        )
+    return entries
+
+
+class FeedState(object):
+    """Remembers, for each tag, the newest work we've already seen in its feed
+    (and the tag's feed ID, so we only have to look that up once).
+
+    If ``path`` is given, the state is loaded from that JSON file, and save()
+    writes it back.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._tags = {}
+
+        if path is not None and os.path.exists(path):
+            with open(path, encoding="utf-8") as infile:
+                self._tags = json.load(infile)
+
+    def __repr__(self):
+        return f"{type(self).__name__}(path={self.path!r})"
+
+    def get(self, tag_name):
+        with self._lock:
+            return dict(self._tags.get(tag_name, {}))
+
+    def update(self, tag_name, **values):
+        with self._lock:
+            self._tags.setdefault(tag_name, {}).update(values)
+
+    def save(self):
+        if self.path is None:
+            return
+        with self._lock:
+            with open(self.path, "w", encoding="utf-8") as outfile:
+                json.dump(self._tags, outfile)
+
+
+class Tag(object):
+    """An AO3 tag, e.g. a fandom, character, relationship or freeform tag.
+
+    :param name: the tag's name, exactly as it appears on AO3.
+    :param feed_id: the numeric ID in the tag's feed URL, if you know it.
+        Otherwise it's looked up from the tag's works page when needed.
+    """
+
+    def __init__(self, name, session, ao3_url=BASE_URL, feed_id=None):
+        self.name = name
+        self.session = session
+        self.ao3_url = ao3_url
+        self.url = f"{self.ao3_url}/tags/{tag_url_name(self.name)}"
+        self.feed_id = feed_id
+
+    def __repr__(self):
+        return f"{type(self).__name__}(name={self.name!r})"
+
+    def work_ids(self, max_count=None, oldest_date=None, seen=None):
+        return get_list_of_work_ids(
+            f"{self.url}/works",
+            self.session,
+            max_count=max_count,
+            oldest_date=oldest_date,
+            date_type=DATE_UPDATED,
+            owner=self.url,
+            seen=seen,
+        )
+
+    @property
+    def feed_url(self):
+        """The URL of this tag's Atom feed."""
+        if self.feed_id is None:
+            # The works page links to the feed as
+            #
+            #     <a class="rss" href="/tags/12345/feed.atom">Subscribe...</a>
+            #
+            soup = get_soup(self.session, f"{self.url}/works")
+            link = soup.find("a", href=FEED_URL_REGEX)
+            if link is None:
+                raise RuntimeError(
+                    f"Tag {self.name!r} has no feed; only canonical tags have one"
+                )
+            self.feed_id = FEED_URL_REGEX.search(link["href"]).group("feed_id")
+        return f"{self.ao3_url}/tags/{self.feed_id}/feed.atom"
+
+    def feed(self):
+        """Returns the works currently in this tag's feed, newest first."""
+        req = get_with_timeout(self.session, self.feed_url, owner=self.url)
+        return parse_feed(req.content)
+
+    def new_works(self, state):
+        """Returns the works in the feed that are new, or newly updated, since
+        the last time we looked, and records them in ``state`` (a FeedState).
+        The first time a tag is polled, everything in its feed is new.
+        """
+        seen = state.get(self.name)
+        if self.feed_id is None:
+            self.feed_id = seen.get("feed_id")
+
+        entries = self.feed()
+        last_id = seen.get("last_work_id", 0)
+        last_updated = seen.get("last_updated")
+        new = [
+            entry
+            for entry in entries
+            if int(entry.work_id) > last_id
+            or (last_updated and entry.updated.isoformat() > last_updated)
+        ]
+
+        if entries:
+            newest = max(e.updated for e in entries).isoformat()
+            state.update(
+                self.name,
+                feed_id=self.feed_id,
+                last_work_id=max([last_id] + [int(e.work_id) for e in entries]),
+                last_updated=max(newest, last_updated or newest),
+            )
+        return new
+
+
+def poll_tags(tag_names, session, state, ao3_url=BASE_URL):
+    """Generates (tag name, FeedEntry) for every new work across many tags.
+
+    All the requests go through the session, so they share its rate limit
+    (or its scheduler).  ``state`` is saved after each tag, so an interrupted
+    poll doesn't report the same works again.
+    """
+    for name in tag_names:
+        tag = Tag(name, session, ao3_url)
+        for entry in tag.new_works(state):
+            yield name, entry
+        state.save()
@@ -0,0 +1,357 @@
+# -*- encoding: utf-8
+"""The HTTP clients a Session can send its requests with.
+
+A transport does one thing: ``get(url, stream=False, headers=None)``,
+returning a response that looks like one from requests (``status_code``,
+``reason``, ``text``, ``headers``, ``iter_content()`` and so on).  Rate
+limiting, retries, SingleFlight and the Scheduler all sit above it, in the
+Session and in ao3.utils, so Work, User, Series, Collection and Comments
+don't know or care which transport is underneath.
+
+* CloudscraperTransport is the default: a cloudscraper session, which can
+  get past Cloudflare's challenges.  It speaks HTTP/1.1, so each connection
+  carries one request at a time, and concurrent crawls need a pool of them.
+* HttpxTransport uses an httpx client (``pip install httpx[http2]``).  Over
+  HTTP/2, all the threads sharing a Session multiplex their requests over
+  a single connection, and ``aget()`` sends requests from asyncio code.  It
+  can't solve Cloudflare challenges, so reuse clearance earned by a
+  cloudscraper session (see ao3.clearance), or use it for a mirror that
+  isn't behind one.
+
+    >>> from ao3.transport import HttpxTransport
+    >>> api = AO3(transport=HttpxTransport(http2=True))
+"""
+
+import http.cookiejar
+import threading
+from importlib.util import find_spec
+
+HAS_BROTLI = find_spec("brotli") is not None
+
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+
+DEFAULT_TIMEOUT = 30
+
+
+class CookieJar(http.cookiejar.CookieJar):
+    """A cookie jar with the ``set()`` that requests' cookie jars have, so
+    the rest of the package can set cookies without knowing which transport
+    they're going to.
+    """
+
+    def set(self, name, value, domain="", path="/"):
+        self.set_cookie(
+            http.cookiejar.Cookie(
+                version=0,
+                name=name,
+                value=value,
+                port=None,
+                port_specified=False,
+                domain=domain,
+                domain_specified=bool(domain),
+                domain_initial_dot=domain.startswith("."),
+                path=path,
+                path_specified=True,
+                secure=False,
+                expires=None,
+                discard=False,
+                comment=None,
+                comment_url=None,
+                rest={},
+            )
+        )
+
+
+class Transport(object):
+    """The interface a Session expects of the client that sends its requests.
+
+    ``cookies`` and ``headers`` are sent with every request; ``cookies`` is
+    a cookie jar with ``set(name, value, domain=...)``, and can be replaced
+    with another jar.
+    """
+
+    cookies = None
+    headers = None
+
+    def get(self, url, stream=False, headers=None):
+        raise NotImplementedError
+
+    def add_response_hook(self, hook):
+        """Call ``hook(response, stream=...)`` with every response, once its
+        cookies are in ``cookies``.
+        """
+        raise NotImplementedError
+
+    def stats(self):
+        """Returns a dict with the number of ``connections`` opened so far,
+        and the number of ``requests`` sent over them.
+        """
+        return {"connections": 0, "requests": 0}
+
+    def close(self):
+        pass
+
+
+class CloudscraperTransport(Transport):
+    """Requests sent with a cloudscraper session, over HTTP/1.1.
+
+    :param pool_connections: the number of per-host connection pools to cache.
+    :param pool_maxsize: the maximum number of keep-alive connections to hold
+        open per host.  Raise this if you fetch from several threads at once.
+    :param pool_block: if True, threads wait for a free connection instead of
+        opening (and then discarding) connections beyond ``pool_maxsize``.
+
+    The underlying urllib3 pools are thread-safe.  Responses are
+    gzip-compressed, and brotli-compressed too if the ``brotli`` package is
+    installed.
+    """
+
+    def __init__(
+        self,
+        pool_connections=DEFAULT_POOL_CONNECTIONS,
+        pool_maxsize=DEFAULT_POOL_MAXSIZE,
+        pool_block=False,
+    ):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+
+        # cloudscraper brings requests and a couple of JavaScript interpreters
+        # with it, so only import it once we actually need a transport.
+        import cloudscraper
+
+        self.scraper = cloudscraper.create_scraper(allow_brotli=HAS_BROTLI)
+        self.scraper.headers["Accept-Encoding"] = (
+            "gzip, deflate, br" if HAS_BROTLI else "gzip, deflate"
+        )
+
+        # cloudscraper mounts its own adapter for https:// (it needs a custom
+        # cipher suite to get past Cloudflare), so rather than replacing the
+        # adapters we resize the pools they already have.
+        for adapter in self.scraper.adapters.values():
+            adapter._pool_connections = pool_connections
+            adapter._pool_maxsize = pool_maxsize
+            adapter._pool_block = pool_block
+            adapter.init_poolmanager(pool_connections, pool_maxsize, block=pool_block)
+
+    def __repr__(self):
+        return (
+            f"{type(self).__name__}(pool_connections={self.pool_connections!r}, "
+            f"pool_maxsize={self.pool_maxsize!r})"
+        )
+
+    @property
+    def cookies(self):
+        return self.scraper.cookies
+
+    @cookies.setter
+    def cookies(self, jar):
+        self.scraper.cookies = jar
+
+    @property
+    def headers(self):
+        return self.scraper.headers
+
+    def get(self, url, stream=False, headers=None):
+        return self.scraper.get(url, stream=stream, headers=headers)
+
+    def add_response_hook(self, hook):
+        def requests_hook(response, *args, **kwargs):
+            # Hooks run before requests copies the response's cookies into
+            # the session, so do that first.
+            self.scraper.cookies.update(response.cookies)
+            hook(response, stream=kwargs.get("stream", False))
+            return response
+
+        self.scraper.hooks["response"].append(requests_hook)
+
+    def stats(self):
+        connections = 0
+        requests = 0
+        for adapter in self.scraper.adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                connections += pool.num_connections
+                requests += pool.num_requests
+        return {"connections": connections, "requests": requests}
+
+    def close(self):
+        self.scraper.close()
+
+
+class HttpxResponse(object):
+    """An httpx response, dressed up as a requests one."""
+
+    def __init__(self, response, stream=False):
+        self.raw = response
+        self._content_consumed = not stream
+
+    def __repr__(self):
+        return f"<{type(self).__name__} [{self.status_code}]>"
+
+    @property
+    def status_code(self):
+        return self.raw.status_code
+
+    @property
+    def reason(self):
+        return self.raw.reason_phrase
+
+    @property
+    def headers(self):
+        return self.raw.headers
+
+    @property
+    def url(self):
+        return str(self.raw.url)
+
+    @property
+    def cookies(self):
+        return self.raw.cookies
+
+    @property
+    def content(self):
+        self._content_consumed = True
+        return self.raw.read()
+
+    @property
+    def text(self):
+        self._content_consumed = True
+        self.raw.read()
+        return self.raw.text
+
+    def iter_content(self, chunk_size=None):
+        self._content_consumed = True
+        return self.raw.iter_bytes(chunk_size)
+
+    def close(self):
+        self.raw.close()
+
+
+class HttpxTransport(Transport):
+    """Requests sent with an httpx client, over HTTP/2 if ``http2`` is set
+    (it needs the ``h2`` package) and the server supports it.
+
+    :param max_connections: the most connections to open at once.  Over
+        HTTP/2, one connection carries any number of concurrent requests.
+    :param timeout: seconds to wait for a connection or a response.
+
+    The sync client is thread-safe.  The async one, used by ``aget()``, is
+    created the first time it's needed, and shares the sync client's cookies
+    and headers.  ``transport`` and ``async_transport`` are passed to the
+    httpx clients, e.g. to mock them in tests.
+    """
+
+    def __init__(
+        self,
+        http2=True,
+        max_connections=DEFAULT_POOL_MAXSIZE,
+        timeout=DEFAULT_TIMEOUT,
+        transport=None,
+        async_transport=None,
+    ):
+        import httpx
+
+        self.http2 = http2
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._async_transport = async_transport
+        self._limits = httpx.Limits(max_connections=max_connections)
+        self._hooks = []
+        self._lock = threading.Lock()
+        self._connections = set()
+        self._requests = 0
+
+        self.client = httpx.Client(
+            http2=http2,
+            limits=self._limits,
+            timeout=timeout,
+            follow_redirects=True,
+            cookies=CookieJar(),
+            transport=transport,
+        )
+        self.client.headers["Accept-Encoding"] = (
+            "gzip, deflate, br" if HAS_BROTLI else "gzip, deflate"
+        )
+        self._async_client = None
+
+    def __repr__(self):
+        return (
+            f"{type(self).__name__}(http2={self.http2!r}, "
+            f"max_connections={self.max_connections!r})"
+        )
+
+    @property
+    def cookies(self):
+        # The CookieJar the clients were created with, which they share.
+        return self.client.cookies.jar
+
+    @cookies.setter
+    def cookies(self, jar):
+        # Copy the cookies into one of our jars, which has set(), whatever
+        # kind of jar (e.g. a requests one) they came in.
+        cookies = CookieJar()
+        for cookie in jar:
+            cookies.set_cookie(cookie)
+        with self._lock:
+            self.client.cookies = cookies
+            if self._async_client is not None:
+                self._async_client.cookies = cookies
+
+    @property
+    def headers(self):
+        return self.client.headers
+
+    def _track(self, response, stream):
+        with self._lock:
+            self._requests += 1
+            # Requests multiplexed over one HTTP/2 connection share its
+            # network stream.
+            network_stream = response.raw.extensions.get("network_stream")
+            if network_stream is not None:
+                self._connections.add(network_stream)
+        for hook in self._hooks:
+            hook(response, stream=stream)
+        return response
+
+    def get(self, url, stream=False, headers=None):
+        request = self.client.build_request("GET", url, headers=headers)
+        response = self.client.send(request, stream=stream)
+        return self._track(HttpxResponse(response, stream), stream)
+
+    @property
+    def async_client(self):
+        import httpx
+
+        with self._lock:
+            if self._async_client is None:
+                client = httpx.AsyncClient(
+                    http2=self.http2,
+                    limits=self._limits,
+                    timeout=self.timeout,
+                    follow_redirects=True,
+                    cookies=self.cookies,
+                    transport=self._async_transport,
+                )
+                self._async_client = client
+            return self._async_client
+
+    async def aget(self, url, headers=None):
+        """Like get(), but for asyncio code.  The body is always read."""
+        # The sync client's headers may have changed since the async client
+        # was created (e.g. a User-Agent from saved clearance).
+        headers = {**self.client.headers, **(headers or {})}
+        response = await self.async_client.get(url, headers=headers)
+        return self._track(HttpxResponse(response), False)
+
+    def add_response_hook(self, hook):
+        self._hooks.append(hook)
+
+    def stats(self):
+        with self._lock:
+            return {"connections": len(self._connections), "requests": self._requests}
+
+    def close(self):
+        self.client.close()
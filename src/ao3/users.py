@@ -1,8 +1,161 @@
 # -*- encoding: utf-8
-from . import Series
-from .utils import *
+import itertools
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+
+from bs4 import BeautifulSoup
+
+from .blurbs import iter_blurbs
+from .series import Series, SeriesMemo
+from .utils import (
+    AO3_DATE_FORMAT,
+    BASE_URL,
+    DATE_INTERACTED_WITH,
+    DATE_UPDATED,
+    PRIORITY_INTERACTIVE,
+    TYPE_SERIES,
+    TYPE_USERS,
+    TYPE_WORKS,
+    WORKS_HEADER_REGEX,
+    get_ids_and_dates_from_page,
+    get_list_of_work_ids,
+    get_soup,
+    get_with_timeout,
+    iter_pages,
+)
 from .works import Work
 
+# Series are expanded in the background while the bookmarks are paged through.
+# Every request still goes through the session's rate limiter, so this only
+# overlaps the waiting and parsing; it doesn't raise the request rate.
+SERIES_EXPANSION_WORKERS = 4
+
+
+def parse_reading_history_page(soup):
+    """Returns (entries, number of deleted or locked works) for a page of a
+    user's reading history.  See User.reading_history() for the entries.
+    """
+    # The entries are stored in a list of the form:
+    #
+    #     <ol class="reading work index group">
+    #       <li id="work_12345" class="reading work blurb group">
+    #         ...
+    #       </li>
+    #       <li id="work_67890" class="reading work blurb group">
+    #         ...
+    #       </li>
+    #       ...
+    #     </ol>
+    #
+    entries = []
+    deleted = 0
+    for blurb in iter_blurbs(soup):
+        entry = _reading_history_entry(blurb)
+        if entry is None:
+            deleted += 1
+        else:
+            entries.append(entry)
+    return entries, deleted
+
+
+def _reading_history_entry(blurb):
+    """Returns the tuple for one work in the reading history, or None if it's
+    been deleted or locked.
+    """
+    # A deleted work shows up as
+    #
+    #      <li class="deleted reading work blurb group">
+    #
+    # and a locked work with
+    #
+    #       <div class="mystery header picture module">
+    #
+    # There's nothing that we can do about those, so just skip over them.
+    if blurb.deleted or blurb.mystery:
+        return None
+    if blurb.work_id is None or blurb.user_date is None or blurb.updated is None:
+        raise RuntimeError(f"Couldn't read the reading history entry {blurb!r}")
+
+    # TODO: probably want to change these int values to ints
+    # instead of strings...
+    return (
+        blurb.work_id,
+        blurb.user_date.date(),
+        str(blurb.visits or 1),
+        blurb.title,
+        blurb.authors,
+        blurb.fandoms,
+        blurb.warnings,
+        blurb.relationships,
+        blurb.characters,
+        blurb.freeforms,
+        f"{blurb.words:,}",
+        blurb.chapters,
+        f"{blurb.comments:,}",
+        f"{blurb.kudos:,}",
+        f"{blurb.bookmarks:,}",
+        f"{blurb.hits:,}",
+        blurb.updated.date(),
+    )
+
+
+class _BookmarkEntries(object):
+    """The works and series found while paging through bookmarks, in the
+    order they appear.
+
+    Each series is expanded once, by ``expand(series_id)`` on ``executor``,
+    while the paging carries on.  ``count`` is the number of work IDs found
+    so far, counting a series once its expansion has finished.
+    """
+
+    def __init__(self, executor, expand):
+        self.executor = executor
+        self.expand = expand
+        self.count = 0
+        self._lock = threading.Lock()
+        # Work ids, and Futures for the lists of work ids in series.
+        self._entries = []
+        self._series = set()
+
+    def add_work(self, work_id):
+        self._entries.append(work_id)
+        with self._lock:
+            self.count += 1
+
+    def add_series(self, series_id):
+        if series_id in self._series:
+            return
+        self._series.add(series_id)
+        future = self.executor.submit(self.expand, series_id)
+        future.add_done_callback(self._series_done)
+        self._entries.append(future)
+
+    def _series_done(self, future):
+        if not future.cancelled() and future.exception() is None:
+            with self._lock:
+                self.count += len(future.result())
+
+    def work_ids(self, max_count=None, seen=None):
+        """Returns the work ids found, without duplicates, and at most
+        ``max_count`` of them.
+        """
+        work_ids = []
+        found = set()
+        for entry in self._entries:
+            ids = entry.result() if isinstance(entry, Future) else [entry]
+            for work_id in ids:
+                if max_count and len(work_ids) >= max_count:
+                    return work_ids
+                if work_id in found:
+                    continue
+                found.add(work_id)
+                # Only remember the works we return, not any trimmed off.
+                if seen is None or seen.add(work_id):
+                    work_ids.append(work_id)
+        return work_ids
+
 
 class User(object):
     """An AO3 author, not necessarily the user whose account we are logging in to.
@@ -25,8 +178,7 @@ class User(object):
 
     def works_count(self):
         url = f"{self.url}/works"
-        req = get_with_timeout(self.session, url)
-        soup = BeautifulSoup(req.text, features="html.parser")
+        soup = get_soup(self.session, url, priority=PRIORITY_INTERACTIVE)
         header_text = soup.h2.text
         m = re.search(WORKS_HEADER_REGEX, header_text)
 
@@ -35,10 +187,11 @@ class User(object):
 
         return 0
 
-    def work_ids(self, max_count=None, oldest_date=None):
+    def work_ids(self, max_count=None, oldest_date=None, seen=None):
         """
         Returns a list of the user's works' ids.
         We must be logged in to see locked works.
+        If a SeenSet is given as seen, works already in it are skipped.
         If sort_by_updated=True, works are sorted by date the work was last
         updated, descending. Otherwise, sorting is by date the work was created,
         descending.
@@ -52,12 +205,15 @@ class User(object):
             date_type=date_type,
             max_count=max_count,
             oldest_date=oldest_date,
+            owner=self.username,
+            seen=seen,
         )
 
-    def gift_ids(self, max_count=None, oldest_date=None):
+    def gift_ids(self, max_count=None, oldest_date=None, seen=None):
         """
         Returns a list of the ids of works gifted to the user.
         We must be logged in to see locked works.
+        If a SeenSet is given as seen, works already in it are skipped.
         If sort_by_updated=True, works are sorted by date the work was last
         updated, descending. Otherwise, sorting is by date the work was created,
         descending.
@@ -71,6 +227,8 @@ class User(object):
             date_type=date_type,
             max_count=max_count,
             oldest_date=oldest_date,
+            owner=self.username,
+            seen=seen,
         )
 
     def bookmarks_ids(
@@ -79,12 +237,18 @@ class User(object):
         expand_series=False,
         oldest_date=None,
         sort_by_updated=False,
+        series_memo=None,
+        seen=None,
     ):
         """
         Returns a list of the user's bookmarks' ids. Ignores external work bookmarks.
         User must be logged in to see private bookmarks.
         If expand_series=True, all works in a bookmarked series will be treated
         as individual bookmarks. Otherwise, series bookmarks will be ignored.
+        Pass a SeriesMemo as series_memo to reuse series expansions between
+        calls (e.g. for several users), or across runs if it has a path.
+        If a SeenSet (see ao3.seen) is given as seen, works already in it are
+        skipped, and the rest are added to it.
         If sort_by_updated=True, bookmarks are sorted by date the work was last
         updated, descending. Otherwise, sorting is by date the bookmark was created,
         descending.
@@ -103,8 +267,18 @@ class User(object):
             expand_series,
             oldest_date,
             date_type,
+            series_memo,
+            seen,
         )
 
+    def _expand_series(self, series_id, session, series_memo):
+        work_ids = series_memo.get(series_id)
+        if work_ids is None:
+            print(f"Getting all urls from series {series_id}....")
+            work_ids = Series(series_id, session, self.ao3_url).work_ids()
+            series_memo.put(series_id, work_ids)
+        return work_ids
+
     def _get_list_of_work_ids_from_bookmarks_page(
         self,
         list_url,
@@ -113,85 +287,76 @@ class User(object):
         expand_series=False,
         oldest_date=None,
         date_type="",
+        series_memo=None,
+        seen=None,
     ):
         """A modified version of utils.get_list_of_work_ids that can handle getting
         links to works and series in the same list.
         If expand_series=True, all works in a bookmarked series will be treated
         as individual bookmarks. Otherwise, series bookmarks will be ignored.
 
-        Returns a list of work ids from a paginated list.
+        Series are expanded in the background while we carry on paging through
+        the bookmarks, and each series is only expanded once.
+
+        Returns a list of work ids from a paginated list, without duplicates.
         Ignores external work bookmarks.
         User must be logged in to see private bookmarks.
         """
-        query = urlparse(list_url).query
-        if not query:
-            list_url += "?page=%d"
-        elif "page" not in query:
-            list_url += "&page=%d"
+        if series_memo is None:
+            series_memo = SeriesMemo()
 
-        work_ids = []
-        max_works_found = False
-
-        for page_no in itertools.count(start=1):
-            print(
-                "Loading page: \t %d of list. \t %d ids found up to now."
-                % (page_no, len(work_ids))
+        with ThreadPoolExecutor(max_workers=SERIES_EXPANSION_WORKERS) as executor:
+            entries = _BookmarkEntries(
+                executor,
+                lambda series_id: self._expand_series(series_id, session, series_memo),
             )
-
-            req = get_with_timeout(session, list_url % page_no)
-            soup = BeautifulSoup(req.text, features="html.parser")
-
-            for id_type, id, date in get_ids_and_dates_from_page(soup, date_type):
-                if oldest_date and date and date < oldest_date:
-                    print(
-                        id_type
-                        + "/"
-                        + id
-                        + " has date "
-                        + datetime.strftime(date, AO3_DATE_FORMAT)
-                        + ". Stopping here."
-                    )
-                    max_works_found = True
-                    break
-
-                if id_type == TYPE_WORKS:
-                    work_ids.append(id)
-                elif expand_series is True and id_type == TYPE_SERIES:
-                    print(f"Getting all urls from series {id}....")
-                    series = Series(id, session, self.ao3_url)
-                    for i in series.work_ids():
-                        work_ids.append(i)
-
-                if max_count and len(work_ids) >= max_count:
-                    max_works_found = True
-                    work_ids = work_ids[0:max_count]
+            for page_no, soup in iter_pages(list_url, session, owner=self.username):
+                print(
+                    "Loading page: \t %d of list. \t %d ids found up to now."
+                    % (page_no, entries.count)
+                )
+
+                max_works_found = False
+
+                for id_type, id, date in get_ids_and_dates_from_page(soup, date_type):
+                    if oldest_date and date and date < oldest_date:
+                        print(
+                            id_type
+                            + "/"
+                            + id
+                            + " has date "
+                            + datetime.strftime(date, AO3_DATE_FORMAT)
+                            + ". Stopping here."
+                        )
+                        max_works_found = True
+                        break
+
+                    if id_type == TYPE_WORKS:
+                        if seen is None or id not in seen:
+                            entries.add_work(id)
+                    elif expand_series is True and id_type == TYPE_SERIES:
+                        entries.add_series(id)
+
+                    # Series still being expanded aren't counted yet, so we may
+                    # read a page more than we need; the list is trimmed below.
+                    if max_count and entries.count >= max_count:
+                        max_works_found = True
+                        break
+
+                if max_works_found:
                     break
 
-            if max_works_found:
-                break
-
-            # The pagination button at the end of the page is of the form
-            #
-            #     <li class="next" title="next"> ... </li>
-            #
-            # If there's another page of results, this contains an <a> tag
-            # pointing to the next page.  Otherwise, it contains a <span>
-            # tag with the 'disabled' class.
-            try:
-                next_button = soup.find("li", attrs={"class": "next"})
-                if next_button.find("span", attrs={"class": "disabled"}):
-                    break
-            except:
-                # In case of absence of "next"
-                break
+        series_memo.save()
 
+        work_ids = entries.work_ids(max_count, seen)
         print(str(len(work_ids)) + " ids found.")
 
         return work_ids
 
-    def marked_for_later_ids(self, max_count=None, oldest_date=None):
+    def marked_for_later_ids(self, max_count=None, oldest_date=None, seen=None):
         """
         Returns a list of the user's marked-for-later ids.
+        If a SeenSet is given as seen, works already in it are skipped.
         """
         url = f"{self.ao3_url}/users/{self.username}/readings?show=to-read"
 
@@ -201,6 +366,8 @@ class User(object):
             max_count=max_count,
             oldest_date=oldest_date,
             date_type=DATE_INTERACTED_WITH,
+            owner=self.username,
+            seen=seen,
         )
 
     def user_subscription_ids(self, max_count=None):
@@ -230,7 +397,17 @@ class User(object):
             max_count,
         )
 
-    def bookmarks(self, max_count=None, expand_series=False):
+    def subscription_updates(self, state_path=None):
+        """
+        Returns a list of SubscriptionChange for the subscribed works and
+        series that have changed since the last check (see
+        ao3.subscriptions.SubscriptionMonitor).
+        """
+        from .subscriptions import SubscriptionMonitor
+
+        return SubscriptionMonitor(self, state_path).check()
+
+    def bookmarks(self, max_count=None, expand_series=False, series_memo=None):
         """
         Returns a list of the user's bookmarks as Work objects.
         Takes forever.
@@ -238,7 +415,9 @@ class User(object):
         """
 
         bookmark_total = 0
-        bookmark_ids = self.bookmarks_ids(max_count, expand_series)
+        bookmark_ids = self.bookmarks_ids(
+            max_count, expand_series, series_memo=series_memo
+        )
         bookmarks = []
 
         for bookmark_id in bookmark_ids:
@@ -269,148 +448,16 @@ class User(object):
         api_url = f"{self.ao3_url}/users/{self.username}/readings?page=%d"
 
         for page_no in itertools.count(start=1):
-            req = get_with_timeout(self.session, api_url % page_no)
+            req = get_with_timeout(
+                self.session, api_url % page_no, owner=self.username
+            )
             print("On page: " + str(page_no))
             print("Cumulative deleted works encountered: " + str(self.deleted))
 
-            # if timeout, wait and try again
-            while len(req.text) < 20 and "Retry later" in req.text:
-                print("timeout... waiting 3 mins and trying again")
-                time.sleep(180)
-                req = get_with_timeout(self.session, api_url % page_no)
-
             soup = BeautifulSoup(req.text, features="html.parser")
-            # The entries are stored in a list of the form:
-            #
-            #     <ol class="reading work index group">
-            #       <li id="work_12345" class="reading work blurb group">
-            #         ...
-            #       </li>
-            #       <li id="work_67890" class="reading work blurb group">
-            #         ...
-            #       </li>
-            #       ...
-            #     </ol>
-            #
-            ol_tag = soup.find("ol", attrs={"class": "reading"})
-            for li_tag in ol_tag.findAll("li", attrs={"class": "blurb"}):
-                try:
-                    work_id = li_tag.attrs["id"].replace("work_", "")
-
-                    # Within the <li>, the last viewed date is stored as
-                    #
-                    #     <h4 class="viewed heading">
-                    #         <span>Last viewed:</span> 24 Dec 2012
-                    #
-                    #         (Latest version.)
-                    #
-                    #         Viewed once
-                    #     </h4>
-                    #
-                    h4_tag = li_tag.find("h4", attrs={"class": "viewed"})
-                    date_str = re.search(
-                        r"[0-9]{1,2} [A-Z][a-z]+ [0-9]{4}", h4_tag.contents[2]
-                    ).group(0)
-                    date = datetime.strptime(date_str, "%d %b %Y").date()
-
-                    if "Visited once" in h4_tag.contents[2]:
-                        # TODO: probably want to change these int values to ints
-                        # instead of strings...
-                        numvisits = "1"
-                    else:
-                        numvisits = re.search(
-                            r"Visited (\d*) times", h4_tag.contents[2]
-                        ).group(1)
-
-                    # cast all the beautifulsoup navigablestrings to strings
-                    title = str(
-                        li_tag.find("h4", attrs={"class": "heading"})
-                        .find("a")
-                        .contents[0]
-                    )
-
-                    author = []  # this is if there's multiple authors
-                    author_tag = li_tag.find("h4", attrs={"class": "heading"})
-                    for x in author_tag.find_all("a", attrs={"rel": "author"}):
-                        author.append(str(x.contents[0]))
-                    # TODO: if Anonymous author (no link), should not take the
-                    # contents, since it'll be blank
-                    # Probably something similar to the chapters checker
-
-                    fandom = []
-                    fandom_tag = li_tag.find("h5", attrs={"class": "fandoms"})
-                    for x in fandom_tag.find_all("a", attrs={"class": "tag"}):
-                        fandom.append(str(x.contents[0]))
-
-                    warnings = []
-                    for x in li_tag.find_all("li", attrs={"class": "warnings"}):
-                        warnings.append(str(x.find("a").contents[0]))
-                    relationships = []
-                    for x in li_tag.find_all("li", attrs={"class": "relationships"}):
-                        relationships.append(str(x.find("a").contents[0]))
-                    characters = []
-                    for x in li_tag.find_all("li", attrs={"class": "characters"}):
-                        characters.append(str(x.find("a").contents[0]))
-                    freeforms = []
-                    for x in li_tag.find_all("li", attrs={"class": "freeforms"}):
-                        freeforms.append(str(x.find("a").contents[0]))
-
-                    # this is longer bc sometimes chapters are a link and sometimes
-                    # not, so need to normalize
-                    chapters = li_tag.find("dd", attrs={"class", "chapters"})
-                    if chapters.find("a") is not None:
-                        chapters.find("a").replaceWithChildren()
-                    chapters = "".join(chapters.contents)
-                    hits = str(li_tag.find("dd", attrs={"class", "hits"}).contents[0])
-
-                    # sometimes the word count is blank
-                    words_tag = li_tag.find("dd", attrs={"class", "words"})
-                    if len(words_tag.contents) == 0:
-                        words = "0"
-                    else:
-                        words = str(words_tag.contents[0])
-
-                    # for comments/kudos/bookmarks, need to check if the tag exists, bc
-                    # if there are no comments etc it will not exist
-                    comments_tag = li_tag.find("dd", attrs={"class", "comments"})
-                    if comments_tag is not None:
-                        comments = str(comments_tag.contents[0].contents[0])
-                    else:
-                        comments = "0"
-                    kudos_tag = li_tag.find("dd", attrs={"class", "kudos"})
-                    if kudos_tag is not None:
-                        kudos = str(kudos_tag.contents[0].contents[0])
-                    else:
-                        kudos = "0"
-                    bookmarks_tag = li_tag.find("dd", attrs={"class", "bookmarks"})
-                    if bookmarks_tag is not None:
-                        bookmarks = str(bookmarks_tag.contents[0].contents[0])
-                    else:
-                        bookmarks = "0"
-
-                    pubdate_str = li_tag.find(
-                        "p", attrs={"class", "datetime"}
-                    ).contents[0]
-                    pubdate = datetime.strptime(pubdate_str, "%d %b %Y").date()
-                    yield work_id, date, numvisits, title, author, fandom, warnings, relationships, characters, freeforms, words, chapters, comments, kudos, bookmarks, hits, pubdate
-
-                except (KeyError, AttributeError) as e:
-                    # A deleted work shows up as
-                    #
-                    #      <li class="deleted reading work blurb group">
-                    #
-                    # There's nothing that we can do about that, so just skip
-                    # over it.
-                    if "deleted" in li_tag.attrs["class"]:
-                        self.deleted += 1
-                        pass
-                    # A locked work shows up with
-                    #       <div class="mystery header picture module">
-                    elif li_tag.find("div", attrs={"class", "mystery"}) is not None:
-                        self.deleted += 1
-                        pass
-                    else:
-                        raise
+            entries, deleted = parse_reading_history_page(soup)
+            self.deleted += deleted
+            yield from entries
 
             # The pagination button at the end of the page is of the form
             #
@@ -423,63 +470,49 @@ class User(object):
             if next_button.find("span", attrs={"class": "disabled"}):
                 break
 
-    def _get_list_of_subscription_ids(self, sub_type=TYPE_WORKS, max_count=None):
+    def _iter_subscription_entries(self, sub_type=TYPE_WORKS):
         """
-        Returns a list of ids from a list of the user's subscriptions:
+        Generates the <dt> tag for each of the user's subscriptions of one type:
         work, series or username.
         """
-        api_url = f"{self.ao3_url}/users/{self.username}/subscriptions?type={sub_type}&page=%d"
+        url = f"{self.ao3_url}/users/{self.username}/subscriptions?type={sub_type}"
 
-        sub_ids = []
-        max_subs_found = False
-
-        num_subs = 0
-        for page_no in itertools.count(start=1):
-            print(
-                "Loading page: \t"
-                + str(page_no)
-                + " of list. \t"
-                + str(num_subs)
-                + " ids found up to now."
-            )
-
-            req = get_with_timeout(self.session, api_url % page_no)
-            soup = BeautifulSoup(req.text, features="html.parser")
+        for page_no, soup in iter_pages(url, self.session, owner=self.username):
+            print("Loading page: \t" + str(page_no) + " of list.")
 
+            # The subscriptions are stored in a list of the form
+            #
+            #     <dl class="subscription index group">
+            #       <dt>
+            #         <a href="/works/12345">Work Title</a>
+            #         by <a rel="author" href="/users/name/pseuds/name">name</a>
+            #       </dt>
+            #       <dd>[unsubscribe button]</dd>
+            #       ...
+            #     </dl>
+            #
             table_tag = soup.find("dl", attrs={"class": "subscription"})
+            if table_tag is None:
+                break
 
             for dt in table_tag.find_all("dt"):
-                for link in dt.find_all("a"):
-                    # For some reason, dt.find('a') is giving a NavigableString instead
-                    # of a tag object, but dt.find_all('a') works. We only want the
-                    # first of the links here.
-                    yield link.get("href").replace("/" + sub_type + "/", "")
-                    break
+                yield dt
 
-                num_subs += 1
-                sub_ids.append(id)
-
-                if max_count and num_subs >= max_count:
-                    max_subs_found = True
-                    sub_ids = sub_ids[0:max_count]
-                    break
-
-            if max_subs_found:
-                break
-
-            # The pagination button at the end of the page is of the form
-            #
-            #     <li class="next" title="next"> ... </li>
-            #
-            # If there's another page of results, this contains an <a> tag
-            # pointing to the next page.  Otherwise, it contains a <span>
-            # tag with the 'disabled' class.
-            try:
-                next_button = soup.find("li", attrs={"class": "next"})
-                if next_button.find("span", attrs={"class": "disabled"}):
-                    break
-            except:
-                # In case of absence of "next"
+    def _get_list_of_subscription_ids(self, sub_type=TYPE_WORKS, max_count=None):
+        """
+        Generates the ids from a list of the user's subscriptions:
+        work, series or username.
+        """
+        num_subs = 0
+        for dt in self._iter_subscription_entries(sub_type):
+            # For some reason, dt.find('a') is giving a NavigableString instead
+            # of a tag object, but dt.find_all('a') works. We only want the
+            # first of the links here.
+            links = dt.find_all("a")
+            if not links:
+                continue
+            yield links[0].get("href").replace("/" + sub_type + "/", "")
+
+            num_subs += 1
+            if max_count and num_subs >= max_count:
                 break
-
-        return sub_ids
@@ -3,11 +3,13 @@
 
 import itertools
 import re
+import threading
 import time
 from datetime import datetime
 from urllib.parse import urlparse
 
-from bs4 import BeautifulSoup
+from .retry import DEFAULT_RETRY_POLICY
+from .singleflight import SingleFlight, normalize_url
 
 # Regex for extracting the work ID from an AO3 URL.  Designed to match URLs
 # of the form
@@ -21,7 +23,6 @@ WORK_URL_REGEX = re.compile(
 
 BASE_URL = "https://archiveofourown.org"
 
-LAST_VISITED_REGEX = re.compile("Last visited: ([0-9]{2} [a-zA-Z]{3} [0-9]{4})")
 WORKS_HEADER_REGEX = re.compile(" ([0-9]*) Works?")
 
 TYPE_WORKS = "works"
@@ -31,6 +32,57 @@ AO3_DATE_FORMAT = "%d %b %Y"
 DATE_UPDATED = "updated"
 DATE_INTERACTED_WITH = "interacted"
 
+# AO3 got stricter with rate limits, so let's be careful
+DEFAULT_REQUEST_INTERVAL = 5
+
+# When requests go through a Scheduler, interactive lookups (a single work,
+# a series' info) jump ahead of the requests made by long crawls.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+
+class RateLimiter(object):
+    """Spaces out requests so that at most one starts every ``interval`` seconds.
+
+    It's thread-safe, so one RateLimiter shared between threads keeps their
+    combined request rate under the limit.
+    """
+
+    def __init__(self, interval=DEFAULT_REQUEST_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next_request = 0
+
+    def __repr__(self):
+        return f"{type(self).__name__}(interval={self.interval!r})"
+
+    def _reserve(self):
+        """Claim the next slot, and return how long to wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_request - now
+            self._next_request = max(now, self._next_request) + self.interval
+        return delay
+
+    def wait(self):
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def wait_async(self):
+        """Like wait(), but lets other asyncio tasks run in the meantime."""
+        import asyncio
+
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+# Used for sessions that don't bring their own rate limiter or SingleFlight,
+# e.g. a plain requests.Session passed in by the caller.
+DEFAULT_RATE_LIMITER = RateLimiter()
+DEFAULT_SINGLE_FLIGHT = SingleFlight()
+
 
 def work_id_from_url(url):
     """Given an AO3 URL, return the work ID."""
@@ -45,36 +97,94 @@ def work_url_from_id(work_id):
     return f"{BASE_URL}/works/{work_id}"
 
 
+def page_url(list_url, page_no):
+    """
+    Returns the URL of page ``page_no`` of a paginated list.  ``list_url`` may
+    already have a ``page=%d`` placeholder, for the page number to go in.
+
+    This doesn't use %-formatting, because list URLs are often
+    percent-encoded (tag names, search queries).
+    """
+    if "page=%d" in list_url:
+        return list_url.replace("page=%d", f"page={page_no}")
+    sep = "&" if urlparse(list_url).query else "?"
+    return f"{list_url}{sep}page={page_no}"
+
+
+def iter_pages(list_url, session, owner=None):
+    """
+    Generates (page number, parsed page) for each page of a paginated list,
+    stopping after the last page.
+    """
+    for page_no in itertools.count(start=1):
+        soup = get_soup(session, page_url(list_url, page_no), owner=owner)
+        yield page_no, soup
+
+        # The pagination button at the end of the page is of the form
+        #
+        #     <li class="next" title="next"> ... </li>
+        #
+        # If there's another page of results, this contains an <a> tag
+        # pointing to the next page.  Otherwise, it contains a <span>
+        # tag with the 'disabled' class.
+        try:
+            next_button = soup.find("li", attrs={"class": "next"})
+            if next_button.find("span", attrs={"class": "disabled"}):
+                break
+        except:
+            # In case of absence of "next"
+            break
+
+
+def last_page_number(soup):
+    """Returns the number of pages in a paginated list, from the links to
+    each page at the bottom of (any) one of them:
+
+        <ol class="pagination actions">
+          <li class="previous">...</li>
+          <li><a href="...?page=1">1</a></li>
+          ...
+          <li><a href="...?page=42">42</a></li>
+          <li class="next">...</li>
+        </ol>
+    """
+    pagination = soup.find("ol", attrs={"class": "pagination"})
+    if pagination is None:
+        return 1
+    numbers = [
+        int(li.text.strip())
+        for li in pagination.find_all("li")
+        if li.text.strip().isdigit()
+    ]
+    return max(numbers, default=1)
+
+
 def get_list_of_work_ids(
     list_url,
     session,
     max_count=None,
     oldest_date=None,
     date_type="",
+    owner=None,
+    seen=None,
 ):
     """
     Returns a list of work ids from a paginated list (bookmarks, collection, series,
     etc).
     Ignores external work bookmarks.
     User must be logged in to see private bookmarks.
+    If a SeenSet (see ao3.seen) is given as seen, works already in it are
+    skipped, and the rest are added to it.
     """
-    query = urlparse(list_url).query
-    if not query:
-        list_url += "?page=%d"
-    elif "page" not in query:
-        list_url += "&page=%d"
-
     work_ids = []
-    max_works_found = False
 
-    for page_no in itertools.count(start=1):
+    for page_no, soup in iter_pages(list_url, session, owner=owner):
         print(
             "Loading page: \t %d of list. \t %d ids found up to now."
             % (page_no, len(work_ids))
         )
 
-        req = get_with_timeout(session, list_url % page_no)
-        soup = BeautifulSoup(req.text, features="html.parser")
+        max_works_found = False
 
         for id_type, id, date in get_ids_and_dates_from_page(soup, date_type):
             if oldest_date and date and date < oldest_date:
@@ -89,7 +199,7 @@ def get_list_of_work_ids(
                 max_works_found = True
                 break
 
-            if id_type == TYPE_WORKS:
+            if id_type == TYPE_WORKS and (seen is None or seen.add(id)):
                 work_ids.append(id)
 
             if max_count and len(work_ids) >= max_count:
@@ -100,21 +210,6 @@ def get_list_of_work_ids(
         if max_works_found:
             break
 
-        # The pagination button at the end of the page is of the form
-        #
-        #     <li class="next" title="next"> ... </li>
-        #
-        # If there's another page of results, this contains an <a> tag
-        # pointing to the next page.  Otherwise, it contains a <span>
-        # tag with the 'disabled' class.
-        try:
-            next_button = soup.find("li", attrs={"class": "next"})
-            if next_button.find("span", attrs={"class": "disabled"}):
-                break
-        except:
-            # In case of absence of "next"
-            break
-
     print(str(len(work_ids)) + " ids found.")
 
     return work_ids
@@ -156,77 +251,96 @@ def get_ids_and_dates_from_page(soup, date_type):
     #       </li>
     #       ...
     #     </ul>
-    list_tag = soup.find("ol", attrs={"class": "index"})
-    if not list_tag:
-        list_tag = soup.find("ul", attrs={"class": "index"})
-    if not list_tag:
-        return []
+    #
+    # Each blurb is read once by ao3.blurbs.parse_blurb().
+    from .blurbs import iter_blurbs
 
-    for li_tag in list_tag.findAll("li", attrs={"class": "blurb"}):
-        try:
-            if date_type == DATE_UPDATED:
-                date = get_work_update_date(li_tag)
-            else:
-                date = get_user_interaction_date(li_tag)
-
-            # <h4 class="heading">
-            #     <a href="/works/12345678">Work Title</a>
-            #     <a href="/users/authorname/pseuds/authorpseud" rel="author">Author Name</a>
-            # </h4>
-
-            # or, for collection pages:
-
-            # <h4 class="heading">
-            #     <a href="/collections/xyz123/works/12345678">Work Title</a>
-            #     <a href="/users/authorname/pseuds/authorpseud" rel="author">Author Name</a>
-            # </h4>
-
-            for h4_tag in li_tag.findAll("h4", attrs={"class": "heading"}):
-                for link in h4_tag.findAll("a"):
-                    if ("works" in link.get("href")) and not (
-                        "external_works" in link.get("href")
-                    ):
-                        yield TYPE_WORKS, link.get("href").split("/works/")[-1], date
-                    elif "series" in link.get("href"):
-                        yield TYPE_SERIES, link.get("href").replace(
-                            "/series/", ""
-                        ), date
-        except KeyError:
-            # A deleted work shows up as
-            #
-            #      <li class="deleted reading work blurb group">
-            #
-            # There's nothing that we can do about that, so just skip
-            # over it.
-            if "deleted" in li_tag.attrs["class"]:
-                pass
-            else:
-                raise
-
-
-def get_with_timeout(session, url):
-    # AO3 got stricter with rate limits, so let's be careful
-    time.sleep(5)
-
-    # if timeout, wait and try again
-    while True:
-        req = session.get(url)
-        if req.status_code == 200:
-            break
-        elif req.status_code == 503:
-            print("Got error 503... waiting 10 seconds and trying again")
-            time.sleep(10)
-        elif req.status_code == 525:
-            print("Got Cloudflare error 525... waiting 10 seconds and trying again")
-            time.sleep(10)
-        elif len(req.text) < 20 and "Retry later" in req.text:
-            print("Timeout... waiting 3 mins and trying again")
-            time.sleep(180)
-        else:
-            raise RuntimeError(
-                f"Error getting url {url}: {req.status_code}, {req.reason}"
-            )
+    for blurb in iter_blurbs(soup):
+        date = blurb.updated if date_type == DATE_UPDATED else blurb.user_date
+        if blurb.work_id is not None:
+            yield TYPE_WORKS, blurb.work_id, date
+        elif blurb.series_id is not None:
+            yield TYPE_SERIES, blurb.series_id, date
+        # Otherwise it's a deleted work or an external work; there's nothing
+        # that we can do about those, so just skip over them.
+
+
+def get_with_timeout(session, url, priority=PRIORITY_BACKGROUND, owner=None):
+    """Fetch a URL, waiting and retrying if AO3 asks us to slow down.
+
+    If the same URL is already being fetched with this session (or was
+    fetched in the last few seconds), the response from that request is
+    returned instead of making another one.
+
+    If the session has a Scheduler, the request is queued there; ``priority``
+    and ``owner`` (e.g. the username whose bookmarks are being crawled) decide
+    when it's sent.
+    """
+    single_flight = getattr(session, "single_flight", None) or DEFAULT_SINGLE_FLIGHT
+    # Keyed on the session itself rather than its id(), which a new session
+    # could be given once this one is gone.
+    return single_flight.do(
+        (session, normalize_url(url)),
+        lambda: _fetch(session, url, priority, owner),
+    )
 
+
+def _fetch(session, url, priority, owner):
+    scheduler = getattr(session, "scheduler", None)
+    if scheduler is not None:
+        return scheduler.submit(session, url, priority=priority, owner=owner).result()
+
+    rate_limiter = getattr(session, "rate_limiter", None) or DEFAULT_RATE_LIMITER
+    rate_limiter.wait()
+    return send_with_retries(session, url)
+
+
+async def aget_with_timeout(session, url):
+    """Fetch a URL from asyncio code, waiting and retrying if AO3 asks us to
+    slow down.  The session's transport has to support it (see
+    ao3.transport.HttpxTransport).
+
+    Requests still take turns with the session's rate limiter (or its
+    scheduler's), but skip SingleFlight and the Scheduler's queue, which
+    work with threads.
+    """
+    scheduler = getattr(session, "scheduler", None)
+    if scheduler is not None:
+        rate_limiter = scheduler.rate_limiter
+    else:
+        rate_limiter = getattr(session, "rate_limiter", None) or DEFAULT_RATE_LIMITER
+    await rate_limiter.wait_async()
+
+    retry_policy = getattr(session, "retry_policy", None) or DEFAULT_RETRY_POLICY
+    req = await retry_policy.asend(session, url)
+    if req.status_code != 200:
+        raise RuntimeError(f"Error getting url {url}: {req.status_code}, {req.reason}")
+    return req
+
+
+def get_soup(session, url, priority=PRIORITY_BACKGROUND, owner=None):
+    """Fetch a URL with get_with_timeout, and return the parsed page.
+
+    The parsed page is kept with the response, so callers that share a
+    response also share the work of parsing it.  Don't modify the tree!
+    """
+    from bs4 import BeautifulSoup
+
+    req = get_with_timeout(session, url, priority=priority, owner=owner)
+    soup = getattr(req, "_ao3_soup", None)
+    if soup is None:
+        soup = req._ao3_soup = BeautifulSoup(req.text, features="html.parser")
+    return soup
+
+
+def send_with_retries(session, url):
+    """Send a request right away (no rate limiting), retrying as the session's
+    RetryPolicy says if AO3 asks us to slow down.
+    """
+    retry_policy = getattr(session, "retry_policy", None) or DEFAULT_RETRY_POLICY
+    req = retry_policy.send(session, url)
+    if req.status_code != 200:
+        raise RuntimeError(f"Error getting url {url}: {req.status_code}, {req.reason}")
     return req
 
 
@@ -238,20 +352,27 @@ def get_user_interaction_date(li_tag):
     For other works (from pages where we don't see information about the
     user's interaction with fics), return None.
     """
-    for div in li_tag.findAll("div", attrs={"class": "user"}):
-        for p in div.findAll("p", attrs={"class": "datetime"}):
-            return datetime.strptime(p.text, AO3_DATE_FORMAT)
+    from .blurbs import parse_blurb
 
-        for h4 in div.findAll("h4", attrs={"class": "viewed"}):
-            m = LAST_VISITED_REGEX.search(h4.text)
-            if m:
-                date = m.group(1)
-                return datetime.strptime(date, AO3_DATE_FORMAT)
+    return parse_blurb(li_tag).user_date
 
-    return None
+
+def get_blurb_stat(li_tag, class_name):
+    """Returns one of the numbers in a work's blurb, e.g. its kudos, which
+    are shown as
+
+        <dd class="kudos"><a href="/works/12345/kudos">1,234</a></dd>
+
+    A stat that's missing (e.g. a work with no comments) is 0.
+    """
+    dd_tag = li_tag.find("dd", attrs={"class": class_name})
+    if dd_tag is None:
+        return 0
+    value = dd_tag.get_text().replace(",", "").strip()
+    return int(value) if value.isdigit() else 0
 
 
 def get_work_update_date(li_tag):
-    for div in li_tag.findAll("div", attrs={"class": "header"}):
-        for p in div.findAll("p", attrs={"class": "datetime"}):
-            return datetime.strptime(p.text, AO3_DATE_FORMAT)
+    from .blurbs import parse_blurb
+
+    return parse_blurb(li_tag).updated
@@ -0,0 +1,68 @@
+# -*- encoding: utf-8
+"""Variable-length integers, for compact binary files.
+
+Each integer is written 7 bits at a time, low bits first, with the top bit
+of each byte set if more bytes follow (as in protobuf), so small numbers
+take a single byte.  Sorted lists of IDs are written as the differences
+between neighbours, which are small, rather than the IDs themselves.
+"""
+
+
+def encode(value, out):
+    """Append a non-negative integer to the bytearray ``out``."""
+    if value < 0:
+        raise ValueError(f"Cannot encode negative number {value!r} as a varint")
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode(buf, pos):
+    """Read an integer from ``buf`` at ``pos``.  Returns (value, new pos)."""
+    value = 0
+    shift = 0
+    while True:
+        try:
+            byte = buf[pos]
+        except IndexError:
+            raise ValueError("Truncated varint") from None
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def encode_signed(value, out):
+    """Append an integer that may be negative, zigzag-encoded (0, -1, 1, -2,
+    ... become 0, 1, 2, 3, ...) so that small negative numbers stay small.
+    """
+    encode(-2 * value - 1 if value < 0 else 2 * value, out)
+
+
+def decode_signed(buf, pos):
+    """Read an integer written by encode_signed().  Returns (value, new pos)."""
+    value, pos = decode(buf, pos)
+    return (value >> 1) ^ -(value & 1), pos
+
+
+def encode_deltas(values, out):
+    """Append a sorted list of integers, preceded by its length."""
+    encode(len(values), out)
+    previous = 0
+    for value in values:
+        encode(value - previous, out)
+        previous = value
+
+
+def decode_deltas(buf, pos):
+    """Read a list written by encode_deltas().  Returns (list, new pos)."""
+    count, pos = decode(buf, pos)
+    values = []
+    previous = 0
+    for _ in range(count):
+        delta, pos = decode(buf, pos)
+        previous += delta
+        values.append(previous)
+    return values, pos
@@ -1,12 +1,16 @@
 # -*- encoding: utf-8
 
+import functools
 import json
+import re
 from datetime import datetime
+from urllib.parse import urljoin
 
-import cloudscraper
 from bs4 import BeautifulSoup, Tag
 
-from .utils import BASE_URL, get_with_timeout
+from . import downloads
+from .session import default_session
+from .utils import BASE_URL, PRIORITY_INTERACTIVE, get_soup, get_with_timeout
 
 
 class WorkNotFound(Exception):
@@ -21,15 +25,132 @@ class HiddenWork(Exception):
     pass
 
 
+ADULT_CONTENT_WARNING = "This work could have adult content"
+
+
+def check_work_page(id, html):
+    """Raise if a work page is a placeholder rather than the work."""
+    # Check for restricted works, which require you to be logged in
+    # first.  See https://archiveofourown.org/admin_posts/138
+    # To make this work, we'd need to have a common Session object
+    # across all the API classes.  Not impossible, but fiddlier than I
+    # care to implement right now.
+    # TODO: Fix this.
+    if "This work is only available to registered users" in html:
+        raise RestrictedWork(f"Looking at work ID {id} requires login")
+
+    if "This work is part of an ongoing challenge and will be revealed soon!" in html:
+        raise HiddenWork(f"Work ID {id} is currently hidden")
+
+
+# The properties of a Work that are read from its page, and kept in its
+# WorkRecord once the page is released.
+EXTRACTED_FIELDS = (
+    "title",
+    "author",
+    "summary",
+    "rating",
+    "warnings",
+    "category",
+    "fandoms",
+    "relationship",
+    "characters",
+    "additional_tags",
+    "language",
+    "published",
+    "collections",
+    "completed",
+    "words",
+    "chapters",
+    "comments",
+    "kudos",
+    "kudos_left_by",
+    "bookmarks",
+    "hits",
+    "download_urls",
+)
+
+
+def _plain(value):
+    """Turn the NavigableStrings in a value into plain strings, since each
+    one keeps a reference to (and so keeps alive) the whole parse tree.
+    """
+    if isinstance(value, str):
+        return str(value)
+    if isinstance(value, (list, tuple)):
+        return type(value)(_plain(v) for v in value)
+    return value
+
+
+class WorkRecord(object):
+    """The values of a Work's properties, extracted from its page.
+
+    A parsed work page is several megabytes of Python objects; this is the
+    few hundred bytes we actually want from it.  If a property couldn't be
+    read (e.g. a work with no summary), the exception is kept instead, and
+    raised when you ask for it.
+    """
+
+    __slots__ = EXTRACTED_FIELDS
+
+    @classmethod
+    def extract(cls, work):
+        record = cls()
+        for name in EXTRACTED_FIELDS:
+            try:
+                value = getattr(work, name)
+                if name == "kudos_left_by":
+                    # One string is far smaller than thousands of them.
+                    value = "\n".join(value)
+                value = _plain(value)
+            except Exception as err:
+                # Its traceback would keep the parse tree alive.
+                value = err.with_traceback(None)
+                value.__context__ = None
+            setattr(record, name, value)
+        return record
+
+    def get(self, name):
+        value = getattr(self, name)
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+
+def _extracted(func):
+    """A property that's read from the work page, or from the WorkRecord if
+    the page has been released.
+    """
+
+    @functools.wraps(func)
+    def wrapper(self):
+        if self._record is not None:
+            return self._record.get(func.__name__)
+        return func(self)
+
+    return property(wrapper)
+
+
 class Work(object):
-    def __init__(self, id, sess=None, ao3_url=BASE_URL):
+    """A work on AO3.
+
+    :param retain: keep the page's HTML and parse tree (as ``_html`` and
+        ``_soup``) for as long as the Work.  By default they're released as
+        soon as every property has been read from them, which makes a Work
+        thousands of times smaller.
+    """
+
+    def __init__(self, id, sess=None, ao3_url=BASE_URL, retain=False):
         self.id = id
         if sess is None:
-            sess = cloudscraper.create_scraper()
+            sess = default_session()
+        self.session = sess
         self.ao3_url = ao3_url
 
         # Fetch the HTML for this work
-        req = get_with_timeout(sess, f"{self.ao3_url}/works/{self.id}")
+        req = get_with_timeout(
+            sess, f"{self.ao3_url}/works/{self.id}", priority=PRIORITY_INTERACTIVE
+        )
 
         if req.status_code == 404:
             raise WorkNotFound(f"Unable to find a work with id {self.id!r}")
@@ -40,28 +161,53 @@ class Work(object):
 
         # For some works, AO3 throws up an interstitial page asking you to
         # confirm that you really want to see the adult works.  Yes, we do.
-        if "This work could have adult content" in req.text:
+        if ADULT_CONTENT_WARNING in req.text:
             req = get_with_timeout(
-                sess, f"{self.ao3_url}/works/{self.id}?view_adult=true"
+                sess,
+                f"{self.ao3_url}/works/{self.id}?view_adult=true",
+                priority=PRIORITY_INTERACTIVE,
             )
 
-        # Check for restricted works, which require you to be logged in
-        # first.  See https://archiveofourown.org/admin_posts/138
-        # To make this work, we'd need to have a common Session object
-        # across all the API classes.  Not impossible, but fiddlier than I
-        # care to implement right now.
-        # TODO: Fix this.
-        if "This work is only available to registered users" in req.text:
-            raise RestrictedWork("Looking at work ID %s requires login")
-
-        if (
-            "This work is part of an ongoing challenge and will be revealed soon!"
-            in req.text
-        ):
-            raise HiddenWork("Work ID %s is currently hidden")
-
-        self._html = req.text
-        self._soup = BeautifulSoup(self._html, "html.parser")
+        check_work_page(self.id, req.text)
+        self._load(req.text, retain)
+
+    @classmethod
+    def from_html(cls, id, html, ao3_url=BASE_URL, retain=False, sess=None):
+        """Create a Work from a copy of its page you've already fetched."""
+        work = cls.__new__(cls)
+        work.id = id
+        work.session = sess
+        work.ao3_url = ao3_url
+        work._load(html, retain)
+        return work
+
+    @classmethod
+    def from_record(cls, id, record, ao3_url=BASE_URL, sess=None):
+        """Create a Work from a WorkRecord extracted elsewhere, e.g. in
+        another process (see ao3.pipeline).
+        """
+        work = cls.__new__(cls)
+        work.id = id
+        work.session = sess
+        work.ao3_url = ao3_url
+        work._record = record
+        work._html = None
+        work._soup = None
+        return work
+
+    def _load(self, html, retain):
+        self._record = None
+        self._html = html
+        self._soup = BeautifulSoup(html, "html.parser")
+        if not retain:
+            self.release()
+
+    def release(self):
+        """Read every property from the page, then drop the page."""
+        if self._record is None:
+            self._record = WorkRecord.extract(self)
+        self._html = None
+        self._soup = None
 
     def __repr__(self):
         return f"{type(self).__name__}(id={self.id!r})"
@@ -80,7 +226,7 @@ class Work(object):
         """A URL to this work."""
         return f"{self.ao3_url}/works/{self.id}"
 
-    @property
+    @_extracted
     def title(self):
         """The title of this work."""
         # The title of the work is stored in an <h2> tag of the form
@@ -90,7 +236,7 @@ class Work(object):
         title_tag = self._soup.find("h2", attrs={"class": "title"})
         return title_tag.text.strip()
 
-    @property
+    @_extracted
     def author(self):
         """The author of this work."""
         # The author of the work is kept in the byline, in the form
@@ -108,7 +254,7 @@ class Work(object):
         else:
             return a_tag[0].contents[0].strip()
 
-    @property
+    @_extracted
     def summary(self):
         """The author summary of the work."""
         # The author summary is kept in the following format:
@@ -159,12 +305,12 @@ class Work(object):
         a_tags = [t.contents[0] for t in li_tags]
         return [t.contents[0] for t in a_tags]
 
-    @property
+    @_extracted
     def rating(self):
         """The age rating for this work."""
         return self._lookup_stat("rating")
 
-    @property
+    @_extracted
     def warnings(self):
         """Any archive warnings on the work."""
         value = self._lookup_stat("warning")
@@ -173,44 +319,44 @@ class Work(object):
         else:
             return value
 
-    @property
+    @_extracted
     def category(self):
         """The category of the work."""
         return self._lookup_stat("category")
 
-    @property
+    @_extracted
     def fandoms(self):
         """The fandoms in this work."""
         return self._lookup_stat("fandom")
 
-    @property
+    @_extracted
     def relationship(self):
         """The relationships in this work."""
         return self._lookup_stat("relationship")
 
-    @property
+    @_extracted
     def characters(self):
         """The characters in this work."""
         return self._lookup_stat("character")
 
-    @property
+    @_extracted
     def additional_tags(self):
         """Any additional tags on the work."""
         return self._lookup_stat("freeform")
 
-    @property
+    @_extracted
     def language(self):
         """The language in which this work is published."""
         return self._lookup_stat("language").strip()
 
-    @property
+    @_extracted
     def published(self):
         """The date when this work was published."""
         date_str = self._lookup_stat("published")
         date_val = datetime.strptime(date_str, "%Y-%m-%d")
         return date_val.date()
 
-    @property
+    @_extracted
     def collections(self):
         """Collections a work is part of."""
         if self._soup.find("dd", {"class": "collections"}):
@@ -220,7 +366,7 @@ class Work(object):
         else:
             return "error"
 
-    @property
+    @_extracted
     def completed(self):
         if self._soup.find("dd", {"class": "status"}):
             date_str = self._lookup_stat("status")
@@ -230,17 +376,35 @@ class Work(object):
             date_val = datetime.strptime(date_str, "%Y-%m-%d")
         return date_val.date()
 
-    @property
+    @_extracted
     def words(self):
         """The number of words in this work."""
         return int(self._lookup_stat("words"))
 
-    @property
+    @_extracted
+    def chapters(self):
+        """The number of chapters posted and planned, as AO3 shows them,
+        e.g. "3/5", or "3/?" if the author hasn't said.
+        """
+        # Newer pages link to the latest chapter:
+        #
+        #     <dd class="chapters"><a href="/works/1/chapters/3">3</a>/5</dd>
+        #
+        dd_tag = self._soup.find("dd", attrs={"class": "chapters"})
+        return dd_tag.get_text().strip()
+
+    def chapter_index(self):
+        """Returns a Chapter for each chapter that's been posted, from the
+        work's navigate page.  See ao3.works.chapter_index.
+        """
+        return chapter_index(self.id, self.session, self.ao3_url)
+
+    @_extracted
     def comments(self):
         """The number of comments on this work."""
         return int(self._lookup_stat("comments"))
 
-    @property
+    @_extracted
     def kudos(self):
         """The number of kudos on this work."""
         return int(self._lookup_stat("kudos"))
@@ -248,6 +412,12 @@ class Work(object):
     @property
     def kudos_left_by(self):
         """Returns a list of usernames who left kudos on this work."""
+        if self._record is not None:
+            usernames = self._record.get("kudos_left_by")
+            return iter(usernames.split("\n") if usernames else [])
+        return self._kudos_left_by()
+
+    def _kudos_left_by(self):
         # The list of usernames who left kudos is stored in the following
         # format:
         #
@@ -283,7 +453,7 @@ class Work(object):
 
             yield a_tag.attrs["href"].replace("/users/", "")
 
-    @property
+    @_extracted
     def bookmarks(self):
         """The number of times this work has been bookmarked."""
         # This returns a link of the form
@@ -294,11 +464,54 @@ class Work(object):
         # bookmarked this, but for now just return the number.
         return int(self._lookup_stat("bookmarks").contents[0])
 
-    @property
+    @_extracted
     def hits(self):
         """The number of hits this work has received."""
         return int(self._lookup_stat("hits"))
 
+    @_extracted
+    def download_urls(self):
+        """The links to download this work, as a dict of format -> URL."""
+        # The download links are in a menu of the form
+        #
+        #     <li class="download" aria-haspopup="true">
+        #       <a href="#">Download</a>
+        #       <ul class="expandable secondary">
+        #         <li><a href="/downloads/1234/Title.epub?updated_at=1577836800">EPUB</a></li>
+        #         ...
+        #       </ul>
+        #     </li>
+        #
+        # The updated_at changes whenever the work does.
+        li_tag = self._soup.find("li", attrs={"class": "download"})
+        if li_tag is None:
+            return {}
+        urls = {}
+        for a_tag in li_tag.find_all("a"):
+            href = a_tag.get("href", "")
+            if "/downloads/" in href:
+                urls[a_tag.get_text().strip().lower()] = urljoin(self.ao3_url, href)
+        return urls
+
+    def download(self, fmt, dest, verify=False):
+        """Download this work in one of AO3's download formats (see
+        ao3.downloads.FORMATS), streaming it to ``dest``: a file, or a
+        directory to save it in as <work ID>.<format>.
+
+        A file that's already a complete download of the current version is
+        left alone, and a download that was interrupted is resumed.  Returns
+        an ao3.downloads.Download.
+        """
+        fmt = fmt.lower()
+        urls = self.download_urls
+        if fmt not in urls:
+            raise ValueError(
+                f"Work {self.id} has no {fmt!r} download (found: {sorted(urls)})"
+            )
+        sess = self.session if self.session is not None else default_session()
+        path = downloads.download_path(dest, self.id, fmt)
+        return downloads.download(sess, urls[fmt], path, verify=verify)
+
     def json(self, *args, **kwargs):
         """Provide a complete representation of the work in JSON.
 
@@ -324,7 +537,7 @@ class Work(object):
                 "published": str(self.published),
                 "completed": str(self.completed),
                 "words": self.words,
-                # TODO: chapters
+                "chapters": self.chapters,
                 "comments": self.comments,
                 "kudos": self.kudos,
                 "bookmarks": self.bookmarks,
@@ -332,3 +545,211 @@ class Work(object):
             },
         }
         return json.dumps(data, *args, **kwargs)
+
+
+# A chapter's entry on the navigate page is "<number>. <title>"; chapters
+# the author hasn't named are called "Chapter <number>".
+NAVIGATE_TITLE_REGEX = re.compile(r"^\s*(?P<number>[0-9]+)\.\s*(?P<title>.*?)\s*$")
+NAVIGATE_DATE_REGEX = re.compile(r"\(([0-9]{4}-[0-9]{2}-[0-9]{2})\)")
+CHAPTER_URL_REGEX = re.compile(r"/chapters/(?P<chapter_id>[0-9]+)")
+
+
+def parse_chapter_index(soup, work_id, sess=None, ao3_url=BASE_URL):
+    """Returns a Chapter for each chapter listed on a work's navigate page:
+
+        <ol class="chapter index group" role="navigation">
+          <li>
+            <a href="/works/1/chapters/2">1. Title</a>
+            <span class="datetime">(2020-01-01)</span>
+          </li>
+          ...
+        </ol>
+    """
+    index = soup.find("ol", attrs={"class": "index"})
+    if index is None:
+        return []
+
+    chapters = []
+    for li_tag in index.find_all("li"):
+        a_tag = li_tag.find("a")
+        if a_tag is None:
+            continue
+
+        match = NAVIGATE_TITLE_REGEX.match(a_tag.get_text())
+        if match:
+            number, title = int(match.group("number")), match.group("title")
+        else:
+            number, title = len(chapters) + 1, a_tag.get_text().strip()
+
+        match = CHAPTER_URL_REGEX.search(a_tag.get("href", ""))
+        chapter_id = match.group("chapter_id") if match else None
+
+        published = None
+        span = li_tag.find("span", attrs={"class": "datetime"})
+        match = NAVIGATE_DATE_REGEX.search(span.text) if span is not None else None
+        if match:
+            published = datetime.strptime(match.group(1), "%Y-%m-%d").date()
+
+        chapters.append(
+            Chapter(
+                work_id,
+                chapter_id,
+                number,
+                title,
+                published,
+                sess=sess,
+                ao3_url=ao3_url,
+            )
+        )
+    return chapters
+
+
+def chapter_index(work_id, sess=None, ao3_url=BASE_URL):
+    """Returns a Chapter for each chapter of a work that's been posted, in
+    order.
+
+    This only fetches the work's navigate page, which is a few kilobytes
+    however long the work is.  Each chapter's text is fetched when you
+    first ask for it, so checking the newest chapter of a long work is two
+    small requests:
+
+        >>> chapters = chapter_index("1234", session)
+        >>> chapters[-1].number, chapters[-1].title, chapters[-1].published
+        (37, 'The Reckoning', datetime.date(2020, 1, 1))
+        >>> chapters[-1].content
+        '<p>...</p>'
+    """
+    if sess is None:
+        sess = default_session()
+    soup = get_soup(
+        sess, f"{ao3_url}/works/{work_id}/navigate", priority=PRIORITY_INTERACTIVE
+    )
+    check_work_page(work_id, soup.get_text())
+    return parse_chapter_index(soup, work_id, sess=sess, ao3_url=ao3_url)
+
+
+class Chapter(object):
+    """One chapter of a work, as listed on the work's navigate page.
+
+    The number, title and date come from the navigate page.  The chapter's
+    page is only fetched the first time you read ``summary``, ``notes`` or
+    ``content``, and only those three are kept from it.
+    """
+
+    def __init__(
+        self, work_id, id, number, title, published, sess=None, ao3_url=BASE_URL
+    ):
+        self.work_id = work_id
+        self.id = id
+        self.number = number
+        self.title = title
+        self.published = published
+        self.session = sess
+        self.ao3_url = ao3_url
+        self._parts = None
+
+    def __repr__(self):
+        return (
+            f"{type(self).__name__}(work_id={self.work_id!r}, id={self.id!r}, "
+            f"number={self.number!r}, title={self.title!r})"
+        )
+
+    def __eq__(self, other):
+        return (self.work_id, self.id) == (other.work_id, other.id)
+
+    def __ne__(self, other):
+        return not (self == other)
+
+    def __hash__(self):
+        return hash((self.work_id, self.id))
+
+    @property
+    def url(self):
+        """A URL to this chapter."""
+        if self.id is None:
+            return f"{self.ao3_url}/works/{self.work_id}"
+        return f"{self.ao3_url}/works/{self.work_id}/chapters/{self.id}"
+
+    def _fetch(self):
+        if self._parts is None:
+            sess = self.session if self.session is not None else default_session()
+            req = get_with_timeout(
+                sess, f"{self.url}?view_adult=true", priority=PRIORITY_INTERACTIVE
+            )
+            check_work_page(self.work_id, req.text)
+            self._parts = parse_chapter_page(BeautifulSoup(req.text, "html.parser"))
+        return self._parts
+
+    @property
+    def summary(self):
+        """The chapter summary as HTML, or None if it doesn't have one."""
+        return self._fetch()["summary"]
+
+    @property
+    def notes(self):
+        """The author's notes at the start of the chapter as HTML, or None."""
+        return self._fetch()["notes"]
+
+    @property
+    def content(self):
+        """The text of the chapter, as HTML."""
+        return self._fetch()["content"]
+
+
+def _userstuff_html(tag):
+    if tag is None:
+        return None
+    blockquote = tag.find(attrs={"class": "userstuff"})
+    if blockquote is None:
+        return None
+    return blockquote.renderContents().decode("utf8").strip()
+
+
+def parse_chapter_page(soup):
+    """Returns a dict of the summary, notes and content of a chapter page.
+
+    The chapter is laid out as
+
+        <div id="chapters" role="article">
+          <div class="chapter" id="chapter-37">
+            <div class="chapter preface group">
+              <h3 class="title">...</h3>
+              <div id="summary" class="summary module">
+                <h3 class="heading">Summary:</h3>
+                <blockquote class="userstuff">[summary_html]</blockquote>
+              </div>
+              <div id="notes" class="notes module">
+                <h3 class="heading">Notes:</h3>
+                <blockquote class="userstuff">[notes_html]</blockquote>
+              </div>
+            </div>
+            <div class="userstuff module" role="article">
+              <h3 class="landmark heading" id="work">Chapter Text</h3>
+              [content_html]
+            </div>
+            ...
+          </div>
+        </div>
+
+    A work with only one chapter has no preface, and the text is in a plain
+    <div class="userstuff">.
+    """
+    chapters_div = soup.find("div", attrs={"id": "chapters"})
+    if chapters_div is None:
+        raise RuntimeError("No chapter text found on the page")
+
+    preface = chapters_div.find("div", attrs={"class": "preface"})
+    summary = notes = None
+    if preface is not None:
+        summary = _userstuff_html(preface.find("div", attrs={"class": "summary"}))
+        notes = _userstuff_html(preface.find("div", attrs={"class": "notes"}))
+
+    text_div = chapters_div.find("div", attrs={"class": "userstuff"})
+    if text_div is None:
+        raise RuntimeError("No chapter text found on the page")
+    landmark = text_div.find("h3", attrs={"class": "landmark"})
+    if landmark is not None:
+        landmark.extract()
+    content = text_div.renderContents().decode("utf8").strip()
+
+    return {"summary": summary, "notes": notes, "content": content}
@@ -0,0 +1,63 @@
+# -*- encoding: utf-8
+"""Fakes shared by the tests, as fixtures.
+
+    def test_something(fake_session):
+        session = fake_session({r"/works/1$": "<html>...</html>"})
+"""
+
+import re
+
+import pytest
+
+
+class FakeResponse(object):
+    """A page, as much like a requests response as the package needs."""
+
+    reason = "OK"
+    encoding = "utf-8"
+
+    def __init__(self, text, status_code=200, headers=None):
+        self.text = text
+        self.content = text.encode(self.encoding)
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeSession(object):
+    """A session that answers from ``pages``, a dict of regex -> response.
+
+    A response is the text of a page, or a function that's called with the
+    URL and the request's keyword arguments (``stream``, ``headers``).
+    Every URL asked for is recorded in ``urls``.  Requests aren't rate
+    limited or shared, so tests run quickly and see every request.
+    """
+
+    def __init__(self, pages=None):
+        from ao3.singleflight import SingleFlight
+        from ao3.utils import RateLimiter
+
+        self.pages = pages if pages is not None else {}
+        self.urls = []
+        self.rate_limiter = RateLimiter(0)
+        self.single_flight = SingleFlight(window=0)
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        for pattern, page in self.pages.items():
+            if re.search(pattern, url):
+                if callable(page):
+                    page = page(url, **kwargs)
+                return FakeResponse(page) if isinstance(page, str) else page
+        raise AssertionError(f"Unexpected request for {url}")
+
+
+@pytest.fixture
+def fake_response():
+    """Returns a function that makes a FakeResponse."""
+    return FakeResponse
+
+
+@pytest.fixture
+def fake_session():
+    """Returns a function that makes a FakeSession answering from ``pages``."""
+    return FakeSession
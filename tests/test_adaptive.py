@@ -0,0 +1,151 @@
+# -*- encoding: utf-8
+"""Tests for ao3.adaptive."""
+
+import threading
+import time
+
+import pytest
+
+from ao3.adaptive import AdaptiveLimiter
+from ao3.session import Session
+
+
+class FakeResponse(object):
+    reason = "Reason"
+
+    def __init__(self, status_code=200, text="<html>A work</html>"):
+        self.status_code = status_code
+        self.text = text
+        self.headers = {}
+        self.url = "https://archiveofourown.org/works/1"
+
+
+def test_speeds_up_after_each_window_of_successes():
+    limiter = AdaptiveLimiter(rate=0.2, rate_step=0.1, concurrency=2)
+    limiter.record(0.5, FakeResponse())
+    assert (limiter.rate, limiter.concurrency) == (0.2, 2)
+
+    limiter.record(0.5, FakeResponse())
+    assert limiter.rate == pytest.approx(0.3)
+    assert limiter.concurrency == 3
+    assert limiter.interval == pytest.approx(1 / 0.3)
+
+
+def test_stays_within_its_limits():
+    limiter = AdaptiveLimiter(
+        rate=1, max_rate=1.05, concurrency=2, max_concurrency=2, cooldown=0
+    )
+    for _ in range(10):
+        limiter.record(0.5, FakeResponse())
+    assert (limiter.rate, limiter.concurrency) == (1.05, 2)
+
+    for _ in range(20):
+        limiter.record(0.5, FakeResponse(503))
+    assert limiter.rate == limiter.min_rate
+    assert limiter.concurrency == limiter.min_concurrency
+
+
+@pytest.mark.parametrize(
+    "response", [FakeResponse(429), FakeResponse(525), FakeResponse(200, "Retry later")]
+)
+def test_slows_down_when_ao3_is_overloaded(response):
+    limiter = AdaptiveLimiter(rate=1, concurrency=4)
+    limiter.record(0.5, response)
+    assert (limiter.rate, limiter.concurrency) == (0.5, 2)
+    assert limiter.metrics()["errors"] == 1
+
+
+def test_cuts_once_per_cooldown():
+    limiter = AdaptiveLimiter(rate=1, concurrency=8, cooldown=60)
+    for _ in range(5):
+        limiter.record(0.5, FakeResponse(503))
+    assert (limiter.rate, limiter.concurrency) == (0.5, 4)
+    assert limiter.metrics()["decreases"] == 1
+
+
+def test_slows_down_when_latency_rises():
+    limiter = AdaptiveLimiter(rate=1, concurrency=4, rate_step=0)
+    for _ in range(20):
+        limiter.record(0.2, FakeResponse())
+    assert limiter.metrics()["decreases"] == 0
+
+    for _ in range(5):
+        limiter.record(2.0, FakeResponse())
+    assert limiter.metrics()["decreases"] == 1
+    assert limiter.rate == 0.5
+
+
+def test_call_limits_requests_in_flight():
+    limiter = AdaptiveLimiter(concurrency=2, max_concurrency=2)
+    lock = threading.Lock()
+    in_flight = []
+    most = []
+
+    def request():
+        with lock:
+            in_flight.append(1)
+            most.append(len(in_flight))
+        time.sleep(0.02)
+        with lock:
+            in_flight.pop()
+        return FakeResponse()
+
+    threads = [threading.Thread(target=limiter.call, args=(request,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(most) == 2
+    assert limiter.metrics()["requests"] == 8
+    assert limiter.metrics()["in_flight"] == 0
+
+
+def test_streamed_responses_are_in_flight_until_closed():
+    limiter = AdaptiveLimiter(concurrency=1, max_concurrency=1)
+    response = FakeResponse()
+    closed = []
+    response.close = lambda: closed.append(True)
+
+    assert limiter.call(lambda: response, stream=True) is response
+    assert limiter.metrics()["in_flight"] == 1
+
+    response.close()
+    response.close()
+    assert closed == [True, True]
+    assert limiter.metrics()["in_flight"] == 0
+
+
+class FakeTransport(object):
+    cookies = None
+    headers = {}
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+
+    def get(self, url, stream=False, headers=None):
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def stats(self):
+        return {"connections": 1, "requests": 0}
+
+
+def test_session_reports_to_its_limiter():
+    limiter = AdaptiveLimiter(rate=1, concurrency=2)
+    session = Session(
+        transport=FakeTransport([FakeResponse(503), ConnectionError("reset")]),
+        limiter=limiter,
+    )
+    assert session.rate_limiter is limiter
+
+    assert session.get("https://archiveofourown.org/works/1").status_code == 503
+    with pytest.raises(ConnectionError):
+        session.get("https://archiveofourown.org/works/1")
+
+    metrics = session.stats()["limiter"]
+    assert metrics["requests"] == 2
+    assert metrics["errors"] == 2
+    assert metrics["rate"] == 0.5
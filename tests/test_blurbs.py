@@ -0,0 +1,154 @@
+# -*- encoding: utf-8
+"""Tests for ao3.blurbs."""
+
+import datetime
+
+import pytest
+
+bs4 = pytest.importorskip("bs4")
+
+from ao3.blurbs import iter_blurbs, parse_blurb, parse_date
+from ao3.users import parse_reading_history_page
+from ao3.utils import (
+    DATE_INTERACTED_WITH,
+    DATE_UPDATED,
+    TYPE_SERIES,
+    TYPE_WORKS,
+    get_ids_and_dates_from_page,
+)
+
+BLURB = """
+<li id="work_{id}" class="reading work blurb group" role="article">
+  <div class="header module">
+    <h4 class="heading">
+      <a href="/works/{id}">A Title</a> by
+      <a rel="author" href="/users/alice/pseuds/alice">alice</a>
+    </h4>
+    <h5 class="fandoms heading"><span class="landmark">Fandoms:</span>
+      <a class="tag" href="/tags/Star%20Wars/works">Star Wars</a></h5>
+    <ul class="required-tags">
+      <li><a><span class="rating-teen rating" title="Teen And Up Audiences">
+        <span class="text">T</span></span></a></li>
+      <li><a><span class="category-multi category" title="F/M, M/M">
+        <span class="text">M</span></span></a></li>
+      <li><a><span class="complete-no iswip" title="Work in Progress">
+        <span class="text">WIP</span></span></a></li>
+    </ul>
+    <p class="datetime">05 Mar 2020</p>
+  </div>
+  <ul class="tags commas">
+    <li class="warnings">
+      <strong><a class="tag">No Archive Warnings Apply</a></strong></li>
+    <li class="relationships"><a class="tag">Finn/Rey</a></li>
+    <li class="characters"><a class="tag">Rey</a></li>
+    <li class="characters"><a class="tag">Finn</a></li>
+    <li class="freeforms"><a class="tag">Fluff</a></li>
+  </ul>
+  <blockquote class="userstuff summary"><p class="datetime">not a date</p></blockquote>
+  <dl class="stats">
+    <dt class="language">Language:</dt><dd class="language">English</dd>
+    <dt class="words">Words:</dt><dd class="words">12,345</dd>
+    <dt class="chapters">Chapters:</dt>
+    <dd class="chapters"><a href="/works/{id}/chapters/3">3</a>/?</dd>
+    <dt class="kudos">Kudos:</dt><dd class="kudos"><a href="#">1,002</a></dd>
+    <dt class="hits">Hits:</dt><dd class="hits">20,000</dd>
+  </dl>
+  <div class="user module group">
+    <h4 class="viewed heading"><span>Last visited:</span>
+      7 Apr 2021 (Latest version.) Visited 3 times</h4>
+  </div>
+</li>
+"""
+
+SERIES_BOOKMARK = """
+<li id="bookmark_9" class="bookmark blurb group" role="article">
+  <div class="header module">
+    <h4 class="heading"><a href="/series/77">A Series</a></h4>
+    <p class="datetime">01 Feb 2019</p>
+  </div>
+  <div class="user module group"><p class="datetime">02 Feb 2019</p></div>
+</li>
+"""
+
+
+def soup(html):
+    return bs4.BeautifulSoup(html, "html.parser")
+
+
+def page(*lis):
+    return soup(f'<ol class="reading work index group">{"".join(lis)}</ol>')
+
+
+def test_parse_date():
+    assert parse_date("24 Dec 2012") == datetime.datetime(2012, 12, 24)
+    assert parse_date("24 Dec 2012") is parse_date("24 Dec 2012")
+    with pytest.raises(ValueError):
+        parse_date("24 Dez 2012")
+
+
+def test_parse_blurb():
+    blurb = parse_blurb(soup(BLURB.format(id=1)).li)
+    assert (blurb.work_id, blurb.title, blurb.authors) == ("1", "A Title", ["alice"])
+    assert blurb.fandoms == ["Star Wars"]
+    assert blurb.rating == "Teen And Up Audiences"
+    assert blurb.categories == ["F/M", "M/M"]
+    assert blurb.complete is False
+    assert blurb.characters == ["Rey", "Finn"]
+    assert (blurb.words, blurb.kudos, blurb.comments, blurb.hits) == (
+        12345,
+        1002,
+        0,
+        20000,
+    )
+    assert (blurb.chapters, blurb.posted_chapters) == ("3/?", 3)
+    assert blurb.language == "English"
+    assert blurb.updated == datetime.datetime(2020, 3, 5)
+    assert blurb.user_date == datetime.datetime(2021, 4, 7)
+    assert blurb.visits == 3
+    assert "Fluff" in blurb.tags and "Teen And Up Audiences" in blurb.tags
+
+
+def test_parse_blurb_leaves_the_tree_alone():
+    li_tag = soup(BLURB.format(id=1)).li
+    before = str(li_tag)
+    parse_blurb(li_tag)
+    assert str(li_tag) == before
+
+
+def test_reading_history_entries():
+    deleted = '<li class="deleted reading work blurb group">Deleted</li>'
+    locked = (
+        '<li id="work_3" class="reading work blurb group">'
+        '<div class="mystery header picture module">'
+        '<h4 class="heading">Mystery Work</h4></div></li>'
+    )
+    entries, skipped = parse_reading_history_page(
+        page(BLURB.format(id=1), deleted, locked, BLURB.format(id=2))
+    )
+    assert skipped == 2
+    assert [entry[0] for entry in entries] == ["1", "2"]
+    assert entries[0][1:4] == (datetime.date(2021, 4, 7), "3", "A Title")
+    assert entries[0][10:] == (
+        "12,345",
+        "3/?",
+        "0",
+        "1,002",
+        "0",
+        "20,000",
+        datetime.date(2020, 3, 5),
+    )
+
+
+def test_ids_and_dates():
+    listing = page(BLURB.format(id=1), SERIES_BOOKMARK)
+    assert list(get_ids_and_dates_from_page(listing, DATE_UPDATED)) == [
+        (TYPE_WORKS, "1", datetime.datetime(2020, 3, 5)),
+        (TYPE_SERIES, "77", datetime.datetime(2019, 2, 1)),
+    ]
+    assert [
+        d for _, _, d in get_ids_and_dates_from_page(listing, DATE_INTERACTED_WITH)
+    ] == [
+        datetime.datetime(2021, 4, 7),
+        datetime.datetime(2019, 2, 2),
+    ]
+    assert [b.series_id for b in iter_blurbs(listing)] == [None, "77"]
@@ -0,0 +1,116 @@
+# -*- encoding: utf-8
+"""Tests for ao3.clearance."""
+
+import json
+import os
+import stat
+
+import pytest
+
+from ao3.clearance import ClearanceStore, is_cloudflare_challenge
+from requests.cookies import RequestsCookieJar
+
+DOMAIN = "archiveofourown.org"
+
+
+class FakeSession(object):
+    def __init__(self, user_agent="Mozilla/5.0 (test)"):
+        self.headers = {"User-Agent": user_agent}
+        self.cookies = RequestsCookieJar()
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, headers=None, text=""):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = text
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ClearanceStore(str(tmp_path / "cache" / "clearance.json"))
+
+
+def cookies(session):
+    return {(c.name, c.value, c.domain) for c in session.cookies}
+
+
+def test_save_and_load(store):
+    session = FakeSession()
+    session.cookies.set("cf_clearance", "abc", domain=DOMAIN)
+    session.cookies.set("__cf_bm", "def", domain="." + DOMAIN)
+    session.cookies.set("_otwarchive_session", "secret", domain=DOMAIN)
+    session.cookies.set("cf_clearance", "other", domain="example.org")
+    store.save(session, DOMAIN)
+
+    with open(store.path) as infile:
+        saved = json.load(infile)
+    assert saved[DOMAIN]["user_agent"] == "Mozilla/5.0 (test)"
+    assert saved[DOMAIN]["cookies"] == {"cf_clearance": "abc", "__cf_bm": "def"}
+    assert stat.S_IMODE(os.stat(store.path).st_mode) == 0o600
+
+    # A new process gets the cookies, and the User-Agent that earned them.
+    other = FakeSession(user_agent="Something else")
+    assert ClearanceStore(store.path).load(other, DOMAIN)
+    assert other.headers["User-Agent"] == "Mozilla/5.0 (test)"
+    assert cookies(other) == {
+        ("cf_clearance", "abc", DOMAIN),
+        ("__cf_bm", "def", DOMAIN),
+    }
+    assert not ClearanceStore(store.path).load(FakeSession(), "example.org")
+
+
+def test_save_only_writes_changes(store):
+    session = FakeSession()
+    store.save(session, DOMAIN)
+    assert not os.path.exists(store.path)
+
+    session.cookies.set("cf_clearance", "abc", domain=DOMAIN)
+    store.save(session, DOMAIN)
+    os.remove(store.path)
+    store.save(session, DOMAIN)
+    assert not os.path.exists(store.path)
+
+
+def test_clear(store):
+    session = FakeSession()
+    session.cookies.set("cf_clearance", "abc", domain=DOMAIN)
+    session.cookies.set("_otwarchive_session", "secret", domain=DOMAIN)
+    store.save(session, DOMAIN)
+
+    store.clear(session, DOMAIN)
+    assert cookies(session) == {("_otwarchive_session", "secret", DOMAIN)}
+    assert not store.load(FakeSession(), DOMAIN)
+
+    # Once cleared, the same clearance is saved again if it comes back.
+    session.cookies.set("cf_clearance", "abc", domain=DOMAIN)
+    store.save(session, DOMAIN)
+    assert store.load(FakeSession(), DOMAIN)
+
+
+def test_unreadable_file_is_ignored(store):
+    os.makedirs(os.path.dirname(store.path))
+    with open(store.path, "w") as outfile:
+        outfile.write("not json")
+    assert not store.load(FakeSession(), DOMAIN)
+
+
+@pytest.mark.parametrize(
+    "response, check_body, expected",
+    [
+        (FakeResponse(403, {"cf-mitigated": "challenge"}), False, True),
+        (FakeResponse(503, {"Server": "cloudflare"}, "Just a moment..."), True, True),
+        (
+            FakeResponse(403, {"Server": "cloudflare"}, "/cdn-cgi/challenge-platform/"),
+            True,
+            True,
+        ),
+        (FakeResponse(503, {"Server": "cloudflare"}, "Just a moment..."), False, False),
+        (FakeResponse(503, {"Server": "cloudflare"}, "Retry later"), True, False),
+        (FakeResponse(503, {"Server": "nginx"}, "Just a moment..."), True, False),
+        (FakeResponse(200, {"cf-mitigated": "challenge"}), True, False),
+        (FakeResponse(404, {"Server": "cloudflare"}, "Just a moment..."), True, False),
+    ],
+)
+def test_is_cloudflare_challenge(response, check_body, expected):
+    assert is_cloudflare_challenge(response, check_body=check_body) is expected
@@ -0,0 +1,122 @@
+# -*- encoding: utf-8
+"""Tests for ao3.cli."""
+
+import csv
+import io
+import json
+
+import pytest
+
+from ao3 import cli
+from ao3.works import WorkNotFound
+
+
+class FakeWork(object):
+    def __init__(self, id):
+        self.id = id
+
+    def json(self):
+        if self.id == "404":
+            raise WorkNotFound(f"Unable to find a work with id {self.id}")
+        return json.dumps(
+            {"id": self.id, "title": f"Work {self.id}", "stats": {"kudos": 1}}
+        )
+
+
+class FakeSeries(object):
+    def work_ids(self, max_count=0, oldest_date=None):
+        print("Loading page: \t 1 of list.")
+        return ["1", "2", "3"][: max_count or None]
+
+
+class FakeAO3(object):
+    instances = []
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.user = None
+        self.session = None
+        self.fetched = []
+        FakeAO3.instances.append(self)
+
+    def work(self, id):
+        self.fetched.append(id)
+        return FakeWork(id)
+
+    def series(self, id):
+        return FakeSeries()
+
+
+@pytest.fixture
+def run(monkeypatch, capsys):
+    monkeypatch.setattr(cli, "AO3", FakeAO3)
+    FakeAO3.instances = []
+
+    def run(*argv):
+        status = cli.main(["--workers", "2"] + list(argv))
+        out, err = capsys.readouterr()
+        return status, out, err
+
+    return run
+
+
+def test_works_are_written_as_ndjson_in_order(run):
+    status, out, err = run("works", "5", "3", "4")
+    assert status == 0
+    rows = [json.loads(line) for line in out.splitlines()]
+    assert [row["id"] for row in rows] == ["5", "3", "4"]
+    assert "Wrote 3 rows" in err
+
+
+def test_library_output_goes_to_stderr(run):
+    status, out, err = run("series", "1234", "--ids-only")
+    assert [json.loads(line) for line in out.splitlines()] == [
+        {"id": "1"},
+        {"id": "2"},
+        {"id": "3"},
+    ]
+    assert "Loading page" in err
+
+
+def test_failed_works_are_reported_and_not_marked_done(run, tmp_path):
+    resume = tmp_path / "done.txt"
+    status, out, err = run("--resume", str(resume), "works", "1", "404", "2")
+    assert status == 1
+    assert len(out.splitlines()) == 2
+    assert "Skipping work:404" in err
+    assert resume.read_text().split() == ["work:1", "work:2"]
+
+
+def test_resume_skips_what_was_exported(run, tmp_path):
+    resume = tmp_path / "done.txt"
+    output = tmp_path / "works.ndjson"
+    run("--resume", str(resume), "-o", str(output), "--max-count", "2", "series", "1")
+    status, out, err = run("--resume", str(resume), "-o", str(output), "series", "1")
+
+    assert FakeAO3.instances[-1].fetched == ["3"]
+    rows = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [row["id"] for row in rows] == ["1", "2", "3"]
+    assert "Skipped 2 rows" in err
+
+
+def test_csv_flattens_rows():
+    outfile = io.StringIO()
+    writer = cli.CsvWriter(outfile)
+    writer.write({"id": "1", "fandoms": ["A, B", "C"], "stats": {"kudos": 3}})
+    writer.write({"id": "2", "fandoms": [], "stats": {"kudos": 4}})
+
+    rows = list(csv.DictReader(io.StringIO(outfile.getvalue())))
+    assert rows[0] == {"id": "1", "fandoms": '["A, B", "C"]', "stats.kudos": "3"}
+    assert rows[1]["stats.kudos"] == "4"
+
+
+def test_csv_header_is_not_repeated_when_resuming(run, tmp_path):
+    resume = tmp_path / "done.txt"
+    output = tmp_path / "works.csv"
+    args = ["--format", "csv", "--resume", str(resume), "-o", str(output)]
+    run(*args, "works", "1")
+    run(*args, "works", "1", "2")
+
+    lines = output.read_text().splitlines()
+    assert lines[0].startswith("id,")
+    assert len(lines) == 3
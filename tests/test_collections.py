@@ -0,0 +1,82 @@
+# -*- encoding: utf-8
+"""Tests for ao3.collections."""
+
+import datetime
+
+import pytest
+
+pytest.importorskip("bs4")
+
+from ao3.collections import Collection, CollectionWork
+
+LAST_PAGE = '<ol class="pagination"><li class="next"><span class="disabled">Next</span></li></ol>'
+
+
+def works_page(works):
+    lis = "".join(
+        f'<li id="work_{work_id}" class="work blurb group"><div class="header module">'
+        f'<h4 class="heading"><a href="/collections/c/works/{work_id}">T</a></h4>'
+        f'<p class="datetime">{day:02d} Jan 2020</p></div></li>'
+        for work_id, day in works
+    )
+    return f'<ol class="work index group">{lis}</ol>{LAST_PAGE}'
+
+
+def collections_page(ids):
+    lis = "".join(
+        f'<li class="collection picture blurb group"><div class="header module">'
+        f'<h4 class="heading"><a href="/collections/{sub_id}">{sub_id}</a></h4></div></li>'
+        for sub_id in ids
+    )
+    return f'<ul class="collection picture index group">{lis}</ul>{LAST_PAGE}'
+
+
+@pytest.fixture
+def exchange(fake_session):
+    return fake_session(
+        {
+            r"/collections/ex/collections": collections_page(["ex_a", "ex_b"]),
+            r"/collections/ex/works": works_page([(1, 5), (2, 4), (3, 3)]),
+            r"/collections/ex_a/collections": collections_page([]),
+            r"/collections/ex_a/works": works_page([(1, 5), (4, 2)]),
+            r"/collections/ex_b/collections": collections_page(["ex_a"]),
+            r"/collections/ex_b/works": works_page([(2, 4), (5, 1)]),
+        }
+    )
+
+
+def test_subcollections(exchange):
+    subs = Collection("ex", exchange, "https://example.org").subcollections()
+    assert [sub.id for sub in subs] == ["ex_a", "ex_b"]
+
+
+def test_crawl_covers_the_tree_once(exchange):
+    results = list(Collection("ex", exchange, "https://example.org").crawl(workers=3))
+
+    assert sorted(r.work_id for r in results) == ["1", "2", "3", "4", "5"]
+    assert CollectionWork("ex_a", "4", datetime.datetime(2020, 1, 2)) in results
+    # ex_a is a subcollection of both ex and ex_b, but is only fetched once.
+    assert len([u for u in exchange.urls if "/ex_a/works" in u]) == 1
+
+
+def test_crawl_limits(exchange):
+    crawl = Collection("ex", exchange, "https://example.org").crawl(
+        max_depth=0, oldest_date=datetime.datetime(2020, 1, 4)
+    )
+    assert [r.work_id for r in crawl] == ["1", "2"]
+    assert not any("/ex_a/" in u for u in exchange.urls)
+
+
+def test_stopping_early_doesnt_hang(exchange):
+    crawl = Collection("ex", exchange, "https://example.org").crawl(buffer_size=1)
+    next(crawl)
+    crawl.close()
+
+
+def test_crawl_skips_works_already_seen(exchange):
+    from ao3.seen import SeenSet
+
+    seen = SeenSet(["1", "5"])
+    crawl = Collection("ex", exchange, "https://example.org").crawl(seen=seen)
+    assert sorted(r.work_id for r in crawl) == ["2", "3", "4"]
+    assert list(seen) == [1, 2, 3, 4, 5]
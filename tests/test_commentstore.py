@@ -0,0 +1,171 @@
+# -*- encoding: utf-8
+"""Tests for ao3.commentstore."""
+
+import pytest
+
+from ao3.commentstore import CommentStore, comment_text, parse_comment_date
+
+
+def comment(comment_id, user, content, parent_id=None, work_id="1", chapter=1):
+    row = (
+        work_id,
+        user,
+        False,
+        parent_id is None,
+        "12 Jan 2020 10:15PM",
+        "UTC",
+        f"on Chapter {chapter}",
+        content,
+    )
+    try:
+        from ao3.comments import Comment
+    except ImportError:
+        return row
+    result = Comment(*row)
+    result.comment_id = comment_id
+    result.parent_id = parent_id
+    return result
+
+
+@pytest.fixture
+def store():
+    store = CommentStore()
+    store.put_many(
+        [
+            comment("10", "alice", "<p>I love the found family here!</p>"),
+            comment("11", "bob", "<p>Me too &amp; the pacing</p>", parent_id="10"),
+            comment("12", "alice", "<p>Thanks, bob</p>", parent_id="11"),
+            comment("20", "carol", "<p>Too much angst</p>", chapter=2),
+            comment("30", "bob", "<p>Found family, again</p>", work_id="2"),
+        ],
+        batch_size=2,
+    )
+    return store
+
+
+def test_comment_text_and_dates():
+    assert comment_text("<p>Me too &amp;<br/>more</p>") == "Me too & more"
+    assert parse_comment_date("12 Jan 2020 10:15PM") == "2020-01-12 22:15"
+    assert parse_comment_date("sometime") == "sometime"
+
+
+def test_search(store):
+    results = store.search('"found family"')
+    assert sorted(r["comment_id"] for r in results) == [10, 30]
+    assert [r["comment_id"] for r in store.search("family", work_id="2")] == [30]
+    assert [r["comment_id"] for r in store.search("pac*")] == [11]
+    assert store.search("family NOT again")[0]["user"] == "alice"
+    assert store.search("angst", user="alice") == []
+
+
+def test_filters(store):
+    assert len(store) == 5
+    assert "12" in store
+    assert [r["comment_id"] for r in store.comments(user="bob")] == [11, 30]
+    assert [r["comment_id"] for r in store.comments(work_id=1, chapter=2)] == [20]
+    assert (
+        store.comments(since="2020-01-12", until="2020-01-13", limit=1)[0]["date"]
+        == "2020-01-12 22:15"
+    )
+    assert store.comments(since="2021-01-01") == []
+    assert len(store.comments(until="2020-01-12")) == 5
+    assert store.comments(until="2020-01-12 22:00") == []
+
+
+def test_threads(store):
+    thread = store.thread("12")
+    assert [(r["comment_id"], r["depth"]) for r in thread] == [
+        (10, 0),
+        (11, 1),
+        (12, 2),
+    ]
+    assert {r["thread_id"] for r in thread} == {10}
+    assert store.thread("99") == []
+
+
+def test_replies_stored_before_their_parents():
+    store = CommentStore()
+    store.put(comment("5", "alice", "<p>Reply to 4</p>", parent_id="4"))
+    store.put_many(
+        [
+            comment("3", "bob", "<p>Top</p>"),
+            comment("4", "carol", "<p>Reply to 3</p>", parent_id="3"),
+        ]
+    )
+    assert [(r["comment_id"], r["depth"]) for r in store.thread("3")] == [
+        (5, 2),
+        (3, 0),
+        (4, 1),
+    ]
+    store.put(comment("5", "alice", "<p>Reply to 4, edited</p>", parent_id="4"))
+    assert [r["comment_id"] for r in store.thread("5")] == [5, 3, 4]
+    assert {r["thread_id"] for r in store.thread("3")} == {3}
+
+
+def test_storing_again_updates_in_place(store):
+    store.put(comment("11", "bob", "<p>Edited: loved the pacing</p>", parent_id="10"))
+    assert len(store) == 5
+    assert store.search("edited")[0]["comment_id"] == 11
+    assert [r["comment_id"] for r in store.search("too")] == [20]
+    assert [r["comment_id"] for r in store.comments(work_id=1)] == [10, 11, 12, 20]
+
+
+def test_persists(tmp_path):
+    path = str(tmp_path / "comments.sqlite")
+    store = CommentStore(path)
+    store.put(comment("10", "alice", "<p>Hello</p>"))
+    store.close()
+    assert CommentStore(path).search("hello")[0]["user"] == "alice"
+
+
+def test_parsed_comments_know_their_thread():
+    bs4 = pytest.importorskip("bs4")
+    from ao3.comments import parse_comments_page
+
+    def li(comment_id, user, text, parent=None):
+        parent_link = (
+            f'<li><a href="/comments/{parent}">Parent Thread</a></li>' if parent else ""
+        )
+        return (
+            f'<li class="comment group" id="comment_{comment_id}">'
+            f'<h4 class="heading byline"><a href="/users/{user}">{user}</a>'
+            '<span class="parent">on Chapter 2</span></h4>'
+            '<span class="date">12</span><abbr class="month">Jan</abbr>'
+            '<span class="year">2020</span><span class="time">10:15PM</span>'
+            '<abbr class="timezone">UTC</abbr>'
+            f'<blockquote class="userstuff"><p>{text}</p></blockquote>'
+            f'<ul class="actions"><li><a href="/comments/{comment_id}">Thread</a></li>'
+            f"{parent_link}</ul></li>"
+        )
+
+    page = (
+        '<ol class="thread">'
+        + li("10", "alice", "Top")
+        + '<li><ol class="thread">'
+        + li("11", "bob", "Reply", parent="10")
+        + "</ol></li></ol>"
+    )
+    soup = bs4.BeautifulSoup(page, features="html.parser")
+    top, reply = parse_comments_page(soup, "1")
+
+    assert top == (
+        "1",
+        "alice",
+        False,
+        True,
+        "12 Jan 2020 10:15PM",
+        "UTC",
+        "on Chapter 2",
+        "<p>Top</p>",
+    )
+    assert (top.comment_id, top.parent_id) == ("10", None)
+    assert (reply.comment_id, reply.parent_id, reply.top_level) == ("11", "10", False)
+
+    store = CommentStore()
+    store.put_many([top, reply])
+    assert [
+        (r["comment_id"], r["depth"], r["chapter"]) for r in store.thread("11")
+    ] == [
+        (10, 0, 2),
+        (11, 1, 2),
+    ]
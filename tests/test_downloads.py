@@ -0,0 +1,152 @@
+# -*- encoding: utf-8
+"""Tests for ao3.downloads."""
+
+import hashlib
+import json
+
+import pytest
+
+pytest.importorskip("bs4")
+
+from ao3.downloads import download, download_many
+from ao3.works import Work
+
+URL = "https://archiveofourown.org/downloads/1/Title.epub?updated_at=1"
+BODY = bytes(range(256)) * 1000
+
+
+class FakeStreamedResponse(object):
+    reason = "OK"
+    _content_consumed = False
+
+    def __init__(self, body, status_code=200, cut_at=None):
+        self.body = body
+        self.status_code = status_code
+        self.headers = {"Content-Length": str(len(body))}
+        self.cut_at = cut_at
+        self.closed = False
+
+    @property
+    def text(self):
+        raise AssertionError("A streamed download was read into memory")
+
+    def iter_content(self, chunk_size):
+        end = len(self.body) if self.cut_at is None else self.cut_at
+        for i in range(0, end, chunk_size):
+            yield self.body[i : min(i + chunk_size, end)]
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def download_session(fake_session):
+    """Returns a function that makes a session serving ``body`` from download
+    URLs, from where a Range header asks, cutting the first response short at
+    ``cut_at``.  Anything else gets ``work_page``, with the work ID filled in.
+    The headers of each download request are recorded in ``requests``.
+    """
+
+    def make(body=BODY, cut_at=None, work_page=None):
+        cuts = [cut_at]
+
+        def serve_download(url, stream=False, headers=None):
+            session.requests.append(dict(headers or {}))
+            assert stream
+            start = 0
+            if headers and "Range" in headers:
+                start = int(headers["Range"].split("=")[1].rstrip("-"))
+            response = FakeStreamedResponse(
+                body[start:], status_code=206 if start else 200, cut_at=cuts[0]
+            )
+            cuts[0] = None
+            return response
+
+        def serve_work_page(url, **kwargs):
+            return work_page % url.rsplit("/", 1)[-1]
+
+        session = fake_session(
+            {r"/downloads/": serve_download, r"/works/": serve_work_page}
+        )
+        session.requests = []
+        return session
+
+    return make
+
+
+def test_download_streams_to_disk(tmp_path, download_session):
+    path = str(tmp_path / "1.epub")
+    result = download(download_session(), URL, path, chunk_size=1000)
+
+    assert not result.skipped
+    assert result.size == len(BODY)
+    assert result.sha256 == hashlib.sha256(BODY).hexdigest()
+    assert open(path, "rb").read() == BODY
+    sidecar = json.load(open(path + ".ao3.json"))
+    assert sidecar["url"] == URL and sidecar["complete"]
+
+
+def test_up_to_date_files_are_skipped(tmp_path, download_session):
+    path = str(tmp_path / "1.epub")
+    session = download_session()
+    download(session, URL, path)
+    assert download(session, URL, path, verify=True).skipped
+    assert len(session.requests) == 1
+
+    # A new version of the work has a new updated_at.
+    assert not download(session, URL.replace("=1", "=2"), path).skipped
+    assert len(session.requests) == 2
+
+
+def test_interrupted_download_is_resumed(tmp_path, download_session):
+    path = str(tmp_path / "1.epub")
+    session = download_session(cut_at=100000)
+    with pytest.raises(RuntimeError, match="cut short"):
+        download(session, URL, path, chunk_size=4096)
+
+    result = download(session, URL, path, chunk_size=4096)
+    assert session.requests[-1] == {"Range": "bytes=100000-"}
+    assert open(path, "rb").read() == BODY
+    assert result.sha256 == hashlib.sha256(BODY).hexdigest()
+
+
+WORK_PAGE = """
+<ul class="work navigation actions">
+  <li class="download" aria-haspopup="true">
+    <a href="#">Download</a>
+    <ul class="expandable secondary">
+      <li><a href="/downloads/%s/Title.epub?updated_at=1">EPUB</a></li>
+      <li><a href="/downloads/1/Title.pdf?updated_at=1">PDF</a></li>
+    </ul>
+  </li>
+</ul>
+"""
+
+
+def test_work_download_finds_the_link(tmp_path, download_session):
+    work = Work.from_html("1", WORK_PAGE % "1", sess=download_session())
+    assert sorted(work.download_urls) == ["epub", "pdf"]
+    result = work.download("EPUB", str(tmp_path))
+    assert result.path == str(tmp_path / "1.epub")
+
+    with pytest.raises(ValueError):
+        work.download("mobi", str(tmp_path))
+
+
+def test_download_many(tmp_path, download_session):
+    session = download_session(work_page=WORK_PAGE)
+    results = list(
+        download_many(
+            session,
+            ["1", "2", "3"],
+            "epub",
+            str(tmp_path),
+            "https://archiveofourown.org",
+        )
+    )
+    assert [work_id for work_id, _ in results] == ["1", "2", "3"]
+    assert sorted(p.name for p in tmp_path.glob("*.epub")) == [
+        "1.epub",
+        "2.epub",
+        "3.epub",
+    ]
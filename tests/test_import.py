@@ -0,0 +1,57 @@
+# -*- encoding: utf-8
+"""Tests that importing ao3 stays cheap."""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = ["bs4", "cloudscraper", "requests"]
+
+# Generous, so the test isn't flaky on a slow machine; eagerly importing
+# cloudscraper and BeautifulSoup alone takes several times this.
+IMPORT_BUDGET_US = 100000
+
+
+def import_times(statement):
+    """Run ``statement`` under ``python -X importtime`` in a fresh interpreter,
+    and return a dict of module name -> cumulative import time in microseconds.
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in sys.path if p)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        env=env,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+
+    times = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize("statement", ["import ao3", "from ao3 import utils"])
+def test_import_does_not_load_heavy_dependencies(statement):
+    times = import_times(statement)
+    for module in HEAVY_MODULES:
+        assert module not in times
+
+
+def test_import_is_within_budget():
+    times = import_times("import ao3")
+    assert times["ao3"] < IMPORT_BUDGET_US
+
+
+def test_classes_are_still_importable_from_the_package():
+    import ao3
+    from ao3.works import Work
+
+    assert ao3.Work is Work
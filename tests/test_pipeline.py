@@ -0,0 +1,96 @@
+# -*- encoding: utf-8
+"""Tests for ao3.pipeline."""
+
+import threading
+
+import pytest
+
+pytest.importorskip("bs4")
+
+from ao3.pipeline import ParsePipeline
+from ao3.utils import TYPE_WORKS
+from ao3.works import RestrictedWork
+
+
+def listing_page(work_ids, last_page):
+    lis = "".join(
+        f'<li id="work_{work_id}" class="work blurb group">'
+        f'<div class="header module"><h4 class="heading"><a href="/works/{work_id}">T</a>'
+        f'</h4><p class="datetime">01 Jan 2020</p></div></li>'
+        for work_id in work_ids
+    )
+    pages = "".join(f"<li><a>{n}</a></li>" for n in range(1, last_page + 1))
+    return f'<ol class="work index group">{lis}</ol><ol class="pagination">{pages}</ol>'
+
+
+@pytest.fixture
+def pipeline(fake_session):
+    pipelines = []
+
+    def make(pages, **kwargs):
+        pipeline = ParsePipeline(fake_session(pages), processes=2, **kwargs)
+        pipelines.append(pipeline)
+        return pipeline
+
+    yield make
+    for pipeline in pipelines:
+        pipeline.close()
+
+
+def test_works_are_parsed_in_order(pipeline):
+    pages = {
+        rf"/works/{n}$": f'<h2 class="title heading">Work {n}</h2>' for n in range(1, 6)
+    }
+    pages[r"/works/6$"] = "This work could have adult content. Proceed?"
+    pages[r"/works/6\?view_adult=true"] = '<h2 class="title heading">Work 6</h2>'
+
+    works = list(pipeline(pages, max_in_flight=3).works(range(1, 7)))
+    assert [work.title for work in works] == [f"Work {n}" for n in range(1, 7)]
+    assert works[0]._soup is None
+
+
+def test_errors_come_back_from_the_workers(pipeline):
+    pages = {r"/works/1": "This work is only available to registered users"}
+    with pytest.raises(RestrictedWork):
+        list(pipeline(pages).works([1]))
+
+
+def test_work_ids_fetch_every_page(pipeline):
+    pages = {
+        r"page=1": listing_page([1, 2], 3),
+        r"page=2": listing_page([3, 4], 3),
+        r"page=3": listing_page([5], 3),
+    }
+    p = pipeline(pages)
+    entries = list(p.work_ids("https://example.org/works"))
+    assert [work_id for _, work_id, _ in entries] == ["1", "2", "3", "4", "5"]
+    assert {id_type for id_type, _, _ in entries} == {TYPE_WORKS}
+    assert len(p.session.urls) == 3
+
+
+def test_work_ids_of_a_percent_encoded_url(pipeline):
+    pages = {
+        r"/tags/Star%20Wars/works\?page=1$": listing_page([1, 2], 2),
+        r"/tags/Star%20Wars/works\?page=2$": listing_page([3], 2),
+    }
+    entries = pipeline(pages).work_ids("https://example.org/tags/Star%20Wars/works")
+    assert [work_id for _, work_id, _ in entries] == ["1", "2", "3"]
+
+
+def test_close_cancels_jobs_not_yet_started(fake_session):
+    p = ParsePipeline(fake_session({}), processes=1, max_in_flight=1)
+    started = threading.Event()
+    release = threading.Event()
+
+    def block():
+        started.set()
+        return release.wait()
+
+    running = p._submit(p._fetchers, block)
+    waiting = p._submit(p._fetchers, lambda: None)
+    started.wait()
+    threading.Timer(0.1, release.set).start()
+    p.close()
+
+    assert running.result() is True
+    assert waiting.cancelled()
@@ -0,0 +1,95 @@
+# -*- encoding: utf-8
+"""Tests for ao3.retry."""
+
+import pytest
+
+from ao3 import retry
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, text="", headers=None):
+        self.status_code = status_code
+        self.reason = "Reason"
+        self.text = text
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession(object):
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = 0
+
+    def get(self, url, **kwargs):
+        self.requests += 1
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(retry.time, "sleep", slept.append)
+    return slept
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [(None, None), ("", None), ("120", 120), ("-5", 0), ("not a date", None)],
+)
+def test_parse_retry_after(value, expected):
+    assert retry.parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_http_date():
+    assert retry.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+
+
+def test_backoff_is_jittered_below_an_exponential_cap():
+    policy = retry.RetryPolicy(base_delay=2, max_delay=10)
+    for attempt, ceiling in [(1, 2), (2, 4), (3, 8), (4, 10), (10, 10)]:
+        for _ in range(50):
+            assert 0 <= policy.backoff(attempt) <= ceiling
+
+
+def test_retries_until_success(sleeps):
+    session = FakeSession(
+        [FakeResponse(503), FakeResponse(200, "Retry later"), FakeResponse(200, "ok")]
+    )
+    response = retry.RetryPolicy().send(session, "https://example.org")
+    assert response.text == "ok"
+    assert len(sleeps) == 2
+
+
+def test_retry_after_header_is_respected(sleeps):
+    session = FakeSession(
+        [FakeResponse(429, headers={"Retry-After": "42"}), FakeResponse(200, "ok")]
+    )
+    retry.RetryPolicy().send(session, "https://example.org")
+    assert sleeps == [42]
+
+
+def test_other_errors_are_not_retried(sleeps):
+    session = FakeSession([FakeResponse(404, "Not found")])
+    response = retry.RetryPolicy().send(session, "https://example.org")
+    assert response.status_code == 404
+    assert sleeps == []
+
+
+def test_gives_up_after_max_attempts(sleeps):
+    session = FakeSession([FakeResponse(503)] * 3)
+    with pytest.raises(retry.RetriesExhausted) as exc:
+        retry.RetryPolicy(max_attempts=3).send(session, "https://example.org")
+    assert exc.value.attempts == 3
+    assert session.requests == 3
+    # Every response we gave up on was closed.
+    assert exc.value.response.closed
+
+
+def test_gives_up_rather_than_wait_past_the_deadline(sleeps):
+    session = FakeSession([FakeResponse(429, headers={"Retry-After": "600"})])
+    with pytest.raises(retry.RetryDeadlineExceeded):
+        retry.RetryPolicy(deadline=60).send(session, "https://example.org")
+    assert sleeps == []
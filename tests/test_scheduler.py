@@ -0,0 +1,112 @@
+# -*- encoding: utf-8
+"""Tests for ao3.scheduler."""
+
+import threading
+
+import pytest
+
+from ao3.scheduler import Scheduler
+from ao3.utils import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+
+
+@pytest.fixture
+def blocking_session(fake_session):
+    """Returns a function that makes a session whose first request waits
+    until we say so, so that we can queue up jobs while the scheduler is busy.
+    """
+
+    def make():
+        def page(url, **kwargs):
+            if not session.started.is_set():
+                session.started.set()
+                session.release.wait()
+            return "<html></html>"
+
+        session = fake_session({"": page})
+        session.started = threading.Event()
+        session.release = threading.Event()
+        return session
+
+    return make
+
+
+def run_jobs(session, jobs, **kwargs):
+    scheduler = Scheduler(workers=1, request_interval=0, **kwargs)
+    futures = [scheduler.submit(session, "https://example.org/first")]
+    session.started.wait()
+    futures += [
+        scheduler.submit(session, url, priority=priority, owner=owner)
+        for url, priority, owner in jobs
+    ]
+    session.release.set()
+    for future in futures:
+        future.result()
+    scheduler.close()
+    return session.urls[1:]
+
+
+def test_interactive_jobs_go_first(blocking_session):
+    urls = run_jobs(
+        blocking_session(),
+        [
+            ("https://example.org/crawl/1", PRIORITY_BACKGROUND, "crawl"),
+            ("https://example.org/crawl/2", PRIORITY_BACKGROUND, "crawl"),
+            ("https://example.org/work", PRIORITY_INTERACTIVE, None),
+        ],
+    )
+    assert urls[0] == "https://example.org/work"
+
+
+def test_owners_take_turns(blocking_session):
+    urls = run_jobs(
+        blocking_session(),
+        [
+            (f"https://example.org/alice/{i}", PRIORITY_BACKGROUND, "alice")
+            for i in range(3)
+        ]
+        + [
+            (f"https://example.org/bob/{i}", PRIORITY_BACKGROUND, "bob")
+            for i in range(3)
+        ],
+    )
+    assert [url.split("/")[3] for url in urls] == ["alice", "bob"] * 3
+
+
+def test_duplicate_urls_are_queued_once(blocking_session):
+    urls = run_jobs(
+        blocking_session(),
+        [
+            ("https://example.org/page?page=1", PRIORITY_BACKGROUND, "alice"),
+            ("https://example.org/page", PRIORITY_BACKGROUND, "bob"),
+        ],
+    )
+    assert len(urls) == 1
+
+
+def test_queued_jobs_are_persisted(tmpdir, blocking_session):
+    path = str(tmpdir.join("jobs.sqlite"))
+    scheduler = Scheduler(workers=0, queue_path=path)
+    scheduler.submit(blocking_session(), "https://example.org/1", owner="alice")
+    scheduler.close()
+
+    assert Scheduler(queue_path=path).pending() == [
+        ("https://example.org/1", PRIORITY_BACKGROUND, "alice")
+    ]
+
+
+def test_resumed_jobs_leave_the_queue(tmpdir, blocking_session):
+    path = str(tmpdir.join("jobs.sqlite"))
+    scheduler = Scheduler(workers=0, queue_path=path)
+    future = scheduler.submit(blocking_session(), "https://example.org/1")
+    scheduler.close()
+    assert future.cancelled()
+
+    for _ in range(2):
+        session = blocking_session()
+        session.started.set()
+        scheduler = Scheduler(workers=1, request_interval=0, queue_path=path)
+        for future in scheduler.resume(session).values():
+            future.result()
+        scheduler.close()
+
+    assert Scheduler(queue_path=path).pending() == []
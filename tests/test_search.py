@@ -0,0 +1,90 @@
+# -*- encoding: utf-8
+"""Tests for ao3.search."""
+
+import datetime
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from ao3.search import SearchResult, search, search_url
+
+
+def search_params(**filters):
+    url = search_url(**filters)
+    assert url.startswith("https://archiveofourown.org/works/search?")
+    return {key: values[0] for key, values in parse_qs(urlparse(url).query).items()}
+
+
+def test_search_url_defaults_to_best_match():
+    assert search_params() == {
+        "work_search[sort_column]": "_score",
+        "work_search[sort_direction]": "desc",
+    }
+
+
+def test_search_url_includes_filters():
+    params = search_params(
+        fandoms=["Star Wars", "Star Trek"],
+        rating="Teen And Up Audiences",
+        complete=True,
+        language="en",
+        sort="kudos",
+    )
+    assert params["work_search[fandom_names]"] == "Star Wars,Star Trek"
+    assert params["work_search[rating_ids]"] == "11"
+    assert params["work_search[complete]"] == "T"
+    assert params["work_search[language_id]"] == "en"
+    assert params["work_search[sort_column]"] == "kudos_count"
+
+
+@pytest.mark.parametrize(
+    "words, expected",
+    [((1000, 5000), "1000-5000"), ((1000, None), ">999"), ((None, 5000), "<5001"), ("<10", "<10")],
+)
+def test_word_ranges(words, expected):
+    assert search_params(words=words)["work_search[word_count]"] == expected
+
+
+def test_date_ranges():
+    updated = (datetime.date(2020, 1, 1), datetime.date(2020, 12, 31))
+    params = search_params(updated=updated)
+    assert params["work_search[revised_at]"] == "2020-01-01 - 2020-12-31"
+
+
+def results_page(work_ids, last):
+    lis = "".join(
+        f'<li id="work_{work_id}" class="work blurb group">'
+        '<div class="header module">'
+        f'<h4 class="heading"><a href="/works/{work_id}">T</a></h4>'
+        '<p class="datetime">01 Jan 2020</p></div></li>'
+        for work_id in work_ids
+    )
+    next_button = (
+        '<span class="disabled">Next</span>' if last else '<a href="#">Next</a>'
+    )
+    return (
+        f'<ol class="work index group">{lis}</ol>'
+        f'<ol class="pagination"><li class="next">{next_button}</li></ol>'
+    )
+
+
+def test_search_reads_every_page(fake_session):
+    pytest.importorskip("bs4")
+    session = fake_session(
+        {
+            r"&page=1$": results_page(["1", "2"], last=False),
+            r"&page=2$": results_page(["3"], last=True),
+        }
+    )
+    results = list(search(session, fandoms=["Star Wars"]))
+    assert results == [
+        SearchResult(work_id, datetime.datetime(2020, 1, 1)) for work_id in "123"
+    ]
+    assert session.urls[1] == search_url(fandoms=["Star Wars"]) + "&page=2"
+
+
+def test_search_stops_at_max_count(fake_session):
+    pytest.importorskip("bs4")
+    session = fake_session({r"&page=1$": results_page(["1", "2"], last=False)})
+    assert [r.work_id for r in search(session, max_count=2, query="a b")] == ["1", "2"]
+    assert len(session.urls) == 1
@@ -0,0 +1,131 @@
+# -*- encoding: utf-8
+"""Tests for ao3.seen."""
+
+import pytest
+
+from ao3.seen import GROWTH, MAGIC, SeenSet
+
+
+def test_add_and_contains():
+    seen = SeenSet()
+    assert seen.add("258626") is True
+    assert seen.add(258626) is False
+    assert "258626" in seen
+    assert 258626 in seen
+    assert "1" not in seen
+    assert "not an id" not in seen
+    assert 10**12 not in seen
+    assert len(seen) == 1
+
+
+def test_discard():
+    seen = SeenSet(["1", "2", "3"])
+    seen.discard("2")
+    seen.discard("2")
+    seen.discard(10**9)
+    assert list(seen) == [1, 3]
+    assert len(seen) == 2
+
+
+def test_negative_ids_are_rejected():
+    with pytest.raises(ValueError):
+        SeenSet().add(-1)
+
+
+def test_iterates_in_order():
+    ids = [70000, 5, 0, 12345, 8]
+    assert list(SeenSet(ids)) == sorted(ids)
+
+
+def test_bitmap_is_compact():
+    seen = SeenSet(range(0, 1000000, 3))
+    assert len(seen) == 333334
+    # One bit per ID up to the largest, in steps of GROWTH bytes.
+    assert seen.nbytes == 2 * GROWTH
+
+
+def test_set_operations():
+    a = SeenSet([1, 2, 3, 100000])
+    b = SeenSet([2, 3, 4])
+
+    assert list(a | b) == [1, 2, 3, 4, 100000]
+    assert list(a & b) == [2, 3]
+    assert list(a - b) == [1, 100000]
+    assert list(b - a) == [4]
+    assert len(a & b) == 2
+
+    a &= b
+    assert list(a) == [2, 3]
+    a |= SeenSet([9])
+    assert list(a) == [2, 3, 9]
+    a -= b
+    assert list(a) == [9]
+    assert len(a) == 1
+
+
+def test_update_with_another_set():
+    a = SeenSet([1])
+    a.update(SeenSet([5, 1000000]))
+    assert list(a) == [1, 5, 1000000]
+    assert len(a) == 3
+
+
+def test_file_backed_set_persists(tmp_path):
+    path = str(tmp_path / "seen.bits")
+    seen = SeenSet(["42", "7"], path=path)
+    seen.close()
+
+    with open(path, "rb") as infile:
+        assert infile.read(len(MAGIC)) == MAGIC
+
+    seen = SeenSet(path=path)
+    assert list(seen) == [7, 42]
+    assert len(seen) == 2
+    assert seen.add("42") is False
+
+    # Growing the file keeps what was already in it.
+    seen.add(10 * GROWTH * 8)
+    seen.close()
+    seen = SeenSet(path=path)
+    assert list(seen) == [7, 42, 10 * GROWTH * 8]
+    seen.close()
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "other.bits"
+    path.write_bytes(b"not a bitmap")
+    with pytest.raises(ValueError):
+        SeenSet(path=str(path))
+
+
+def test_save_to_a_file(tmp_path):
+    path = str(tmp_path / "copy.bits")
+    SeenSet([3, 99]).save(path)
+    seen = SeenSet(path=path)
+    assert list(seen) == [3, 99]
+    seen.close()
+
+
+def test_list_skips_seen_works(fake_session):
+    pytest.importorskip("bs4")
+    from ao3.series import Series
+
+    lis = "".join(
+        f'<li id="work_{work_id}" class="work blurb group"><div class="header module">'
+        f'<h4 class="heading"><a href="/works/{work_id}">T</a></h4>'
+        f'<p class="datetime">01 Jan 2020</p></div></li>'
+        for work_id in ("1", "2", "3")
+    )
+    page = (
+        f'<ul class="series work index group">{lis}</ul>'
+        '<ol class="pagination"><li class="next">'
+        '<span class="disabled">Next</span></li></ol>'
+    )
+
+    seen = SeenSet(["2"])
+    series = Series(
+        "5", fake_session({r"/series/5": page}), "https://archiveofourown.org"
+    )
+    assert series.work_ids(seen=seen) == ["1", "3"]
+    assert list(seen) == [1, 2, 3]
+    assert series.work_ids(seen=seen) == []
@@ -0,0 +1,80 @@
+# -*- encoding: utf-8
+"""Tests for ao3.series."""
+
+import pytest
+
+from ao3 import series
+from ao3.series import SeriesMemo
+
+
+def test_memo_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(series.time, "time", lambda: now[0])
+
+    memo = SeriesMemo(ttl=60)
+    assert memo.get("77") is None
+    memo.put("77", ["1", "2"])
+    now[0] += 60
+    assert memo.get("77") == ["1", "2"]
+    now[0] += 1
+    assert memo.get("77") is None
+
+
+def test_memo_persists(tmp_path):
+    path = str(tmp_path / "series.json")
+    memo = SeriesMemo(path)
+    memo.put("77", ["1", "2"])
+    memo.save()
+
+    assert SeriesMemo(path).get("77") == ["1", "2"]
+    assert SeriesMemo(path, ttl=-1).get("77") is None
+    # Without a path, there's nothing to save to.
+    SeriesMemo().save()
+
+
+NO_NEXT_PAGE = (
+    '<ol class="pagination"><li class="next">'
+    '<span class="disabled">Next</span></li></ol>'
+)
+
+
+def work_blurb(work_id):
+    return (
+        f'<li id="work_{work_id}" class="work blurb group"><div class="header module">'
+        f'<h4 class="heading"><a href="/works/{work_id}">T</a></h4>'
+        f'<p class="datetime">01 Jan 2020</p></div></li>'
+    )
+
+
+def bookmarks_page(*work_ids):
+    lis = "".join(work_blurb(work_id) for work_id in work_ids)
+    series_li = (
+        '<li id="bookmark_9" class="bookmark blurb group"><div class="header module">'
+        '<h4 class="heading"><a href="/series/77">A Series</a></h4>'
+        '<p class="datetime">01 Feb 2019</p></div></li>'
+    )
+    return f'<ol class="bookmark index group">{lis}{series_li}</ol>{NO_NEXT_PAGE}'
+
+
+def test_memo_is_shared_between_users(fake_session):
+    pytest.importorskip("bs4")
+    from ao3.users import User
+
+    series_page = f'<ul class="series work index group">{work_blurb("3")}</ul>'
+    series_page += NO_NEXT_PAGE
+
+    session = fake_session(
+        {
+            r"/series/77": series_page,
+            r"/users/alice/bookmarks": bookmarks_page("1", "3"),
+            r"/users/bob/bookmarks": bookmarks_page("2"),
+        }
+    )
+    memo = SeriesMemo()
+    alice = User("alice", session).bookmarks_ids(expand_series=True, series_memo=memo)
+    bob = User("bob", session).bookmarks_ids(expand_series=True, series_memo=memo)
+
+    # The series is only paginated once, and its work isn't repeated.
+    assert alice == ["1", "3"]
+    assert bob == ["2", "3"]
+    assert len([url for url in session.urls if "/series/" in url]) == 1
@@ -0,0 +1,120 @@
+# -*- encoding: utf-8
+"""Tests for ao3.session."""
+
+import pytest
+
+pytest.importorskip("cloudscraper")
+
+import ao3.session
+from ao3 import AO3
+from ao3.adaptive import AdaptiveLimiter
+from ao3.session import Session, default_session
+from ao3.transport import CookieJar, Transport
+from ao3.utils import get_with_timeout
+
+
+class FakeTransport(Transport):
+    """Answers every request with ``response``, and pretends every request
+    after the first went over an open connection."""
+
+    def __init__(self, response):
+        self.response = response
+        self.requests = 0
+        self.cookies = CookieJar()
+        self.headers = {}
+
+    def get(self, url, stream=False, headers=None):
+        self.requests += 1
+        return self.response
+
+    def add_response_hook(self, hook):
+        pass
+
+    def stats(self):
+        return {"connections": min(self.requests, 1), "requests": self.requests}
+
+
+def test_objects_from_one_ao3_share_a_session():
+    pytest.importorskip("bs4")
+    api = AO3()
+    assert isinstance(api.session, Session)
+    assert api.series("1").session is api.session
+    assert api.collection("c").session is api.session
+    assert api.tag("Fluff").session is api.session
+    assert api.author("alice").session is api.session
+    assert api.comments("1").sess is api.session
+    assert AO3().session is not api.session
+
+
+def test_default_session_is_created_once(monkeypatch):
+    pytest.importorskip("bs4")
+    from ao3.comments import Comments
+
+    monkeypatch.setattr(ao3.session, "_default_session", None)
+    session = default_session()
+    assert isinstance(session, Session)
+    assert default_session() is session
+    assert Comments("1").sess is session
+
+
+def test_pools_are_resized():
+    session = Session(pool_connections=3, pool_maxsize=7, pool_block=True)
+    assert session.scraper.adapters
+    for adapter in session.scraper.adapters.values():
+        assert adapter._pool_maxsize == 7
+        assert adapter.poolmanager.connection_pool_kw["maxsize"] == 7
+        assert adapter.poolmanager.connection_pool_kw["block"] is True
+        assert adapter.poolmanager.pools._maxsize == 3
+    session.close()
+
+
+def test_stats(fake_response):
+    session = Session()
+    assert session.stats() == {
+        "requests": 0,
+        "connections": 0,
+        "reused": 0,
+        "coalesced": 0,
+    }
+    session.close()
+
+    session = Session(transport=FakeTransport(fake_response("<html></html>")))
+    for _ in range(3):
+        session.get("https://archiveofourown.org/works/1")
+    assert session.stats() == {
+        "requests": 3,
+        "connections": 1,
+        "reused": 2,
+        "coalesced": 0,
+    }
+
+
+def test_stats_with_a_limiter(fake_response):
+    session = Session(
+        transport=FakeTransport(fake_response("<html></html>")),
+        limiter=AdaptiveLimiter(),
+    )
+    session.get("https://archiveofourown.org/works/1")
+    stats = session.stats()
+    assert stats["requests"] == 1
+    assert stats["limiter"]["requests"] == 1
+    assert stats["limiter"]["in_flight"] == 0
+
+
+def test_logging_in_forgets_shared_responses(fake_response):
+    pytest.importorskip("bs4")
+    transport = FakeTransport(fake_response("<html></html>"))
+    api = AO3(transport=transport, request_interval=0)
+    url = "https://archiveofourown.org/works/1"
+
+    get_with_timeout(api.session, url)
+    get_with_timeout(api.session, url)
+    assert transport.requests == 1
+
+    api.login("alice", "cookie")
+    get_with_timeout(api.session, url)
+    assert transport.requests == 2
+
+    api.session.cookies = CookieJar()
+    get_with_timeout(api.session, url)
+    assert transport.requests == 3
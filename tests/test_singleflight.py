@@ -0,0 +1,113 @@
+# -*- encoding: utf-8
+"""Tests for ao3.singleflight."""
+
+import gc
+import threading
+import time
+import weakref
+
+import pytest
+
+from ao3.singleflight import SingleFlight, normalize_url
+
+
+@pytest.mark.parametrize(
+    "url_a, url_b",
+    [
+        (
+            "https://archiveofourown.org/series/1",
+            "https://archiveofourown.org/series/1?page=1",
+        ),
+        (
+            "https://archiveofourown.org/works?b=2&a=1",
+            "HTTPS://ArchiveOfOurOwn.org/works?a=1&b=2#main",
+        ),
+    ],
+)
+def test_equivalent_urls_normalize_the_same(url_a, url_b):
+    assert normalize_url(url_a) == normalize_url(url_b)
+
+
+def test_page_two_is_not_page_one():
+    assert normalize_url("https://archiveofourown.org/series/1?page=2") != (
+        normalize_url("https://archiveofourown.org/series/1")
+    )
+
+
+def test_concurrent_calls_share_one_result():
+    single_flight = SingleFlight()
+    calls = []
+
+    def slow_fetch():
+        calls.append(1)
+        time.sleep(0.1)
+        return "response"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(single_flight.do("k", slow_fetch)))
+        for _ in range(5)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == ["response"] * 5
+    assert len(calls) == 1
+    assert single_flight.stats() == {"calls": 1, "saved": 4}
+
+
+def test_errors_are_not_reused():
+    single_flight = SingleFlight()
+
+    def fail():
+        raise ValueError("nope")
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            single_flight.do("k", fail)
+    assert single_flight.stats() == {"calls": 2, "saved": 0}
+
+
+def test_clear_forgets_finished_calls():
+    single_flight = SingleFlight()
+    assert single_flight.do("k", lambda: "old") == "old"
+    assert single_flight.do("k", lambda: "new") == "old"
+    single_flight.clear()
+    assert single_flight.do("k", lambda: "new") == "new"
+
+
+def test_clear_during_a_call():
+    single_flight = SingleFlight()
+
+    def fetch():
+        single_flight.clear()
+        return "old"
+
+    assert single_flight.do("k", fetch) == "old"
+    assert single_flight.do("k", lambda: "new") == "new"
+
+
+def test_finished_results_are_let_go_of_after_the_window():
+    class Response(object):
+        pass
+
+    single_flight = SingleFlight(window=0.05)
+    result = weakref.ref(single_flight.do("k", Response))
+    assert single_flight.do("k", Response) is result()
+
+    # Nobody asks again, but the response isn't kept alive.
+    deadline = time.monotonic() + 5
+    while result() is not None and time.monotonic() < deadline:
+        time.sleep(0.01)
+        gc.collect()
+    assert result() is None
+    assert single_flight.do("k", lambda: "new") == "new"
+
+
+def test_results_are_not_kept_without_a_window():
+    single_flight = SingleFlight(window=0)
+    assert single_flight.do("k", lambda: "old") == "old"
+    assert single_flight.do("k", lambda: "new") == "new"
+    assert single_flight.stats() == {"calls": 2, "saved": 0}
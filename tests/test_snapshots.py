@@ -0,0 +1,92 @@
+# -*- encoding: utf-8
+"""Tests for ao3.snapshots."""
+
+import os
+
+import pytest
+
+from ao3.snapshots import SnapshotStore
+
+DAY = 86400
+
+
+def stats(kudos, hits, words=1000):
+    return {"words": words, "comments": 0, "kudos": kudos, "bookmarks": 0, "hits": hits}
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "stats.log")
+
+
+def test_only_changes_are_written(path):
+    store = SnapshotStore(path)
+    assert store.record_many([(1, stats(10, 100)), (2, stats(5, 50))], when=DAY) == 2
+    size = os.path.getsize(path)
+
+    assert (
+        store.record_many([(1, stats(10, 100)), (2, stats(5, 50))], when=2 * DAY) == 0
+    )
+    assert os.path.getsize(path) == size
+
+    assert store.record(1, stats(11, 120), when=3 * DAY)
+    # work ID, elapsed time, bitmask, and the two deltas
+    assert os.path.getsize(path) - size <= 8
+
+
+def test_history_survives_reopening(path):
+    store = SnapshotStore(path)
+    store.record(1, stats(10, 100), when=DAY)
+    store.record(1, stats(9, 150), when=2 * DAY)
+    store.record(1, stats(20, 300), when=3 * DAY)
+    store.close()
+
+    store = SnapshotStore(path)
+    assert [(s.kudos, s.hits) for s in store.history(1)] == [
+        (10, 100),
+        (9, 150),
+        (20, 300),
+    ]
+    assert [s.kudos for s in store.history("1", start=2 * DAY, end=2 * DAY)] == [9]
+    assert store.latest(1).hits == 300
+    assert store.latest(2) is None
+
+
+def test_downsample_keeps_the_last_point_in_each_interval(path):
+    store = SnapshotStore(path)
+    for hour in range(48):
+        store.record(1, stats(hour, hour * 10), when=hour * 3600)
+    assert [s.kudos for s in store.downsample(1, DAY)] == [23, 47]
+
+
+def test_a_half_written_record_is_dropped(path):
+    store = SnapshotStore(path)
+    store.record(1, stats(10, 100), when=DAY)
+    store.close()
+    good_size = os.path.getsize(path)
+    with open(path, "ab") as outfile:
+        outfile.write(b"\x01\x80")
+
+    store = SnapshotStore(path)
+    assert os.path.getsize(path) == good_size
+    assert store.latest(1).kudos == 10
+    store.record(1, stats(12, 100), when=2 * DAY)
+    store.close()
+    assert SnapshotStore(path).latest(1).kudos == 12
+
+
+def test_a_record_cut_short_in_its_deltas_is_dropped(path):
+    store = SnapshotStore(path)
+    store.record(1, stats(10, 100), when=DAY)
+    store.close()
+    good_size = os.path.getsize(path)
+    # A new work (2), five seconds in, with the kudos changed but no delta.
+    with open(path, "ab") as outfile:
+        outfile.write(b"\x02\x05\x04")
+
+    store = SnapshotStore(path)
+    assert os.path.getsize(path) == good_size
+    assert 2 not in store
+    assert store.record(2, stats(3, 30), when=DAY)
+    store.close()
+    assert SnapshotStore(path).latest(2).kudos == 3
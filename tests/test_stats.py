@@ -0,0 +1,108 @@
+# -*- encoding: utf-8
+"""Tests for ao3.stats."""
+
+import datetime
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from ao3.stats import FandomSummary, WorkStatsFrame
+
+
+@pytest.fixture
+def frame():
+    return WorkStatsFrame.from_records(
+        [
+            {
+                "work_id": 1,
+                "words": "60,000",
+                "kudos": 1500,
+                "hits": 3000,
+                "updated": "2020-01-01",
+                "fandoms": ["Star Wars"],
+            },
+            {
+                "work_id": 2,
+                "words": 10000,
+                "kudos": 5000,
+                "hits": 0,
+                "updated": "03 Jan 2021",
+                "fandoms": ["Star Wars", "Star Trek"],
+            },
+            {
+                "work_id": 3,
+                "words": 90000,
+                "kudos": 2000,
+                "hits": 4000,
+                "fandoms": ["Star Trek"],
+            },
+        ]
+    )
+
+
+def test_columns_are_typed_arrays(frame):
+    assert frame["words"].dtype == np.int64
+    assert list(frame["words"]) == [60000, 10000, 90000]
+    assert frame["updated"][1] == np.datetime64("2021-01-03")
+    assert np.isnat(frame["updated"][2])
+
+
+def test_where_filters_ranges_and_fandoms(frame):
+    assert list(frame.where(words=(50000, None))["work_id"]) == [1, 3]
+    assert list(frame.where(fandom="Star Trek", kudos=(None, 4000))["work_id"]) == [3]
+    assert list(frame.where(updated=(datetime.date(2020, 6, 1), None))["work_id"]) == [
+        2
+    ]
+    assert len(frame.where(fandom="Doctor Who")) == 0
+
+
+def test_aggregates(frame):
+    ratio = frame.ratio("kudos", "hits")
+    assert ratio[0] == 0.5
+    assert np.isnan(ratio[1])
+    assert frame.percentiles("words", q=(50,)) == {50: 60000.0}
+    assert frame.group_by_fandom("kudos") == [
+        FandomSummary("Star Wars", 2, 6500, 3250.0),
+        FandomSummary("Star Trek", 2, 7000, 3500.0),
+    ]
+
+
+def test_group_by_fandom_after_filter(frame):
+    assert frame.where(words=(50000, None)).group_by_fandom("kudos") == [
+        FandomSummary("Star Wars", 1, 1500, 1500.0),
+        FandomSummary("Star Trek", 1, 2000, 2000.0),
+    ]
+
+
+def test_from_works_json():
+    frame = WorkStatsFrame.from_works(
+        [
+            {
+                "id": "7",
+                "fandoms": ["Star Wars"],
+                "stats": {
+                    "published": "2019-01-01",
+                    "completed": "2019-02-01",
+                    "words": 100,
+                    "comments": 1,
+                    "kudos": 2,
+                    "bookmarks": 3,
+                    "hits": 4,
+                },
+            }
+        ]
+    )
+    assert list(frame["work_id"]) == [7]
+    assert frame["updated"][0] == np.datetime64("2019-02-01")
+
+
+def test_to_arrow(frame):
+    pytest.importorskip("pyarrow")
+    table = frame.to_arrow()
+    assert table.column("kudos").to_pylist() == [1500, 5000, 2000]
+    assert table.column("fandoms").to_pylist() == [
+        ["Star Wars"],
+        ["Star Wars", "Star Trek"],
+        ["Star Trek"],
+    ]
@@ -0,0 +1,109 @@
+# -*- encoding: utf-8
+"""Tests for ao3.store."""
+
+import pytest
+
+from ao3.store import WorkStore
+
+
+def record(work_id, fandoms, words, kudos, characters=(), published="2020-01-01"):
+    return {
+        "id": work_id,
+        "title": f"Work {work_id}",
+        "author": "alice",
+        "summary": "<p>A summary</p>",
+        "rating": ["General Audiences"],
+        "warnings": [],
+        "category": ["Gen"],
+        "fandoms": list(fandoms),
+        "relationship": [],
+        "characters": list(characters),
+        "additional_tags": ["Fluff"],
+        "language": "English",
+        "collections": "error",
+        "stats": {
+            "published": published,
+            "completed": published,
+            "words": words,
+            "comments": 1,
+            "kudos": kudos,
+            "bookmarks": 2,
+            "hits": 100,
+        },
+    }
+
+
+@pytest.fixture
+def store():
+    store = WorkStore()
+    store.put_many(
+        [
+            record("1", ["Star Wars"], 60000, 1500, characters=["Rey"]),
+            record("2", ["Star Wars", "Star Trek"], 10000, 5000),
+            record("3", ["Star Trek"], 90000, 2000, published="2021-06-01"),
+            record("4", ["Star Wars"], 80000, 10),
+        ]
+    )
+    return store
+
+
+def test_get_round_trips_a_record(store):
+    assert store.get("1") == dict(record("1", ["Star Wars"], 60000, 1500, ["Rey"]), id=1)
+    assert store.get("99") is None
+    assert len(store) == 4
+    assert "3" in store
+
+
+def test_query_by_tags_and_ranges(store):
+    assert store.query(fandoms=["Star Wars"]) == [1, 2, 4]
+    assert store.query(fandoms=["Star Wars", "Star Trek"]) == [2]
+    assert store.query(fandoms=["Star Wars"], words=(50000, None), kudos=(1000, None)) == [1]
+    assert store.query(characters=["Rey"], rating="General Audiences") == [1]
+    assert store.query(published=("2021-01-01", None)) == [3]
+    assert store.query(sort="kudos", ascending=False, limit=2) == [2, 3]
+
+
+def test_put_replaces_a_works_tags_and_stats(store):
+    store.put(record("1", ["Star Trek"], 60000, 1600))
+    assert store.query(fandoms=["Star Wars"]) == [2, 4]
+    assert store.get("1")["stats"]["kudos"] == 1600
+    assert len(store) == 4
+
+
+def test_put_many_keeps_the_works_read_before_an_error(store):
+    def works():
+        yield record("5", ["Doctor Who"], 1000, 1)
+        raise RuntimeError("crawl failed")
+
+    with pytest.raises(RuntimeError):
+        store.put_many(works())
+    assert "5" in store
+    assert store.query(fandoms=["Doctor Who"]) == [5]
+
+
+def test_a_batch_that_fails_is_rolled_back(store):
+    bad = record("6", ["Doctor Who"], 1000, 1)
+    del bad["id"]
+    with pytest.raises(KeyError):
+        store.put_many([record("5", ["Doctor Who"], 1000, 1), bad])
+    assert "5" not in store
+    assert store.query(fandoms=["Doctor Who"]) == []
+
+    store.put(record("6", ["Doctor Who"], 1000, 1))
+    assert store.query(fandoms=["Doctor Who"]) == [6]
+
+
+def test_put_many_does_not_hold_the_store_while_reading_works(store):
+    def works():
+        for work_id in ["5", "6", "7"]:
+            # e.g. another thread reading the store while this one crawls
+            assert store.get("1")["id"] == 1
+            yield record(work_id, ["Doctor Who"], 1000, 1)
+
+    assert store.put_many(works(), batch_size=2) == 3
+    assert store.query(fandoms=["Doctor Who"]) == [5, 6, 7]
+
+
+def test_cannot_sort_by_unknown_column(store):
+    with pytest.raises(ValueError):
+        store.query(sort="summary; DROP TABLE works")
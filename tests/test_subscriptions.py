@@ -0,0 +1,137 @@
+# -*- encoding: utf-8
+"""Tests for ao3.subscriptions."""
+
+
+import pytest
+
+pytest.importorskip("bs4")
+
+from ao3.subscriptions import SubscriptionChange, SubscriptionMonitor
+from ao3.users import User
+from ao3.utils import TYPE_SERIES, TYPE_WORKS
+
+LAST_PAGE = '<ol class="pagination"><li class="next"><span class="disabled">Next</span></li></ol>'
+
+
+def subscriptions_page(entries):
+    dts = "".join(
+        f'<dt><a href="{href}">{title}</a> by '
+        f'<a rel="author" href="/users/{author}/pseuds/{author}">{author}</a></dt>'
+        f"<dd>Unsubscribe</dd>"
+        for href, title, author in entries
+    )
+    return f'<dl class="subscription index group">{dts}</dl>{LAST_PAGE}'
+
+
+def works_page(works):
+    lis = "".join(
+        f'<li id="work_{work_id}" class="work blurb group">'
+        f'<div class="header module"><p class="datetime">{date}</p></div>'
+        f'<dl class="stats"><dd class="chapters"><a href="#">{chapters}</a>/?</dd></dl>'
+        f"</li>"
+        for work_id, date, chapters in works
+    )
+    return f'<ol class="work index group">{lis}</ol>{LAST_PAGE}'
+
+
+def series_listing(series):
+    lis = "".join(
+        f'<li id="series_{series_id}" class="series blurb group">'
+        f'<div class="header module"><h4 class="heading">'
+        f'<a href="/series/{series_id}">A Series</a></h4>'
+        f'<p class="datetime">{date}</p></div>'
+        f'<dl class="stats"><dt>Works:</dt><dd class="works">'
+        f'<a href="/series/{series_id}">{works}</a></dd></dl>'
+        f"</li>"
+        for series_id, date, works in series
+    )
+    return f'<ul class="series index group">{lis}</ul>{LAST_PAGE}'
+
+
+def series_page(updated, works):
+    return (
+        '<h2 class="heading">A Series</h2>'
+        f'<dl class="series meta group"><dt>Series Updated:</dt><dd>{updated}</dd>'
+        f"<dt>Works:</dt><dd>{works}</dd></dl>{LAST_PAGE}"
+    )
+
+
+@pytest.fixture
+def pages():
+    return {
+        r"subscriptions\?type=works": subscriptions_page(
+            [("/works/1", "One", "alice"), ("/works/2", "Two", "alice")]
+        ),
+        r"subscriptions\?type=series": subscriptions_page(
+            [("/series/7", "Seven", "bob")]
+        ),
+        r"/users/alice/works": works_page(
+            [("1", "03 Jan 2020", 3), ("2", "01 Jan 2020", 1)]
+        ),
+        r"/users/bob/series": series_listing([("7", "02 Jan 2020", 4)]),
+    }
+
+
+def test_first_check_records_a_baseline(pages, tmp_path, fake_session):
+    session = fake_session(pages)
+    state_path = str(tmp_path / "subs.json")
+    monitor = SubscriptionMonitor(User("me", session), state_path)
+
+    assert monitor.check() == []
+    assert monitor.state[TYPE_WORKS]["1"] == {"updated": "2020-01-03", "chapters": 3}
+    assert monitor.state[TYPE_SERIES]["7"] == {"updated": "2020-01-02", "works": 4}
+
+    # One request for each list of subscriptions, one for alice's works
+    # and one for bob's series: not one per work or series.
+    assert len(session.urls) == 4
+
+
+def test_reports_only_changed_subscriptions(pages, tmp_path, fake_session):
+    state_path = str(tmp_path / "subs.json")
+    SubscriptionMonitor(User("me", fake_session(pages)), state_path).check()
+
+    pages[r"/users/alice/works"] = works_page(
+        [("1", "05 Jan 2020", 4), ("2", "01 Jan 2020", 1)]
+    )
+    pages[r"/users/bob/series"] = series_listing([("7", "06 Jan 2020", 5)])
+    changes = SubscriptionMonitor(User("me", fake_session(pages)), state_path).check()
+
+    assert changes == [
+        SubscriptionChange(
+            TYPE_WORKS,
+            "1",
+            "One",
+            {"updated": "2020-01-03", "chapters": 3},
+            {"updated": "2020-01-05", "chapters": 4},
+        ),
+        SubscriptionChange(
+            TYPE_SERIES,
+            "7",
+            "Seven",
+            {"updated": "2020-01-02", "works": 4},
+            {"updated": "2020-01-06", "works": 5},
+        ),
+    ]
+
+
+def test_falls_back_to_navigate_for_works_not_in_listing(pages, fake_session):
+    pages[r"/users/alice/works"] = works_page([("1", "03 Jan 2020", 3)])
+    pages[r"/works/2/navigate"] = (
+        '<ol class="chapter index group">'
+        '<li><a href="#">1. A</a> <span class="datetime">(2019-12-01)</span></li>'
+        '<li><a href="#">2. B</a> <span class="datetime">(2019-12-08)</span></li>'
+        "</ol>"
+    )
+    monitor = SubscriptionMonitor(User("me", fake_session(pages)))
+    monitor.check(types=(TYPE_WORKS,))
+
+    assert monitor.state[TYPE_WORKS]["2"] == {"updated": "2019-12-08", "chapters": 2}
+
+
+def test_falls_back_to_the_series_page_for_series_not_in_listing(pages, fake_session):
+    pages[r"/users/bob/series"] = series_listing([("8", "06 Jan 2020", 2)])
+    pages[r"/series/7"] = series_page("2020-01-02", 4)
+    monitor = SubscriptionMonitor(User("me", fake_session(pages)))
+    monitor.check(types=(TYPE_SERIES,))
+
+    assert monitor.state[TYPE_SERIES] == {"7": {"updated": "2020-01-02", "works": 4}}
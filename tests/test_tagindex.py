@@ -0,0 +1,80 @@
+# -*- encoding: utf-8
+"""Tests for ao3.tagindex and ao3.varint."""
+
+import pytest
+
+from ao3 import varint
+from ao3.tagindex import TagIndex
+
+
+@pytest.fixture
+def index():
+    index = TagIndex()
+    index.add(1, ["Star Wars", "Rey", "Finn/Rey", "Fluff"])
+    index.add(2, ["Star Wars", "Rey", "Finn/Rey", "Major Character Death"])
+    index.add(3, ["Star Wars", "Finn", "Fluff"])
+    index.add(4, ["Star Trek", "Fluff"])
+    return index
+
+
+def test_varint_deltas_round_trip():
+    out = bytearray()
+    varint.encode(300, out)
+    varint.encode_deltas([1, 5, 1000000, 1000001], out)
+    assert out[:2] == b"\xac\x02"
+
+    value, pos = varint.decode(out, 0)
+    values, pos = varint.decode_deltas(out, pos)
+    assert (value, values, pos) == (300, [1, 5, 1000000, 1000001], len(out))
+
+
+def test_query_set_algebra(index):
+    assert index.query(all_of=["Rey", "Finn/Rey"]) == [1, 2]
+    assert index.query(all_of=["Rey"], none_of=["Major Character Death"]) == [1]
+    assert index.query(any_of=["Star Trek", "Finn"]) == [3, 4]
+    assert index.query(none_of=["Star Wars"]) == [4]
+    assert index.query(all_of=["Fluff"], any_of=["Rey", "Star Trek"]) == [1, 4]
+    assert index.query(all_of=["Not A Tag"]) == []
+    assert index.count(all_of=["Fluff"]) == 3
+    assert index.count(all_of=["Star Wars"], none_of=["Fluff"]) == 1
+
+
+def test_co_occurring_tags(index):
+    assert index.co_occurring(all_of=["Star Wars"], top=2) == [
+        ("Rey", 2),
+        ("Finn/Rey", 2),
+    ]
+
+
+def test_add_replaces_a_works_tags(index):
+    index.add(3, ["Star Trek"])
+    assert index.query(all_of=["Star Wars"]) == [1, 2]
+    assert index.query(all_of=["Star Trek"]) == [3, 4]
+    assert len(index) == 4
+
+
+def test_save_and_load(index, tmp_path):
+    path = str(tmp_path / "tags.idx")
+    index.save(path)
+    loaded = TagIndex.load(path)
+
+    assert len(loaded) == 4
+    assert loaded.tags == index.tags
+    assert loaded.query(all_of=["Fluff"], none_of=["Star Trek"]) == [1, 3]
+    assert loaded.co_occurring(all_of=["Rey"]) == index.co_occurring(all_of=["Rey"])
+
+
+def test_add_blurb():
+    bs4 = pytest.importorskip("bs4")
+    soup = bs4.BeautifulSoup(
+        '<li id="work_7" class="work blurb group">'
+        '<h4 class="heading"><a href="/works/7">Title</a> by <a rel="author">x</a></h4>'
+        '<h5 class="fandoms heading"><a class="tag" href="#">Star Wars</a></h5>'
+        '<span class="rating-teen rating" title="Teen And Up Audiences"></span>'
+        '<ul class="tags commas"><li class="characters"><a class="tag" href="#">Rey</a></li></ul>'
+        "</li>",
+        "html.parser",
+    )
+    index = TagIndex()
+    index.add_blurb(soup.li)
+    assert index.query(all_of=["Star Wars", "Rey", "Teen And Up Audiences"]) == [7]
@@ -0,0 +1,134 @@
+# -*- encoding: utf-8
+"""Tests for ao3.tags."""
+
+from datetime import datetime, timezone
+
+import pytest
+
+from ao3.tags import FeedState, Tag, parse_feed, tag_url_name
+
+
+def entry(work_id, updated, title="A Work"):
+    return f"""
+  <entry>
+    <id>tag:archiveofourown.org,2005:Work/{work_id}</id>
+    <published>2020-01-01T12:00:00Z</published>
+    <updated>{updated}</updated>
+    <title>{title}</title>
+    <author><name>alice</name></author>
+    <author><name>bob</name></author>
+    <link rel="alternate" type="text/html" href="https://archiveofourown.org/works/{work_id}"/>
+  </entry>"""
+
+
+def feed(*entries):
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<feed xmlns="http://www.w3.org/2005/Atom">'
+        "<id>tag:archiveofourown.org,2005:/tags/123/feed</id>"
+        "<title>AO3 works tagged 'Fluff'</title>"
+        f"{''.join(entries)}</feed>"
+    )
+
+
+def test_parse_feed():
+    text = feed(
+        entry("20", "2020-01-03T08:30:00Z", title="Newer"),
+        "<entry><id>tag:archiveofourown.org,2005:Series/5</id></entry>",
+        entry("10", "2020-01-02T00:00:00Z"),
+    )
+    entries = parse_feed(text)
+    assert [e.work_id for e in entries] == ["20", "10"]
+    assert entries[0].title == "Newer"
+    assert entries[0].author == ["alice", "bob"]
+    assert entries[0].published == datetime(2020, 1, 1, 12, tzinfo=timezone.utc)
+    assert entries[0].updated == datetime(2020, 1, 3, 8, 30, tzinfo=timezone.utc)
+    assert entries[0].url == "https://archiveofourown.org/works/20"
+    assert parse_feed(feed()) == []
+
+
+@pytest.mark.parametrize(
+    "name, url_name",
+    [
+        ("Fluff", "Fluff"),
+        ("Harry Potter/Draco Malfoy", "Harry%20Potter*s*Draco%20Malfoy"),
+        ("Q&A", "Q*a*A"),
+        ("Dr. Who?", "Dr*d*%20Who*q*"),
+        ("#1", "*h*1"),
+    ],
+)
+def test_tag_url_name(name, url_name):
+    assert tag_url_name(name) == url_name
+
+
+def test_feed_state_persists(tmp_path):
+    path = str(tmp_path / "feeds.json")
+    state = FeedState(path)
+    assert state.get("Fluff") == {}
+    state.update("Fluff", feed_id="123", last_work_id=10)
+    state.update("Fluff", last_work_id=20)
+    state.save()
+
+    assert FeedState(path).get("Fluff") == {"feed_id": "123", "last_work_id": 20}
+    # What get() returns is a copy.
+    FeedState(path).get("Fluff")["feed_id"] = "456"
+    assert FeedState(path).get("Fluff")["feed_id"] == "123"
+
+
+def test_new_works_stop_at_the_last_seen_entry(fake_session):
+    feeds = [
+        feed(entry("20", "2020-01-03T00:00:00Z"), entry("10", "2020-01-02T00:00:00Z")),
+        feed(
+            entry("30", "2020-01-05T00:00:00Z"),
+            entry("20", "2020-01-03T00:00:00Z"),
+            entry("10", "2020-01-02T00:00:00Z"),
+        ),
+        feed(
+            entry("10", "2020-01-06T00:00:00Z"),
+            entry("30", "2020-01-05T00:00:00Z"),
+            entry("20", "2020-01-03T00:00:00Z"),
+        ),
+        feed(entry("10", "2020-01-06T00:00:00Z")),
+    ]
+    session = fake_session({r"/tags/123/feed\.atom$": lambda url: feeds.pop(0)})
+    state = FeedState()
+    tag = Tag("Fluff", session, feed_id="123")
+
+    assert [e.work_id for e in tag.new_works(state)] == ["20", "10"]
+    assert [e.work_id for e in tag.new_works(state)] == ["30"]
+    # An old work that's been updated counts as new again.
+    assert [e.work_id for e in tag.new_works(state)] == ["10"]
+    assert tag.new_works(state) == []
+    assert state.get("Fluff") == {
+        "feed_id": "123",
+        "last_work_id": 30,
+        "last_updated": "2020-01-06T00:00:00+00:00",
+    }
+
+
+def works_page(work_ids, last):
+    lis = "".join(
+        f'<li id="work_{work_id}" class="work blurb group">'
+        '<div class="header module">'
+        f'<h4 class="heading"><a href="/works/{work_id}">T</a></h4>'
+        '<p class="datetime">01 Jan 2020</p></div></li>'
+        for work_id in work_ids
+    )
+    next_button = (
+        '<span class="disabled">Next</span>' if last else '<a href="#">Next</a>'
+    )
+    return (
+        f'<ol class="work index group">{lis}</ol>'
+        f'<ol class="pagination"><li class="next">{next_button}</li></ol>'
+    )
+
+
+def test_work_ids_of_a_multi_word_tag(fake_session):
+    pytest.importorskip("bs4")
+    session = fake_session(
+        {
+            r"/tags/Star%20Wars/works\?page=1$": works_page(["1", "2"], last=False),
+            r"/tags/Star%20Wars/works\?page=2$": works_page(["3"], last=True),
+        }
+    )
+    assert Tag("Star Wars", session).work_ids() == ["1", "2", "3"]
@@ -0,0 +1,135 @@
+# -*- encoding: utf-8
+"""Tests for ao3.transport, and for a Session on an httpx transport."""
+
+import asyncio
+import json
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from ao3.clearance import ClearanceStore
+from ao3.downloads import download
+from ao3.retry import RetryPolicy
+from ao3.session import Session
+from ao3.transport import CookieJar, HttpxTransport
+from ao3.utils import aget_with_timeout, get_with_timeout
+
+AO3_URL = "https://archiveofourown.org"
+
+
+def make_session(handler, **kwargs):
+    transport = HttpxTransport(
+        http2=False,
+        transport=httpx.MockTransport(handler),
+        async_transport=httpx.MockTransport(handler),
+    )
+    return Session(
+        request_interval=0,
+        retry_policy=RetryPolicy(base_delay=0),
+        transport=transport,
+        **kwargs,
+    )
+
+
+def test_cookie_jar_set_and_clear():
+    jar = CookieJar()
+    jar.set("user_credentials", "1", domain="archiveofourown.org")
+    assert [(c.name, c.value, c.domain) for c in jar] == [
+        ("user_credentials", "1", "archiveofourown.org")
+    ]
+    jar.clear("archiveofourown.org", "/", "user_credentials")
+    assert list(jar) == []
+
+
+def test_get_sends_cookies_and_looks_like_requests():
+    def handler(request):
+        return httpx.Response(
+            200,
+            text=f"cookie: {request.headers.get('Cookie')}",
+            headers={"Set-Cookie": "_otwarchive_session=new; Path=/"},
+        )
+
+    session = make_session(handler)
+    session.cookies.set("user_credentials", "1", domain="archiveofourown.org")
+
+    response = get_with_timeout(session, f"{AO3_URL}/works/1")
+    assert response.status_code == 200
+    assert response.reason == "OK"
+    assert response.text == "cookie: user_credentials=1"
+    assert response.url == f"{AO3_URL}/works/1"
+    assert {c.name: c.value for c in session.cookies}["_otwarchive_session"] == "new"
+    assert session.stats()["requests"] == 1
+
+
+def test_cookie_jar_can_be_replaced():
+    def handler(request):
+        return httpx.Response(200, text=f"cookie: {request.headers.get('Cookie')}")
+
+    session = make_session(handler)
+    jar = CookieJar()
+    jar.set("user_credentials", "1", domain="archiveofourown.org")
+    session.cookies = jar
+
+    response = get_with_timeout(session, f"{AO3_URL}/works/1")
+    assert response.text == "cookie: user_credentials=1"
+    session.cookies.set("_otwarchive_session", "abc", domain="archiveofourown.org")
+    response = asyncio.run(aget_with_timeout(session, f"{AO3_URL}/works/2"))
+    assert "_otwarchive_session=abc" in response.text
+
+
+def test_errors_are_raised():
+    session = make_session(lambda request: httpx.Response(404))
+    with pytest.raises(RuntimeError, match="404"):
+        get_with_timeout(session, f"{AO3_URL}/works/1")
+
+
+def test_streamed_download_resumes(tmp_path):
+    body = bytes(range(256)) * 100
+    ranges = []
+
+    def handler(request):
+        ranges.append(request.headers.get("Range"))
+        if "Range" in request.headers:
+            start = int(request.headers["Range"].split("=")[1].rstrip("-"))
+            return httpx.Response(206, content=body[start:])
+        return httpx.Response(200, content=body)
+
+    path = str(tmp_path / "1.epub")
+    with open(path + ".part", "wb") as outfile:
+        outfile.write(body[:1000])
+    with open(path + ".ao3.json", "w") as outfile:
+        json.dump({"url": f"{AO3_URL}/downloads/1/T.epub", "complete": False}, outfile)
+
+    result = download(make_session(handler), f"{AO3_URL}/downloads/1/T.epub", path)
+    assert ranges == ["bytes=1000-"]
+    assert result.size == len(body)
+    with open(path, "rb") as infile:
+        assert infile.read() == body
+
+
+def test_aget_retries_without_blocking():
+    responses = [httpx.Response(503), httpx.Response(200, text="Hello")]
+
+    def handler(request):
+        return responses.pop(0)
+
+    session = make_session(handler)
+    response = asyncio.run(aget_with_timeout(session, f"{AO3_URL}/works/1"))
+    assert response.text == "Hello"
+    assert session.stats()["requests"] == 2
+
+
+def test_clearance_is_saved_from_responses(tmp_path):
+    def handler(request):
+        return httpx.Response(
+            200, headers={"Set-Cookie": "cf_clearance=abc; Domain=archiveofourown.org"}
+        )
+
+    store = ClearanceStore(str(tmp_path / "clearance.json"))
+    session = make_session(handler, clearance_store=store)
+    get_with_timeout(session, f"{AO3_URL}/works/1")
+
+    with open(store.path) as infile:
+        saved = json.load(infile)
+    assert saved["archiveofourown.org"]["cookies"] == {"cf_clearance": "abc"}
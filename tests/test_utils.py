@@ -1,6 +1,8 @@
 # -*- encoding: utf-8
 """Tests for ao3.utils."""
 
+import time
+
 import pytest
 
 from ao3 import utils
@@ -33,3 +35,32 @@ def test_work_id_from_bad_url_raises_runtimeerror(bad_url):
     with pytest.raises(RuntimeError) as exc:
         utils.work_id_from_url(bad_url)
     assert "not a recognised AO3 work URL" in str(exc)
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("https://example.org/works", "https://example.org/works?page=2"),
+        ("https://example.org/works?a=1", "https://example.org/works?a=1&page=2"),
+        ("https://example.org/gifts?page=%d", "https://example.org/gifts?page=2"),
+        (
+            "https://example.org/tags/Star%20Wars/works",
+            "https://example.org/tags/Star%20Wars/works?page=2",
+        ),
+        (
+            "https://example.org/works/search?work_search%5Bquery%5D=a%20b",
+            "https://example.org/works/search?work_search%5Bquery%5D=a%20b&page=2",
+        ),
+    ],
+)
+def test_page_url(url, expected):
+    assert utils.page_url(url, 2) == expected
+
+
+def test_rate_limiter_spaces_out_requests():
+    """Consecutive waits on a RateLimiter are at least ``interval`` apart."""
+    limiter = utils.RateLimiter(interval=0.05)
+    start = time.monotonic()
+    for _ in range(3):
+        limiter.wait()
+    assert time.monotonic() - start >= 0.1
@@ -0,0 +1,138 @@
+# -*- encoding: utf-8
+"""Tests for ao3.works."""
+
+import datetime
+import gc
+import weakref
+
+import pytest
+
+pytest.importorskip("bs4")
+
+from ao3.works import RestrictedWork, Work, chapter_index
+
+WORK_PAGE = """
+<html><body>
+<dl class="work meta group">
+  <dd class="rating tags"><ul class="commas"><li><a class="tag">General Audiences</a></li></ul></dd>
+  <dd class="warning tags"><ul class="commas"><li><a class="tag">No Archive Warnings Apply</a></li></ul></dd>
+  <dd class="category tags"><ul class="commas"><li><a class="tag">Gen</a></li></ul></dd>
+  <dd class="fandom tags"><ul class="commas"><li><a class="tag">Star Wars</a></li></ul></dd>
+  <dd class="relationship tags"><ul class="commas"><li><a class="tag">Finn/Rey</a></li></ul></dd>
+  <dd class="character tags"><ul class="commas"><li><a class="tag">Rey</a></li><li><a class="tag">Finn</a></li></ul></dd>
+  <dd class="freeform tags"><ul class="commas"><li><a class="tag">Fluff</a></li></ul></dd>
+  <dd class="language">
+    English
+  </dd>
+  <dd class="stats"><dl class="stats">
+    <dd class="published">2020-01-01</dd>
+    <dd class="status">2020-02-01</dd>
+    <dd class="words">1234</dd>
+    <dd class="chapters"><a href="/works/1/chapters/3">3</a>/5</dd>
+    <dd class="comments">5</dd>
+    <dd class="kudos">2</dd>
+    <dd class="bookmarks"><a href="/works/1/bookmarks">3</a></dd>
+    <dd class="hits">100</dd>
+  </dl></dd>
+</dl>
+<h2 class="title heading">  A Title </h2>
+<h3 class="byline heading"><a rel="author" href="/users/alice">alice</a></h3>
+<div id="kudos"><p class="kudos">
+  <a href="/users/bob">bob</a> <a href="/users/carol">carol</a>
+</p></div>
+<div id="chapters">%s</div>
+</body></html>
+"""
+
+
+@pytest.mark.parametrize("retain", [True, False])
+def test_properties(retain):
+    work = Work.from_html("1", WORK_PAGE % "", retain=retain)
+    assert work.title == "A Title"
+    assert work.author == "alice"
+    assert work.warnings == []
+    assert work.characters == ["Rey", "Finn"]
+    assert work.language == "English"
+    assert work.published == datetime.date(2020, 1, 1)
+    assert work.completed == datetime.date(2020, 2, 1)
+    assert (work.words, work.kudos, work.bookmarks, work.hits) == (1234, 2, 3, 100)
+    assert work.chapters == "3/5"
+    assert list(work.kudos_left_by) == ["bob", "carol"]
+
+
+def test_compact_work_releases_the_page():
+    work = Work.from_html("1", WORK_PAGE % "")
+    assert work._soup is None
+    assert work._html is None
+    assert type(work.characters[0]) is str
+
+
+def test_compact_work_keeps_nothing_from_the_parse_tree():
+    retained = Work.from_html("1", WORK_PAGE % "", retain=True)
+    soup = weakref.ref(retained._soup)
+    retained.release()
+    gc.collect()
+    assert soup() is None
+
+
+def test_missing_values_raise_when_read():
+    # This page has no summary.
+    work = Work.from_html("1", WORK_PAGE % "")
+    with pytest.raises(AttributeError):
+        work.summary
+    assert work.title == "A Title"
+
+
+NAVIGATE_PAGE = """
+<ol class="chapter index group" role="navigation">
+  <li><a href="/works/1/chapters/10">1. Beginnings</a>
+      <span class="datetime">(2020-01-01)</span></li>
+  <li><a href="/works/1/chapters/20">2. Chapter 2</a>
+      <span class="datetime">(2020-02-01)</span></li>
+</ol>
+"""
+
+CHAPTER_PAGE = """
+<div id="chapters" role="article"><div class="chapter" id="chapter-2">
+  <div class="chapter preface group">
+    <h3 class="title"><a href="/works/1/chapters/20">Chapter 2</a></h3>
+    <div id="summary" class="summary module"><h3 class="heading">Summary:</h3>
+      <blockquote class="userstuff"><p>Things happen.</p></blockquote></div>
+  </div>
+  <div class="userstuff module" role="article">
+    <h3 class="landmark heading" id="work">Chapter Text</h3>
+    <p>It was a dark and stormy night.</p>
+  </div>
+</div></div>
+"""
+
+
+def test_chapter_index_only_fetches_the_chapters_you_read(fake_session):
+    sess = fake_session(
+        {
+            r"/works/1/navigate$": NAVIGATE_PAGE,
+            r"/works/1/chapters/20\?view_adult=true$": CHAPTER_PAGE,
+        }
+    )
+    chapters = chapter_index("1", sess)
+    assert [(c.number, c.id, c.title) for c in chapters] == [
+        (1, "10", "Beginnings"),
+        (2, "20", "Chapter 2"),
+    ]
+    assert chapters[1].published == datetime.date(2020, 2, 1)
+    assert len(sess.urls) == 1
+
+    assert chapters[1].content == "<p>It was a dark and stormy night.</p>"
+    assert chapters[1].summary == "<p>Things happen.</p>"
+    assert chapters[1].notes is None
+    assert len(sess.urls) == 2
+
+
+def test_chapter_index_of_restricted_work(fake_session):
+    sess = fake_session(
+        {
+            r"/works/1/navigate$": "This work is only available to registered users"
+        }
+    )
+    with pytest.raises(RestrictedWork):
+        chapter_index("1", sess)